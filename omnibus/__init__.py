@@ -1,2 +1,3 @@
-from .omnibus import Sender, Receiver, Message
-from . import util
+from .omnibus import Sender, Receiver, Message, BufferedReceiver, DropPolicy
+from .subscription import Exact
+from . import util, wire
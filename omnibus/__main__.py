@@ -1,3 +1,63 @@
-from .server import server
+import argparse
 
-server()
+from .bridge import BATCH_INTERVAL, bridge
+from .compression import names
+from .latency import view as latency_view
+from .lvc import LVC_BYTES, LVC_DEPTH
+from .server import SHARD_PORT_STEP, SINK_PORT, SOURCE_PORT, server
+from .stats import view
+
+parser = argparse.ArgumentParser(prog="python -m omnibus")
+parser.add_argument('command', nargs='?', default='server',
+                    choices=['server', 'stats', 'latency', 'bridge'],
+                    help='run the server (default), display live traffic statistics from it, '
+                         'display the latency of messages, or bridge two servers')
+parser.add_argument('servers', nargs='*', metavar='server',
+                    help='bridge: the two servers to bridge, as name=ip or '
+                         'name=ip:source_port:sink_port[:shards]')
+parser.add_argument('--lvc-depth', type=int, default=LVC_DEPTH,
+                    help='messages per channel replayed to new sinks, 0 to disable '
+                         f'(default: {LVC_DEPTH})')
+parser.add_argument('--lvc-bytes', type=int, default=LVC_BYTES,
+                    help=f'maximum total size of the replay cache (default: {LVC_BYTES})')
+parser.add_argument('--source-port', type=int, default=SOURCE_PORT,
+                    help=f'port sources connect to (default: {SOURCE_PORT})')
+parser.add_argument('--sink-port', type=int, default=SINK_PORT,
+                    help=f'port sinks connect to (default: {SINK_PORT})')
+parser.add_argument('--shards', type=int, default=1,
+                    help='number of processes to spread channels across, each using the ports '
+                         f'{SHARD_PORT_STEP} above the last (default: 1)')
+parser.add_argument('--stamp', action='store_true',
+                    help='stamp messages with when they pass through the server, so latency '
+                         'can be split into its parts')
+parser.add_argument('--hwm', type=int,
+                    help='messages queued for each source and sink before more are dropped '
+                         "(default: ZeroMQ's, 1000)")
+parser.add_argument('--channels', nargs='+', default=[''], metavar='PREFIX',
+                    help='latency: channel prefixes to measure (default: all)')
+parser.add_argument('--forward', nargs='+', default=[], metavar='PREFIX',
+                    help='bridge: channel prefixes to forward from the first server to the second')
+parser.add_argument('--backward', nargs='+', default=[], metavar='PREFIX',
+                    help='bridge: channel prefixes to forward from the second server to the first')
+parser.add_argument('--compress', choices=names(),
+                    help='bridge: compress messages with this codec before forwarding them')
+parser.add_argument('--batch-interval', type=float, default=BATCH_INTERVAL,
+                    help=f'bridge: seconds to batch messages for (default: {BATCH_INTERVAL})')
+args = parser.parse_args()
+
+if args.command != 'bridge' and args.servers:
+    parser.error(f"unrecognized arguments: {' '.join(args.servers)}")
+
+if args.command == 'stats':
+    view()
+elif args.command == 'latency':
+    latency_view(args.channels)
+elif args.command == 'bridge':
+    if len(args.servers) != 2:
+        parser.error("bridge needs exactly two servers")
+    bridge(*args.servers, args.forward, args.backward, args.compress, args.batch_interval)
+else:
+    if args.shards < 1:
+        parser.error("--shards must be at least 1")
+    server(args.lvc_depth, args.lvc_bytes, args.source_port, args.sink_port, args.shards,
+           args.stamp, args.hwm)
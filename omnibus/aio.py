@@ -0,0 +1,126 @@
+"""
+asyncio versions of Sender and Receiver.
+
+These share server discovery and the wire format with their blocking
+counterparts, but waiting for messages suspends the calling coroutine instead
+of blocking the thread, so a single process can handle many receivers and
+other I/O at once:
+
+    async for message in AsyncReceiver("DAQ"):
+        ...
+"""
+
+import time
+import typing
+
+import zmq
+import zmq.asyncio
+
+from .omnibus import Message, OmnibusCommunicator, Receiver, Sender
+
+
+class AsyncCommunicator(OmnibusCommunicator):
+    """
+    Creates sockets on an asyncio context sharing the blocking context's I/O threads.
+    """
+    async_context = None
+
+    def _socket(self, socket_type):
+        if self.async_context is None:
+            AsyncCommunicator.async_context = zmq.asyncio.Context.shadow(self.context)
+        return self.async_context.socket(socket_type)
+
+    def _blocking(self, sock):
+        return zmq.Socket.shadow(sock.underlying)
+
+
+class AsyncSender(AsyncCommunicator, Sender):
+    """
+    Sender whose send methods are coroutines.
+    """
+
+    async def send_message(self, message: Message):
+        """
+        Send a built message object to all receivers.
+        """
+        if self._wanted(message.channel):
+            frames = self._encode(message)
+            await self._publisher(frames[0]).send_multipart(frames)
+
+    async def send(self, channel: str, payload):
+        """
+        Wrap a payload in a message object and send it on a provided channel.
+        """
+        if self._wanted(channel):
+            await self.send_message(Message(channel, time.time(), payload))
+
+    async def send_many(self, messages: typing.Iterable[Message]):
+        """
+        Send a number of built message objects to all receivers, batched by channel.
+        """
+        for frames in self._encode_many(messages):
+            await self._publisher(frames[0]).send_multipart(frames)
+
+
+class AsyncReceiver(AsyncCommunicator, Receiver):
+    """
+    Receiver whose receive methods are coroutines. Iterating over it with
+    `async for` yields messages as they arrive.
+    """
+
+    async def _recv_messages(self):
+        return self._decode(await self.subscriber.recv_multipart())
+
+    async def recv_message(self, timeout=None):
+        """
+        Receive one message from a sender.
+
+        If timeout is None this waits until a message is received. Otherwise it
+        waits for timeout milliseconds to receive a message and returns None.
+        """
+
+        if await self._fill(timeout):
+            return self.pending.popleft()
+        return None
+
+    async def _fill(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout / 1000
+        while not self.pending:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0) * 1000
+            if not await self.subscriber.poll(remaining):
+                return False
+            self.pending.extend(await self._recv_messages())
+        return True
+
+    async def recv_batch(self, max_n, timeout=None):
+        """
+        Receive up to max_n messages from senders, waiting for the first one in
+        the same way as recv_message.
+        """
+
+        batch = []
+        if not await self._fill(timeout):
+            return batch
+        while len(batch) < max_n:
+            if self.pending:
+                batch.append(self.pending.popleft())
+            elif await self.subscriber.poll(0):
+                self.pending.extend(await self._recv_messages())
+            else:
+                break
+        return batch
+
+    async def recv(self, timeout=None):
+        """
+        Receive the payload of one message from a sender, discarding metadata.
+        """
+
+        if message := await self.recv_message(timeout):
+            return message.payload
+        return None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.recv_message()
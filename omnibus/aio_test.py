@@ -0,0 +1,83 @@
+import asyncio
+import multiprocessing as mp
+
+import pytest
+
+from omnibus import Message, server
+from omnibus.aio import AsyncReceiver, AsyncSender
+from omnibus.omnibus import OmnibusCommunicator
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 5))
+
+
+class TestAsync:
+    @pytest.fixture(autouse=True, scope="class")
+    def server(self):
+        ctx = mp.get_context('spawn')
+        p = ctx.Process(target=server.server)
+        p.start()
+        OmnibusCommunicator.server_ip = "127.0.0.1"  # skip discovery
+
+        async def wait_alive():
+            s = AsyncSender()
+            r = AsyncReceiver("_ALIVE")
+            while await r.recv(1) is None:
+                await s.send("_ALIVE", "_ALIVE")
+        run(wait_alive())
+
+        yield
+
+        p.terminate()
+        p.join()
+
+    async def connected(self, *channels):
+        r = AsyncReceiver(*channels)
+        # let the receiver connect to the server so messages aren't dropped
+        await asyncio.sleep(0.05)
+        return r
+
+    def test_nominal(self):
+        async def _test():
+            s = AsyncSender()
+            r = await self.connected("CHAN")
+            await s.send("CHAN", "A")
+            assert await r.recv(10) == "A"
+            assert await r.recv(10) is None
+        run(_test())
+
+    def test_batch(self):
+        async def _test():
+            s = AsyncSender()
+            r = await self.connected("CHAN")
+            await s.send_many([Message("CHAN", i, i) for i in range(5)])
+            assert [m.payload for m in await r.recv_batch(3, 10)] == [0, 1, 2]
+            assert [m.payload for m in await r.recv_batch(3, 10)] == [3, 4]
+        run(_test())
+
+    def test_iterate(self):
+        async def _test():
+            s = AsyncSender()
+            r = await self.connected("CHAN")
+            for i in range(3):
+                await s.send(f"CHAN{i}", i)
+            res = []
+            async for message in r:
+                res.append((message.channel, message.payload))
+                if len(res) == 3:
+                    break
+            assert res == [("CHAN0", 0), ("CHAN1", 1), ("CHAN2", 2)]
+        run(_test())
+
+    def test_multiplex(self):
+        async def _test():
+            s = AsyncSender()
+            r1 = await self.connected("CHAN1")
+            r2 = await self.connected("CHAN2")
+            # both receivers wait concurrently in one thread
+            res = asyncio.gather(r1.recv(100), r2.recv(100))
+            await s.send("CHAN2", "B")
+            await s.send("CHAN1", "A")
+            assert await res == ["A", "B"]
+        run(_test())
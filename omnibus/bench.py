@@ -0,0 +1,271 @@
+"""
+Benchmarks of the whole bus: a server, senders and receivers, each in their
+own process on this machine, for every combination of the given payload
+sizes, channel counts and numbers of receivers:
+
+    python -m omnibus.bench --sizes 64 4096 --channels 1 8 --receivers 1 4 --json results.json
+
+Each sender sends its messages as fast as it can, spread evenly over the
+channels, and every receiver listens to all of them. Throughput is measured
+from when the senders start to when the last message arrives, and messages
+which never arrive (because a queue filled up) are counted as dropped.
+
+The JSON output can be compared with an earlier run to catch regressions:
+
+    python -m omnibus.bench --baseline old.json
+"""
+
+import argparse
+from dataclasses import asdict, dataclass
+import json
+import multiprocessing as mp
+import platform
+import sys
+import time
+
+from . import latency, release_info, server
+from .omnibus import Receiver, Sender
+
+SOURCE_PORT = 7075  # away from the default ports, so a running server isn't disturbed
+SINK_PORT = 7076
+IDLE_TIMEOUT = 1  # seconds without a message before a receiver gives up on the rest
+START_TIMEOUT = 10  # seconds to wait for processes to be ready
+TOLERANCE = 0.1  # fraction by which a result can be worse than the baseline
+
+
+@dataclass(frozen=True)
+class Scenario:
+    payload_bytes: int
+    channels: int
+    senders: int
+    receivers: int
+    messages: int  # per sender
+
+    def channel_names(self):
+        return [f"BENCH/{i}" for i in range(self.channels)]
+
+
+def _receive(spec, scenario, hwm, ready, start, results):
+    r = Receiver("BENCH/", measure_latency=True, hwm=hwm, server=spec)
+    ready.put(None)
+    start.wait()
+    expected = scenario.senders * scenario.messages
+    received = 0
+    last = None
+    while received < expected:
+        batch = r.recv_batch(1000, IDLE_TIMEOUT * 1000)
+        if not batch:
+            break
+        received += len(batch)
+        last = time.time()
+    # each receiver combines its channels, and the main process combines receivers
+    histograms = {segment: latency.Histogram() for segment in latency.SEGMENTS}
+    for channel in r.latency.channels.values():
+        for segment, histogram in channel.items():
+            histograms[segment].merge(histogram)
+    results.put((received, last, histograms))
+
+
+def _send(spec, scenario, hwm, ready, start, results):
+    s = Sender(hwm=hwm, server=spec)
+    channels = scenario.channel_names()
+    deadline = time.monotonic() + START_TIMEOUT
+    while not all(s.has_subscribers(c) for c in channels) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    payload = bytes(scenario.payload_bytes)
+    ready.put(None)
+    start.wait()
+    began = time.perf_counter()
+    for i in range(scenario.messages):
+        s.send(channels[i % len(channels)], payload)
+    results.put(time.perf_counter() - began)
+    # give ZeroMQ a moment to send what is still queued before the process exits
+    for publisher in s.publishers:
+        publisher.close(linger=IDLE_TIMEOUT * 1000)
+
+
+def _wait(queue, count):
+    for _ in range(count):
+        queue.get(timeout=START_TIMEOUT)
+
+
+def run(scenario, spec, ctx, hwm=None):
+    """
+    Run a scenario against a running server, returning its results.
+    """
+    ready = ctx.Queue()
+    start = ctx.Event()
+    received = ctx.Queue()
+    sent = ctx.Queue()
+    receivers = [ctx.Process(target=_receive, args=(spec, scenario, hwm, ready, start, received))
+                 for _ in range(scenario.receivers)]
+    senders = [ctx.Process(target=_send, args=(spec, scenario, hwm, ready, start, sent))
+               for _ in range(scenario.senders)]
+    for p in receivers:
+        p.start()
+    _wait(ready, len(receivers))
+    for p in senders:
+        p.start()
+    _wait(ready, len(senders))
+
+    began = time.time()
+    start.set()
+    send_times = [sent.get() for _ in senders]
+    results = [received.get() for _ in receivers]
+    for p in receivers + senders:
+        p.join()
+
+    counts = [count for count, _, _ in results]
+    lasts = [last for _, last, _ in results if last is not None]
+    duration = max(max(lasts, default=began) - began, 1e-6)
+    histograms = {segment: latency.Histogram() for segment in latency.SEGMENTS}
+    for _, _, receiver_histograms in results:
+        for segment, histogram in receiver_histograms.items():
+            histograms[segment].merge(histogram)
+
+    total = scenario.senders * scenario.messages
+    delivered = sum(counts) / len(counts)  # per receiver
+    return {
+        **asdict(scenario),
+        "sent": total,
+        "received": sum(counts),
+        "dropped": total * len(counts) - sum(counts),
+        "send_msgs_per_sec": total / max(max(send_times), 1e-6),
+        "msgs_per_sec": delivered / duration,
+        "mb_per_sec": delivered * scenario.payload_bytes / duration / 1e6,
+        "latency": {segment: h.summary() for segment, h in histograms.items() if h.count},
+    }
+
+
+def start_server(ctx, shards=1, stamp=False, hwm=None):
+    """
+    Start a quiet server for benchmarking in other processes, returning them.
+    """
+    processes = []
+    for shard, (source_port, sink_port) in enumerate(
+            server.shard_ports(SOURCE_PORT, SINK_PORT, shards)):
+        # each shard stops when we do
+        processes.append(ctx.Process(target=server._run_shard, daemon=True,
+                                     args=(shard, 0, 0, source_port, sink_port, stamp, hwm)))
+    for p in processes:
+        p.start()
+    return processes
+
+
+def benchmark(scenarios, shards=1, stamp=False, hwm=None):
+    """
+    Run each scenario against a fresh server, returning the results. hwm is
+    the high water mark of every socket, if not ZeroMQ's default.
+    """
+    ctx = mp.get_context('spawn')
+    spec = f"127.0.0.1:{SOURCE_PORT}:{SINK_PORT}:{shards}"
+    results = []
+    for scenario in scenarios:
+        processes = start_server(ctx, shards, stamp, hwm)
+        time.sleep(0.5)  # let the server bind before anything connects
+        try:
+            results.append(run(scenario, spec, ctx, hwm))
+        finally:
+            for p in processes:
+                p.terminate()
+                p.join()
+    return results
+
+
+def compare(baseline, results, tolerance=TOLERANCE):
+    """
+    Return descriptions of the results which are worse than the baseline's
+    for the same scenario by more than tolerance.
+    """
+    def key(result):
+        return tuple(result[field] for field in Scenario.__dataclass_fields__)
+
+    old = {key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        if (before := old.get(key(result))) is None:
+            continue
+        name = fmt_scenario(result)
+        if result["msgs_per_sec"] < before["msgs_per_sec"] * (1 - tolerance):
+            regressions.append(f"{name}: {before['msgs_per_sec']:.0f} -> "
+                               f"{result['msgs_per_sec']:.0f} msgs/s")
+        p99 = result["latency"].get("total", {}).get("p99")
+        old_p99 = before["latency"].get("total", {}).get("p99")
+        if p99 is not None and old_p99 is not None and p99 > old_p99 * (1 + tolerance):
+            regressions.append(f"{name}: p99 latency {old_p99 * 1e3:.2f} -> {p99 * 1e3:.2f} ms")
+        if result["dropped"] > before["dropped"] and result["dropped"] > result["sent"] * tolerance:
+            regressions.append(f"{name}: dropped {before['dropped']} -> {result['dropped']}")
+    return regressions
+
+
+def fmt_scenario(result):
+    return (f"{result['payload_bytes']}B x{result['channels']}ch "
+            f"{result['senders']}->{result['receivers']}")
+
+
+def fmt_results(results):
+    lines = [f"{'scenario':<24} {'msgs/s':>10} {'MB/s':>8} {'send/s':>10} {'dropped':>8} "
+             f"{'p50':>8} {'p99':>8} {'max':>8}"]
+    for r in results:
+        total = r["latency"].get("total", {"p50": 0, "p99": 0, "max": 0})
+        lines.append(f"{fmt_scenario(r):<24} {r['msgs_per_sec']:>10.0f} {r['mb_per_sec']:>8.1f} "
+                     f"{r['send_msgs_per_sec']:>10.0f} {r['dropped']:>8} "
+                     f"{total['p50'] * 1e3:>6.2f}ms {total['p99'] * 1e3:>6.2f}ms "
+                     f"{total['max'] * 1e3:>6.1f}ms")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m omnibus.bench")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[64, 4096, 65536],
+                        metavar='BYTES', help='payload sizes to send')
+    parser.add_argument('--channels', type=int, nargs='+', default=[1, 8],
+                        help='numbers of channels to spread messages over')
+    parser.add_argument('--receivers', type=int, nargs='+', default=[1, 4],
+                        help='numbers of receivers listening to every channel')
+    parser.add_argument('--senders', type=int, default=1, help='number of senders')
+    parser.add_argument('--messages', type=int, default=20000, help='messages sent by each sender')
+    parser.add_argument('--shards', type=int, default=1, help='number of server shards')
+    parser.add_argument('--stamp', action='store_true',
+                        help='have the server stamp messages, to split latency into its parts')
+    parser.add_argument('--hwm', type=int,
+                        help="high water mark of every socket (default: ZeroMQ's, 1000)")
+    parser.add_argument('--json', metavar='PATH', help='write the results to this file')
+    parser.add_argument('--baseline', metavar='PATH',
+                        help='compare against results written by an earlier --json, '
+                             'exiting with an error if any are worse')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='fraction a result can be worse than the baseline '
+                             f'(default: {TOLERANCE})')
+    args = parser.parse_args()
+
+    scenarios = [Scenario(size, channels, args.senders, receivers, args.messages)
+                 for size in args.sizes for channels in args.channels
+                 for receivers in args.receivers]
+    results = benchmark(scenarios, args.shards, args.stamp, args.hwm)
+    print(fmt_results(results))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "version": release_info.version,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "time": time.time(),
+                "shards": args.shards,
+                "stamp": args.stamp,
+                "hwm": args.hwm,
+                "results": results,
+            }, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        if regressions := compare(baseline, results, args.tolerance):
+            print("Regressions:\n" + "\n".join(regressions))
+            sys.exit(1)
+        print("No regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+from omnibus import bench
+
+
+class TestBench:
+    def test_benchmark(self):
+        scenario = bench.Scenario(payload_bytes=16, channels=2, senders=1, receivers=2,
+                                  messages=100)
+        result, = bench.benchmark([scenario])
+        assert result["sent"] == 100
+        assert result["received"] + result["dropped"] == 200
+        assert result["received"] > 0
+        assert result["msgs_per_sec"] > 0
+        assert result["latency"]["total"]["count"] == result["received"]
+
+
+class TestCompare:
+    def result(self, msgs_per_sec, p99, dropped=0):
+        return {"payload_bytes": 16, "channels": 1, "senders": 1, "receivers": 1, "messages": 100,
+                "sent": 100, "dropped": dropped, "msgs_per_sec": msgs_per_sec,
+                "latency": {"total": {"p99": p99}}}
+
+    def test_same(self):
+        assert bench.compare([self.result(1000, 0.01)], [self.result(950, 0.0105)]) == []
+
+    def test_regressions(self):
+        regressions = bench.compare([self.result(1000, 0.01)], [self.result(500, 0.02, 50)])
+        assert len(regressions) == 3
+
+    def test_new_scenario(self):
+        other = {**self.result(1, 1), "channels": 8}
+        assert bench.compare([self.result(1000, 0.01)], [other]) == []
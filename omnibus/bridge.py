@@ -0,0 +1,185 @@
+"""
+Bridges between servers, so that sinks on one machine can receive messages
+sent to a server on another without every one of them connecting across a
+slow link, eg. from the pad to the control room:
+
+    python -m omnibus bridge pad=192.168.0.10 control=192.168.0.20 --forward DAQ --backward RLCS
+
+Only channels starting with the given prefixes are forwarded, and only while
+a sink on the other side is subscribed to them. Messages are batched for
+batch_interval seconds and optionally compressed before being forwarded.
+
+Each message carries its route, the names of the servers it has been
+forwarded from, and is never forwarded to a server on its route, so servers
+can be bridged in any topology without messages going round in loops as long
+as each server is given the same name by every bridge. The server's own
+channels (see subscription.RESERVED) aren't forwarded. Compression only
+applies to the direction the bridge sends across the link, so run it on the
+side which sends the most.
+"""
+
+import time
+
+import zmq
+
+try:
+    from . import compression, subscription, wire
+    from .omnibus import Receiver, Sender
+except ImportError:
+    # see omnibus.py
+    import compression
+    import subscription
+    import wire
+    from omnibus import Receiver, Sender
+
+BATCH_INTERVAL = 0.01  # seconds to collect messages for before forwarding them
+
+
+def parse_side(side: str):
+    """
+    Split a server given as "name=server" into its name and server. If no
+    name is given the server is used as its name.
+    """
+    name, _, spec = side.rpartition("=")
+    return name or spec, spec
+
+
+class Link:
+    """
+    Forwards messages on some channel prefixes from one server to another.
+    """
+
+    def __init__(self, source, destination, prefixes, codec=None,
+                 min_bytes=compression.MIN_BYTES, batch_interval=BATCH_INTERVAL):
+        source_name, source_spec = parse_side(source)
+        destination_name, destination_spec = parse_side(destination)
+        self.source = source_name.encode("utf-8")
+        self.destination = destination_name.encode("utf-8")
+        self.receiver = Receiver(server=source_spec)
+        self.sender = Sender(server=destination_spec)
+        self.prefixes = [prefix.encode("utf-8") for prefix in prefixes]
+        self.codec = codec and compression.get(codec)
+        self.min_bytes = min_bytes
+        self.batch_interval = batch_interval
+
+        self.subscribed = set()  # raw channel prefixes we're subscribed to on the source
+        self.pending = {}  # raw channel: envelopes waiting to be forwarded
+        self.flush_at = None
+        self.packer = wire.new_packer()
+
+    def update_subscriptions(self):
+        """
+        Subscribe on the source to whatever sinks on the destination are
+        subscribed to, limited to our prefixes.
+        """
+        self.sender._update_subscriptions()
+        wanted = set()
+        for channel in self.sender.subscriptions:
+            for prefix in self.prefixes:
+                if channel.startswith(prefix):
+                    wanted.add(channel)
+                elif prefix.startswith(channel):
+                    wanted.add(prefix)
+        for channel in wanted - self.subscribed:
+            self.receiver.subscriber.setsockopt(zmq.SUBSCRIBE, channel)
+        for channel in self.subscribed - wanted:
+            self.receiver.subscriber.setsockopt(zmq.UNSUBSCRIBE, channel)
+        self.subscribed = wanted
+
+    def receive(self):
+        """
+        Queue everything which has arrived from the source.
+        """
+        try:
+            while True:
+                frames = self.receiver.subscriber.recv_multipart(zmq.NOBLOCK)
+                if frames[0].startswith(subscription.RESERVED_RAW):
+                    continue  # about the source server, and meaningless on the destination
+                if len(frames) == 3:
+                    # messages in the legacy format can't be tagged, so convert them
+                    frames = [frames[0], b"".join(wire.encode(self.packer, timestamp, payload)
+                                                  for timestamp, payload in wire.decode(frames))]
+                self.pending.setdefault(frames[0], []).append(frames[1])
+                if self.flush_at is None:
+                    self.flush_at = time.monotonic() + self.batch_interval
+        except zmq.Again:
+            pass
+
+    def flush(self):
+        """
+        Forward the queued messages to the destination, one ZeroMQ message per channel.
+        """
+        for channel, envelopes in self.pending.items():
+            records = []
+            for envelope in envelopes:
+                # shared memory on the source machine isn't available on the destination
+                envelope = wire.resolve(envelope, self.packer)
+                for flags, timestamp, body in wire.iter_records(envelope):
+                    if self.destination in wire.route(flags, body):
+                        continue  # it has already been there
+                    # the stamps of the source server mean nothing to the destination's receivers
+                    flags, body = wire.strip_stamp(flags, body)
+                    try:
+                        flags, body = wire.add_to_route(flags, body, self.source)
+                    except ValueError:
+                        continue  # it has been through more bridges than a route has room for
+                    if self.codec is not None:
+                        flags, body = wire.compress_record(flags, body, self.codec, self.min_bytes)
+                    records.append(wire.pack_record(flags, timestamp, body))
+            if records:
+                self.sender._publisher(channel).send_multipart([channel, b"".join(records)])
+        self.pending = {}
+        self.flush_at = None
+
+
+class Bridge:
+    """
+    Forwards messages between two servers, given as "name=server", in both directions.
+    """
+
+    def __init__(self, a, b, forward=(), backward=(), codec=None,
+                 min_bytes=compression.MIN_BYTES, batch_interval=BATCH_INTERVAL):
+        self.links = [
+            Link(a, b, forward, codec, min_bytes, batch_interval),
+            Link(b, a, backward, codec, min_bytes, batch_interval),
+        ]
+        self.poller = zmq.Poller()
+        for link in self.links:
+            self.poller.register(link.receiver.subscriber, zmq.POLLIN)
+            # subscriptions from the destination arrive here
+            for publisher in link.sender.publishers:
+                self.poller.register(publisher, zmq.POLLIN)
+        self.running = True
+
+    def run(self):
+        """
+        Forward messages until closed.
+        """
+        while self.running:
+            now = time.monotonic()
+            flushes = [link.flush_at for link in self.links if link.flush_at is not None]
+            # the timeout lets us notice when we've been closed
+            timeout = min([100] + [max(flush_at - now, 0) * 1000 for flush_at in flushes])
+            events = dict(self.poller.poll(timeout))
+            for link in self.links:
+                if any(publisher in events for publisher in link.sender.publishers):
+                    link.update_subscriptions()
+                if link.receiver.subscriber in events:
+                    link.receive()
+                if link.flush_at is not None and time.monotonic() >= link.flush_at:
+                    link.flush()
+
+    def close(self):
+        """
+        Stop run, from another thread.
+        """
+        self.running = False
+
+
+def bridge(a, b, forward=(), backward=(), codec=None, batch_interval=BATCH_INTERVAL):
+    """
+    Run a bridge between two servers forever.
+    """
+    print(f"Bridging {a} -> {b}: {', '.join(forward) or 'nothing'}")
+    print(f"Bridging {b} -> {a}: {', '.join(backward) or 'nothing'}")
+    Bridge(a, b, forward, backward, codec, batch_interval=batch_interval).run()
@@ -0,0 +1,153 @@
+import multiprocessing as mp
+import threading
+import time
+
+import pytest
+
+from omnibus import Receiver, Sender, server
+from omnibus.bridge import Bridge, parse_side
+
+A = "pad=127.0.0.1:6075:6076"
+B = "control=127.0.0.1:6175:6176"
+
+
+def wait_for_subscribers(s, channel):
+    deadline = time.time() + 2
+    while not s.has_subscribers(channel) and time.time() < deadline:
+        time.sleep(0.01)
+    return s.has_subscribers(channel)
+
+
+class TestBridge:
+    @pytest.fixture(autouse=True, scope="class")
+    def servers(self):
+        ctx = mp.get_context('spawn')
+        processes = [
+            ctx.Process(target=server.server, kwargs={"source_port": 6075, "sink_port": 6076}),
+            ctx.Process(target=server.server, kwargs={"source_port": 6175, "sink_port": 6176}),
+        ]
+        for p in processes:
+            p.start()
+        yield
+        for p in processes:
+            p.terminate()
+            p.join()
+
+    @pytest.fixture
+    def bridge(self):
+        bridges = []
+
+        def _bridge(**kwargs):
+            b = Bridge(A, B, **kwargs)
+            threading.Thread(target=b.run, daemon=True).start()
+            bridges.append(b)
+            return b
+        yield _bridge
+        for b in bridges:
+            b.close()
+
+    def connect(self, side, channel):
+        """
+        Return a sender on the other server and a receiver on this one, once
+        the receiver's subscription has made it across the bridge.
+        """
+        other = B if side == A else A
+        s = Sender(server=parse_side(other)[1])
+        r = Receiver(channel, server=parse_side(side)[1])
+        assert wait_for_subscribers(s, channel)
+        return s, r
+
+    def test_forward(self, bridge):
+        bridge(forward=["DAQ"], backward=["RLCS"])
+        s, r = self.connect(B, "DAQ")
+        s.send("DAQ/A", "A")
+        assert r.recv(1000) == "A"
+
+        s, r = self.connect(A, "RLCS")
+        s.send("RLCS", "B")
+        assert r.recv(1000) == "B"
+
+    def test_filter(self, bridge):
+        bridge(forward=["DAQ"])
+        s = Sender(server=parse_side(A)[1])
+        r = Receiver("CAN", server=parse_side(B)[1])
+        time.sleep(0.2)
+        assert not s.has_subscribers("CAN")
+        s.send("CAN", "A")
+        assert r.recv(100) is None
+
+    def test_loop(self, bridge):
+        bridge(forward=["LOOP"], backward=["LOOP"])
+        s, remote = self.connect(B, "LOOP")
+        local = Receiver("LOOP", server=parse_side(A)[1])
+        time.sleep(0.2)
+        s.send("LOOP", "A")
+        assert remote.recv(1000) == "A"
+        assert local.recv(1000) == "A"
+        # the forwarded copy isn't sent back to where it came from
+        assert local.recv(200) is None
+
+    def test_batch_compress(self, bridge):
+        bridge(forward=["BIG"], codec="zlib", batch_interval=0.05)
+        s, r = self.connect(B, "BIG")
+        payload = {"data": [0.5] * 1000}
+        s.send("BIG", payload)
+        s.send("BIG", "small")
+        assert [m.payload for m in r.recv_batch(10, 1000)] == [payload, "small"]
+
+
+class TestChain:
+    """
+    pad -> relay <-> control, where messages from pad would go round between
+    relay and control forever if bridges only knew where messages came from.
+    """
+    PAD = "pad=127.0.0.1:6375:6376"
+    RELAY = "relay=127.0.0.1:6475:6476"
+    CONTROL = "control=127.0.0.1:6575:6576"
+
+    @pytest.fixture(autouse=True, scope="class")
+    def servers(self):
+        ctx = mp.get_context('spawn')
+        processes = [ctx.Process(target=server.server,
+                                 kwargs={"source_port": port, "sink_port": port + 1})
+                     for port in [6375, 6475, 6575]]
+        for p in processes:
+            p.start()
+        bridges = [Bridge(self.PAD, self.RELAY, forward=["LOOP"]),
+                   Bridge(self.RELAY, self.CONTROL, forward=["LOOP"], backward=["LOOP"])]
+        for b in bridges:
+            threading.Thread(target=b.run, daemon=True).start()
+        yield
+        for b in bridges:
+            b.close()
+        for p in processes:
+            p.terminate()
+            p.join()
+
+    def test_no_loop(self):
+        relay = Receiver("LOOP", server=parse_side(self.RELAY)[1])
+        control = Receiver("LOOP", server=parse_side(self.CONTROL)[1])
+        s = Sender(server=parse_side(self.PAD)[1])
+        assert wait_for_subscribers(s, "LOOP")
+        time.sleep(0.2)  # for both receivers' subscriptions to make it across
+        s.send("LOOP", "A")
+        assert relay.recv(1000) == "A"
+        assert control.recv(1000) == "A"
+        # neither gets it again from the other
+        assert relay.recv(300) is None
+        assert control.recv(300) is None
+
+        # and messages sent to the relay reach control once and don't come back
+        s = Sender(server=parse_side(self.RELAY)[1])
+        assert wait_for_subscribers(s, "LOOP")
+        s.send("LOOP", "B")
+        assert control.recv(1000) == "B"
+        assert relay.recv(1000) == "B"
+        assert relay.recv(300) is None
+        assert control.recv(300) is None
+
+
+class TestParseSide:
+    def test_parse_side(self):
+        assert parse_side("pad=127.0.0.1:1:2") == ("pad", "127.0.0.1:1:2")
+        assert parse_side("127.0.0.1") == ("127.0.0.1", "127.0.0.1")
@@ -0,0 +1,91 @@
+"""
+Raw CAN frames, which the Parsley source sends with --raw instead of decoding
+every frame into a dict of names and values several times its size. Each
+message on RAW_CHANNEL is a batch of the frames which arrived together, packed
+into bytes as FRAME records, and sinks decode just the message types they
+need with a Decoder:
+
+    decoder = parsley.decoder("SENSOR_ACC", "SENSOR_GYRO")
+    for msg in receiver:  # a Receiver(can.RAW_CHANNEL)
+        for parsed in decoder.decode_all(msg.payload):
+            ...
+
+This module only knows how frames are packed, not what is in them, which is
+left to the parse function given to Decoder (see sources/parsley/parsley.py).
+"""
+
+import struct
+
+RAW_CHANNEL = "CAN/Raw"
+MAX_DATA = 8  # bytes of data a CAN frame carries
+FRAME = struct.Struct(">HB8s")  # sid, data length, data padded to MAX_DATA bytes
+MSG_TYPE_MASK = 0x7e0  # the bits of a sid which are its message type
+MAX_CACHED = 10000  # decoded frames remembered by a Decoder
+
+
+def pack_frames(frames):
+    """
+    Pack a batch of (sid, data) frames, where data is bytes or a list of
+    ints, into a payload for RAW_CHANNEL.
+    """
+    packed = []
+    for sid, data in frames:
+        if len(data) > MAX_DATA:
+            raise ValueError(f"CAN frames carry at most {MAX_DATA} bytes of data, not {len(data)}")
+        packed.append(FRAME.pack(sid, len(data), bytes(data)))
+    return b"".join(packed)
+
+
+def unpack_frames(payload):
+    """
+    Return the (sid, data) frames packed into a payload by pack_frames.
+    """
+    return [(sid, data[:length]) for sid, length, data in FRAME.iter_unpack(payload)]
+
+
+class Decoder:
+    """
+    Decodes raw frames of some message types with parse(sid, data), skipping
+    frames of any other type before they're decoded. msg_types are the
+    message type bits of the sids wanted, or None for every type.
+
+    Frames of the memoise types, which should be those without a timestamp
+    (eg. debug strings), repeat exactly, so they're remembered once decoded
+    and the same object is returned for the same frame again. Copy it before
+    changing it. Frames of any other type are always decoded, since with a
+    timestamp the same frame hardly ever comes again.
+    """
+
+    def __init__(self, parse, msg_types=None, memoise=()):
+        self.parse = parse
+        self.msg_types = None if msg_types is None else frozenset(msg_types)
+        self.memoise = frozenset(memoise)
+        self.cache = {}  # (sid, data): decoded frame
+        self.hits = 0
+        self.misses = 0
+
+    def wants(self, sid):
+        return self.msg_types is None or sid & MSG_TYPE_MASK in self.msg_types
+
+    def decode(self, sid, data: bytes):
+        """
+        Return a frame decoded, or None if it's not a type we want.
+        """
+        if not self.wants(sid):
+            return None
+        if sid & MSG_TYPE_MASK not in self.memoise:
+            return self.parse(sid, data)
+        if (decoded := self.cache.get((sid, data))) is None:
+            if len(self.cache) >= MAX_CACHED:
+                self.cache.clear()
+            decoded = self.cache[(sid, data)] = self.parse(sid, data)
+            self.misses += 1
+        else:
+            self.hits += 1
+        return decoded
+
+    def decode_all(self, payload):
+        """
+        Return the frames of the types we want in a payload from RAW_CHANNEL, decoded.
+        """
+        return [self.decode(sid, data) for sid, data in unpack_frames(payload) if self.wants(sid)]
@@ -0,0 +1,67 @@
+import pytest
+
+from omnibus import can
+from omnibus.can import Decoder
+
+
+class TestFrames:
+    def test_round_trip(self):
+        frames = [(0x123, b"\x01\x02\x03"), (0x7ff, bytes(range(8))), (0x001, b"")]
+        payload = can.pack_frames(frames)
+        assert len(payload) == 3 * can.FRAME.size
+        assert can.unpack_frames(payload) == frames
+
+    def test_lists(self):
+        assert can.unpack_frames(can.pack_frames([(0x42, [0xAB, 0xCD])])) == [(0x42, b"\xAB\xCD")]
+
+    def test_empty(self):
+        assert can.unpack_frames(can.pack_frames([])) == []
+
+    def test_too_long(self):
+        with pytest.raises(ValueError):
+            can.pack_frames([(0x42, bytes(9))])
+
+
+class TestDecoder:
+    def parse(self, sid, data):
+        self.parsed += 1
+        return {"sid": sid, "data": data}
+
+    def setup_method(self):
+        self.parsed = 0
+
+    def test_filter(self):
+        decoder = Decoder(self.parse, [0x120])
+        assert decoder.decode(0x125, b"\x01") == {"sid": 0x125, "data": b"\x01"}
+        assert decoder.decode(0x145, b"\x01") is None
+        assert self.parsed == 1
+
+    def test_memoised(self):
+        decoder = Decoder(self.parse, memoise=[0x120])
+        first = decoder.decode(0x125, b"\x01")
+        assert decoder.decode(0x125, b"\x01") is first
+        assert decoder.decode(0x125, b"\x02") is not first
+        assert self.parsed == 2
+        assert (decoder.hits, decoder.misses) == (1, 2)
+
+    def test_not_memoised(self):
+        decoder = Decoder(self.parse, memoise=[0x120])
+        first = decoder.decode(0x145, b"\x01")
+        assert decoder.decode(0x145, b"\x01") == first
+        assert self.parsed == 2
+        assert not decoder.cache
+
+    def test_cache_limit(self, monkeypatch):
+        monkeypatch.setattr(can, "MAX_CACHED", 2)
+        decoder = Decoder(self.parse, memoise=[0x120])
+        for data in [b"\x01", b"\x02", b"\x03"]:
+            decoder.decode(0x125, data)
+        assert len(decoder.cache) == 1
+        decoder.decode(0x125, b"\x03")
+        assert self.parsed == 3
+
+    def test_decode_all(self):
+        decoder = Decoder(self.parse, [0x120, 0x7e0])
+        payload = can.pack_frames([(0x125, b"\x01"), (0x145, b"\x02"), (0x7e1, b"\x03")])
+        assert decoder.decode_all(payload) == [{"sid": 0x125, "data": b"\x01"},
+                                               {"sid": 0x7e1, "data": b"\x03"}]
@@ -0,0 +1,79 @@
+"""
+Payload compression codecs.
+
+Senders can compress the payloads of messages on some channels, eg.
+Sender(compress={"DAQ": "zlib"}). Compressed records are flagged with
+wire.FLAG_COMPRESSED and their payload starts with the id of the codec used,
+so receivers decompress them without any configuration.
+
+Further codecs can be added with register, as long as senders and receivers
+both register them under the same id.
+"""
+
+from dataclasses import dataclass
+import lzma
+import typing
+import zlib
+
+try:
+    import lz4.frame
+except ImportError:
+    # lz4 is optional, it's much faster than zlib but compresses less
+    lz4 = None
+
+MIN_BYTES = 512  # payloads smaller than this aren't worth compressing, eg. CAN messages
+
+
+@dataclass(frozen=True)
+class Codec:
+    id: int  # sent with each compressed payload, 1-255
+    name: str
+    compress: typing.Callable[[bytes], bytes]
+    decompress: typing.Callable[[bytes], bytes]
+
+
+_by_id = {}
+_by_name = {}
+
+
+def register(codec: Codec):
+    """
+    Make a codec available to senders and receivers.
+    """
+    if not 0 < codec.id < 256:
+        raise ValueError(f"Codec ids must be between 1 and 255, not {codec.id}")
+    if codec.id in _by_id or codec.name in _by_name:
+        raise ValueError(f"A codec with the id {codec.id} or name {codec.name!r} already exists")
+    _by_id[codec.id] = codec
+    _by_name[codec.name] = codec
+
+
+def get(name: str):
+    """
+    Return the codec registered with a name.
+    """
+    if (codec := _by_name.get(name)) is None:
+        raise ValueError(f"Unknown codec {name!r}, expected one of {', '.join(_by_name)}")
+    return codec
+
+
+def names():
+    """
+    Return the names of the registered codecs.
+    """
+    return list(_by_name)
+
+
+def decompress(codec_id: int, data):
+    """
+    Decompress data compressed by the codec with an id.
+    """
+    if (codec := _by_id.get(codec_id)) is None:
+        raise ValueError(f"Unknown codec id {codec_id}")
+    return codec.decompress(data)
+
+
+register(Codec(1, "zlib", lambda data: zlib.compress(data, 1), zlib.decompress))
+register(Codec(2, "lzma", lzma.compress, lzma.decompress))
+if lz4 is not None:
+    register(Codec(3, "lz4", lz4.frame.compress, lz4.frame.decompress))
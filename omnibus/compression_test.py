@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+from omnibus import compression, wire
+
+
+def decode(record):
+    return wire.decode([b"CHAN", record])[0][1]
+
+
+class TestRegistry:
+    def test_get(self):
+        assert compression.get("zlib").id == 1
+
+    def test_unknown(self):
+        with pytest.raises(ValueError):
+            compression.get("nope")
+        with pytest.raises(ValueError):
+            compression.decompress(255, b"")
+
+    @pytest.mark.parametrize("codec", [
+        compression.Codec(1, "other", bytes, bytes),  # id taken
+        compression.Codec(200, "zlib", bytes, bytes),  # name taken
+        compression.Codec(0, "zero", bytes, bytes),
+    ])
+    def test_register_invalid(self, codec):
+        with pytest.raises(ValueError):
+            compression.register(codec)
+
+
+class TestWire:
+    @pytest.mark.parametrize("name", ["zlib", "lzma"])
+    def test_round_trip(self, name):
+        payload = {"data": [0.5] * 1000}
+        record = wire.encode(wire.new_packer(), 0, payload, codec=compression.get(name))
+        assert wire.flags([b"CHAN", record]) & wire.FLAG_COMPRESSED
+        assert len(record) < len(wire.packb(payload))
+        assert decode(record) == payload
+
+    def test_min_bytes(self):
+        payload = "A" * 100
+        record = wire.encode(wire.new_packer(), 0, payload, codec=compression.get("zlib"))
+        assert not wire.flags([b"CHAN", record]) & wire.FLAG_COMPRESSED
+        record = wire.encode(wire.new_packer(), 0, payload, codec=compression.get("zlib"),
+                             min_bytes=0)
+        assert wire.flags([b"CHAN", record]) & wire.FLAG_COMPRESSED
+        assert decode(record) == payload
+
+    def test_incompressible(self):
+        payload = os.urandom(4096)
+        record = wire.encode(wire.new_packer(), 0, payload, codec=compression.get("zlib"))
+        assert not wire.flags([b"CHAN", record]) & wire.FLAG_COMPRESSED
+        assert decode(record) == payload
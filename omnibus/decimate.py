@@ -0,0 +1,175 @@
+"""
+Decimated virtual channels, which the server provides so that sinks which
+only need an overview of fast data don't receive all of it.
+
+A sink subscribing to a virtual channel, "_omnibus/" (subscription.RESERVED)
+followed by a channel and a rate up to MAX_RATE, like "_omnibus/DAQ@10Hz" (see
+channel), gets no more than that many messages per second on each channel
+starting with "DAQ", on the channel named with the rate inserted after the
+prefix (so "DAQ/Fake" is decimated to "_omnibus/DAQ@10Hz/Fake"). The server subscribes
+to the real channels on the sink's behalf and, for each window of 1/rate
+seconds, sends one message summarising the messages which arrived in it:
+
+    arrays and lists of numbers become {"mean": ..., "min": ..., "max": ...}
+        over every value in them in the window
+    dicts are summarised key by key
+    anything else (including single numbers) is the value in the last message
+
+with the timestamp of the last message. This is meant for channels of arrays,
+like DAQ data, and loses all but the last of the messages in each window on
+channels which carry other things. Since virtual channels are under the
+reserved prefix, sinks subscribed to the real channels or to every channel,
+like the logger, only get the real messages.
+"""
+
+import re
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is only needed to decimate channels which carry arrays
+    np = None
+
+try:
+    from . import subscription
+except ImportError:
+    # see omnibus.py
+    import subscription
+
+# the prefix and rate in a subscription to a virtual channel, which may be followed by more
+VIRTUAL = re.compile(re.escape(subscription.RESERVED_RAW) + rb"(.*?)@(\d+(?:\.\d+)?)Hz")
+MAX_CACHED = 10000  # channels whose decimators are remembered
+# the fastest rate a channel can be decimated to, since the server wakes up at
+# every window to flush it, and anything faster is hardly decimation
+MAX_RATE = 100
+
+
+def channel(prefix: str, rate):
+    """
+    Return the virtual channel of the messages on channels starting with
+    prefix, decimated to rate messages per second.
+    """
+    return f"{subscription.RESERVED}{prefix}@{rate:g}Hz"
+
+
+def parse(subscribed: bytes):
+    """
+    Return the prefix, virtual channel prefix and rate of a subscription to
+    a virtual channel, or None if it's a subscription to real channels.
+    Rates of 0 or above MAX_RATE aren't valid, so are taken as real channels,
+    which nothing is ever sent on.
+    """
+    if (match := VIRTUAL.match(subscribed)) is None:
+        return None
+    rate = float(match[2])
+    if not 0 < rate <= MAX_RATE:
+        return None
+    return match[1], match[0], rate
+
+
+class Summary:
+    """
+    The mean, minimum and maximum of the numbers seen in a window.
+    """
+    __slots__ = ("total", "count", "min", "max")
+
+    def __init__(self):
+        self.total = 0.0
+        self.count = 0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def add(self, values):
+        if np is not None and isinstance(values, np.ndarray):
+            self.total += float(values.sum())
+            self.min = min(self.min, float(values.min()))
+            self.max = max(self.max, float(values.max()))
+            self.count += values.size
+        else:
+            self.total += sum(values)
+            self.min = min(self.min, min(values))
+            self.max = max(self.max, max(values))
+            self.count += len(values)
+
+    def result(self):
+        return {"mean": self.total / self.count, "min": self.min, "max": self.max}
+
+
+def _is_numbers(value):
+    if np is not None and isinstance(value, np.ndarray):
+        return value.size > 0 and value.dtype.kind in "biuf"
+    return (isinstance(value, (list, tuple)) and len(value) > 0
+            and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value))
+
+
+def accumulate(state, payload):
+    """
+    Add a payload to the state of a window, returning the new state.
+    """
+    if isinstance(payload, dict):
+        if not isinstance(state, dict):
+            state = {}
+        for key, value in payload.items():
+            state[key] = accumulate(state.get(key), value)
+        return state
+    if _is_numbers(payload):
+        if not isinstance(state, Summary):
+            state = Summary()
+        state.add(payload)
+        return state
+    return payload
+
+
+def result(state):
+    """
+    Return the payload summarising a window.
+    """
+    if isinstance(state, dict):
+        return {key: result(value) for key, value in state.items()}
+    if isinstance(state, Summary):
+        return state.result()
+    return state
+
+
+class Window:
+    __slots__ = ("start", "timestamp", "state")
+
+    def __init__(self, start):
+        self.start = start
+        self.timestamp = None
+        self.state = None
+
+
+class Decimator:
+    """
+    Decimates the messages on channels starting with a prefix onto a virtual
+    channel.
+    """
+
+    def __init__(self, prefix: bytes, virtual: bytes, rate):
+        self.prefix = prefix
+        self.virtual = virtual
+        self.period = 1 / rate
+        self.windows = {}  # raw channel: the Window messages on it are being added to
+
+    def add(self, channel: bytes, timestamp, payload, now):
+        """
+        Add a message received now on a channel starting with the prefix.
+        """
+        if (window := self.windows.get(channel)) is None:
+            window = self.windows[channel] = Window(now)
+        window.timestamp = timestamp
+        window.state = accumulate(window.state, payload)
+
+    def flush(self, now):
+        """
+        Return the (raw channel, timestamp, payload) of a message on the
+        virtual channel for each window which has ended.
+        """
+        messages = []
+        for channel, window in list(self.windows.items()):
+            if now - window.start >= self.period:
+                del self.windows[channel]
+                messages.append((self.virtual + channel[len(self.prefix):],
+                                 window.timestamp, result(window.state)))
+        return messages
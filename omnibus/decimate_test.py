@@ -0,0 +1,63 @@
+import numpy as np
+
+from omnibus import decimate
+from omnibus.decimate import Decimator
+
+
+class TestParse:
+    def test_virtual(self):
+        assert decimate.parse(b"_omnibus/DAQ@10Hz") == (b"DAQ", b"_omnibus/DAQ@10Hz", 10)
+        assert decimate.parse(b"_omnibus/DAQ@2.5Hz/Fake") == \
+            (b"DAQ", b"_omnibus/DAQ@2.5Hz", 2.5)
+        assert decimate.parse(b"_omnibus/DAQ@100Hz") == (b"DAQ", b"_omnibus/DAQ@100Hz", 100)
+
+    def test_real(self):
+        assert decimate.parse(b"DAQ") is None
+        assert decimate.parse(b"") is None
+        assert decimate.parse(b"USER@HOST") is None
+        assert decimate.parse(b"_omnibus/DAQ@0Hz") is None
+        assert decimate.parse(b"_omnibus/DAQ@1000000Hz") is None
+        # virtual channels are only under the reserved prefix
+        assert decimate.parse(b"DAQ@10Hz") is None
+        assert decimate.parse(b"_omnibus/stats") is None
+
+    def test_channel(self):
+        assert decimate.channel("DAQ", 10) == "_omnibus/DAQ@10Hz"
+        assert decimate.channel("DAQ", 2.5) == "_omnibus/DAQ@2.5Hz"
+        assert decimate.parse(decimate.channel("DAQ", 10).encode()) == \
+            (b"DAQ", b"_omnibus/DAQ@10Hz", 10)
+
+
+class TestAccumulate:
+    def test_arrays(self):
+        state = None
+        for payload in [{"t": 1, "data": {"A": np.array([1.0, 2.0]), "B": [5, 6], "C": "x"}},
+                        {"t": 2, "data": {"A": np.array([3.0, 6.0]), "B": [4], "C": "y"}}]:
+            state = decimate.accumulate(state, payload)
+        assert decimate.result(state) == {"t": 2, "data": {
+            "A": {"mean": 3.0, "min": 1.0, "max": 6.0},
+            "B": {"mean": 5.0, "min": 4, "max": 6},
+            "C": "y",
+        }}
+
+    def test_not_numbers(self):
+        for payload in [[], ["a", "b"], [True, False], np.array(["a"])]:
+            assert decimate.result(decimate.accumulate(None, payload)) is payload
+
+    def test_changed_type(self):
+        state = decimate.accumulate(None, {"A": "x"})
+        state = decimate.accumulate(state, {"A": [1, 2]})
+        assert decimate.result(state) == {"A": {"mean": 1.5, "min": 1, "max": 2}}
+
+
+class TestDecimator:
+    def test_windows(self):
+        d = Decimator(b"DAQ", b"_omnibus/DAQ@10Hz", 10)
+        d.add(b"DAQ/A", 1.0, [1, 2], now=0)
+        d.add(b"DAQ/B", 1.5, [3], now=0.05)
+        d.add(b"DAQ/A", 2.0, [3], now=0.09)
+        assert d.flush(0.09) == []
+        assert d.flush(0.1) == [(b"_omnibus/DAQ@10Hz/A", 2.0, {"mean": 2, "min": 1, "max": 3})]
+        assert d.flush(0.16) == [(b"_omnibus/DAQ@10Hz/B", 1.5, {"mean": 3, "min": 3, "max": 3})]
+        # nothing is sent for channels which have gone quiet
+        assert d.flush(1) == []
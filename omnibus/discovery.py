@@ -0,0 +1,174 @@
+"""
+Finding the server.
+
+Communicators look for the server in order:
+
+1. The server passed to their constructor, eg. Sender(server="192.168.0.10").
+2. The OMNIBUS_SERVER environment variable.
+3. The server found last time, cached on disk for CACHE_TTL seconds, if it
+   still accepts connections.
+4. The server's UDP broadcast, waiting up to a timeout before raising TimeoutError.
+
+Servers are given as "host", or "host:source_port:sink_port" if they aren't
+using the default ports, followed by ":shards" if the server is sharded.
+"""
+
+from dataclasses import asdict, dataclass, field
+import json
+import os
+import socket
+import tempfile
+import time
+
+import msgpack
+
+try:
+    from . import server
+except ImportError:
+    # see omnibus.py
+    import server
+
+ENV_VAR = "OMNIBUS_SERVER"
+DISCOVERY_TIMEOUT = 3  # seconds to listen for a broadcast before giving up
+CACHE_PATH = os.path.join(tempfile.gettempdir(), "omnibus-server.json")
+CACHE_TTL = 300  # seconds a cached server is trusted for
+PROBE_TIMEOUT = 0.2  # seconds to wait when checking a cached server is still there
+
+# The server's broadcast is this followed by a msgpack map of its ports and
+# transports. Older servers broadcast just this, on the default ports.
+BROADCAST_MAGIC = b"omnibus"
+
+
+def _default_transports():
+    return ("tcp", "ipc") if server.IPC_SUPPORTED else ("tcp",)
+
+
+@dataclass(frozen=True)
+class ServerInfo:
+    """
+    Where to find the server.
+    """
+    ip: str
+    source_port: int = server.SOURCE_PORT
+    sink_port: int = server.SINK_PORT
+    transports: tuple = field(default_factory=_default_transports)
+    shards: int = 1
+
+    @property
+    def ports(self):
+        """
+        The (source port, sink port) of each of the server's shards.
+        """
+        return server.shard_ports(self.source_port, self.sink_port, self.shards)
+
+
+def parse(spec: str):
+    """
+    Parse a server given as "host", "host:source_port:sink_port" or
+    "host:source_port:sink_port:shards".
+    """
+    host, *ports = spec.strip().split(":")
+    if not host or len(ports) not in (0, 2, 3):
+        raise ValueError(f"Invalid server {spec!r}, expected host or host:source_port:sink_port")
+    if ports:
+        shards = int(ports[2]) if len(ports) == 3 else 1
+        return ServerInfo(host, int(ports[0]), int(ports[1]), shards=shards)
+    return ServerInfo(host)
+
+
+def announcement(source_port=server.SOURCE_PORT, sink_port=server.SINK_PORT, shards=1):
+    """
+    Return the contents of the server's UDP broadcast.
+    """
+    return BROADCAST_MAGIC + msgpack.packb({
+        "source_port": source_port,
+        "sink_port": sink_port,
+        "transports": list(_default_transports()),
+        "shards": shards,
+    })
+
+
+def parse_announcement(data, addr):
+    """
+    Return the ServerInfo from a broadcast received from addr, or None if it
+    wasn't sent by a server.
+    """
+    if not data.startswith(BROADCAST_MAGIC):
+        return None
+    if data == BROADCAST_MAGIC:
+        return ServerInfo(addr)
+    try:
+        info = msgpack.unpackb(data[len(BROADCAST_MAGIC):])
+        return ServerInfo(addr, info["source_port"], info["sink_port"], tuple(info["transports"]),
+                          info.get("shards", 1))
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def listen(timeout=DISCOVERY_TIMEOUT):
+    """
+    Wait up to timeout seconds for a broadcast from the server.
+    """
+    deadline = time.monotonic() + timeout
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:  # UDP
+        # Allow the address to be re-used for when running multiple
+        # components on the same machine
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(('', server.BROADCAST_PORT))  # listen for broadcasts
+        while (remaining := deadline - time.monotonic()) > 0:
+            sock.settimeout(remaining)
+            try:
+                data, (addr, _) = sock.recvfrom(1024)
+            except socket.timeout:
+                break
+            if (info := parse_announcement(data, addr)) is not None:
+                return info
+    raise TimeoutError(f"No server found within {timeout}s. Make sure it is running, "
+                       f"or set {ENV_VAR} to its address.")
+
+
+def read_cache():
+    """
+    Return the cached server if it's recent and still accepting connections.
+    """
+    try:
+        with open(CACHE_PATH) as f:
+            cached = json.load(f)
+        if time.time() - cached.pop("time") > CACHE_TTL:
+            return None
+        info = ServerInfo(**{**cached, "transports": tuple(cached["transports"])})
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    try:
+        socket.create_connection((info.ip, info.source_port), PROBE_TIMEOUT).close()
+    except OSError:
+        return None
+    return info
+
+
+def write_cache(info: ServerInfo):
+    try:
+        # write then rename so components starting at the same time never see half a file
+        tmp = f"{CACHE_PATH}.{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump({**asdict(info), "time": time.time()}, f)
+        os.replace(tmp, CACHE_PATH)
+    except OSError:
+        pass  # the cache is only an optimization
+
+
+def discover(spec=None, timeout=DISCOVERY_TIMEOUT):
+    """
+    Find the server, in the order described at the top of this module.
+    """
+    if spec is None:
+        spec = os.environ.get(ENV_VAR)
+    if spec:
+        return parse(spec)
+    if (info := read_cache()) is not None:
+        return info
+    print("Listening for server IP...")
+    info = listen(timeout)
+    print(f"Found {info.ip}")
+    write_cache(info)
+    return info
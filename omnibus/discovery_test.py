@@ -0,0 +1,91 @@
+import json
+import socket
+
+import pytest
+
+from omnibus import discovery, server
+
+
+@pytest.fixture
+def cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(discovery, "CACHE_PATH", str(tmp_path / "server.json"))
+
+
+@pytest.fixture
+def listener():
+    # stands in for a running server, accepting connections on an arbitrary port
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen()
+    yield sock.getsockname()[1]
+    sock.close()
+
+
+class TestParse:
+    def test_host(self):
+        assert discovery.parse("192.0.2.1") == discovery.ServerInfo("192.0.2.1")
+
+    def test_ports(self):
+        info = discovery.parse("192.0.2.1:6000:6001")
+        assert (info.ip, info.source_port, info.sink_port) == ("192.0.2.1", 6000, 6001)
+
+    def test_shards(self):
+        info = discovery.parse("192.0.2.1:6000:6001:2")
+        assert info.shards == 2
+        assert info.ports == [(6000, 6001), (6010, 6011)]
+        assert discovery.parse("192.0.2.1").ports == [(server.SOURCE_PORT, server.SINK_PORT)]
+
+    @pytest.mark.parametrize("spec", ["", "192.0.2.1:6000", "192.0.2.1:a:b", "192.0.2.1:1:2:3:4"])
+    def test_invalid(self, spec):
+        with pytest.raises(ValueError):
+            discovery.parse(spec)
+
+
+class TestAnnouncement:
+    def test_round_trip(self):
+        info = discovery.parse_announcement(discovery.announcement(6000, 6001), "192.0.2.1")
+        assert (info.ip, info.source_port, info.sink_port) == ("192.0.2.1", 6000, 6001)
+        assert "tcp" in info.transports
+        assert info.shards == 1
+        info = discovery.parse_announcement(discovery.announcement(6000, 6001, 3), "192.0.2.1")
+        assert info.shards == 3
+
+    def test_legacy(self):
+        info = discovery.parse_announcement(b"omnibus", "192.0.2.1")
+        assert info == discovery.ServerInfo("192.0.2.1")
+        assert info.source_port == server.SOURCE_PORT
+
+    @pytest.mark.parametrize("data", [b"", b"something else", b"omnibus\xc1"])
+    def test_invalid(self, data):
+        assert discovery.parse_announcement(data, "192.0.2.1") is None
+
+
+class TestCache:
+    def test_round_trip(self, cache, listener):
+        info = discovery.ServerInfo("127.0.0.1", listener, listener + 1)
+        discovery.write_cache(info)
+        assert discovery.read_cache() == info
+
+    def test_expired(self, cache, listener, monkeypatch):
+        discovery.write_cache(discovery.ServerInfo("127.0.0.1", listener))
+        monkeypatch.setattr(discovery, "CACHE_TTL", -1)
+        assert discovery.read_cache() is None
+
+    def test_unreachable(self, cache, listener):
+        discovery.write_cache(discovery.ServerInfo("127.0.0.1", listener))
+        with open(discovery.CACHE_PATH) as f:
+            cached = json.load(f)
+        cached["source_port"] = 1  # nothing listens here
+        with open(discovery.CACHE_PATH, "w") as f:
+            json.dump(cached, f)
+        assert discovery.read_cache() is None
+
+    def test_missing(self, cache):
+        assert discovery.read_cache() is None
+
+    def test_discover(self, cache, listener, monkeypatch):
+        monkeypatch.delenv(discovery.ENV_VAR, raising=False)
+        info = discovery.ServerInfo("127.0.0.1", listener)
+        discovery.write_cache(info)
+        # found without waiting for a broadcast
+        assert discovery.discover(timeout=0) == info
@@ -0,0 +1,210 @@
+"""
+End-to-end latency of messages, from the timestamp a sender gives them to
+when a receiver decodes them, recorded per channel into histograms by
+receivers created with Receiver(..., measure_latency=True), plus a live
+console report of them (`python -m omnibus latency`).
+
+If the server is run with --stamp it records when it received and forwarded
+each message (see wire.FLAG_STAMPED), which splits the total into:
+
+    send: from the sender to the server, including time queued in the sender
+    proxy: inside the server
+    deliver: from the server to the receiver, including time queued in the
+        receiver while the sink was busy with earlier messages
+
+Messages whose timestamps were set by hand or which were sent from another
+machine are only as accurate as the clocks involved, so compare segments on
+the same machine where possible.
+"""
+
+import time
+
+try:
+    from . import wire
+except ImportError:
+    # see omnibus.py
+    import wire
+
+# Values are recorded in microseconds into log-linear buckets, like HDR
+# histograms: each power of two is split into 2**SUB_BUCKET_BITS equal buckets,
+# so a recorded value is never more than about 3% off.
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+MAX_LATENCY = 3600  # seconds, longer latencies are recorded as this
+PERCENTILES = (50, 90, 99)
+SEGMENTS = ("total", "send", "proxy", "deliver")
+REPORT_INTERVAL = 1  # seconds between redrawing the console report
+
+
+def _bucket(value):
+    """
+    Return the bucket a value in microseconds is recorded in.
+    """
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    if shift <= 0:
+        return value
+    return (shift << SUB_BUCKET_BITS) + (value >> shift)
+
+
+def _lowest(bucket):
+    """
+    Return the smallest value in microseconds recorded in a bucket.
+    """
+    if bucket < 2 * SUB_BUCKETS:
+        return bucket
+    shift = (bucket >> SUB_BUCKET_BITS) - 1
+    return (bucket - (shift << SUB_BUCKET_BITS)) << shift
+
+
+MAX_VALUE = int(MAX_LATENCY * 1e6)
+BUCKETS = _bucket(MAX_VALUE) + 1
+
+
+class Histogram:
+    """
+    Distribution of latencies, in seconds.
+    """
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0  # microseconds
+        self.max = 0
+
+    def record(self, latency):
+        """
+        Record a latency in seconds. Negative latencies, from clocks which
+        disagree, are recorded as zero.
+        """
+        value = min(max(round(latency * 1e6), 0), MAX_VALUE)
+        self.counts[_bucket(value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        """
+        Add the latencies recorded by another histogram to this one.
+        """
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        """
+        Return the latency in seconds which p percent of those recorded are at
+        or below, or 0 if nothing has been recorded.
+        """
+        if not self.count:
+            return 0
+        target = max(self.count * p / 100, 1)
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                # the highest value the bucket holds, but never more than the maximum seen
+                return min(_lowest(bucket + 1) - 1, self.max) / 1e6
+        return self.max / 1e6
+
+    def summary(self):
+        """
+        Return the count, mean, percentiles and maximum, in seconds.
+        """
+        summary = {"count": self.count, "mean": self.total / self.count / 1e6 if self.count else 0}
+        for p in PERCENTILES:
+            summary[f"p{p}"] = self.percentile(p)
+        summary["max"] = self.max / 1e6
+        return summary
+
+
+class LatencyStats:
+    """
+    Latency histograms for each segment of each channel a receiver gets
+    messages on.
+    """
+
+    def __init__(self):
+        self.channels = {}  # channel: {segment: Histogram}
+
+    def _histograms(self, channel):
+        if (histograms := self.channels.get(channel)) is None:
+            histograms = self.channels[channel] = {segment: Histogram() for segment in SEGMENTS}
+        return histograms
+
+    def record(self, channel, timestamp, stamp=None, now=None):
+        """
+        Record a message sent at timestamp and received now (by default the
+        current time), with the server's (ingress, egress) stamp if it has one.
+        """
+        if now is None:
+            now = time.time()
+        histograms = self._histograms(channel)
+        histograms["total"].record(now - timestamp)
+        if stamp is not None:
+            ingress, egress = stamp
+            histograms["send"].record(ingress - timestamp)
+            histograms["proxy"].record(egress - ingress)
+            histograms["deliver"].record(now - egress)
+
+    def add(self, channel, frames):
+        """
+        Record every live message in the frames of a received message.
+        """
+        if len(frames) == 3:
+            return  # the legacy format is too old to be worth measuring
+        now = time.time()
+        for flags, timestamp, stamp in wire.stamps(frames[1]):
+            if not flags & wire.FLAG_REPLAY:
+                self.record(channel, timestamp, stamp, now)
+
+    def summary(self):
+        """
+        Return the summary of each segment of each channel, leaving out
+        segments nothing has been recorded for.
+        """
+        return {channel: {segment: h.summary() for segment, h in histograms.items() if h.count}
+                for channel, histograms in self.channels.items()}
+
+    def reset(self):
+        self.channels = {}
+
+
+def _fmt_time(seconds):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.0f}us"
+    if seconds < 1:
+        return f"{seconds * 1e3:.1f}ms"
+    return f"{seconds:.2f}s"
+
+
+def fmt_latency(summary):
+    """
+    Format a LatencyStats summary as a table, slowest channels first.
+    """
+    lines = [f"{'Channel':<24} {'segment':<8} {'count':>8} {'mean':>8} "
+             + " ".join(f"{f'p{p}':>8}" for p in PERCENTILES) + f" {'max':>8}"]
+    channels = sorted(summary.items(), key=lambda c: c[1]["total"]["p99"], reverse=True)
+    for channel, segments in channels:
+        for segment, s in segments.items():
+            lines.append(f"{channel if segment == 'total' else '':<24} {segment:<8} "
+                         f"{s['count']:>8} {_fmt_time(s['mean']):>8} "
+                         + " ".join(f"{_fmt_time(s[f'p{p}']):>8}" for p in PERCENTILES)
+                         + f" {_fmt_time(s['max']):>8}")
+    return "\n".join(lines)
+
+
+def view(channels=("",)):
+    """
+    Print the latency of messages on some channels as they arrive.
+    """
+    from .omnibus import Receiver  # imported here since omnibus.py imports us
+
+    receiver = Receiver(*channels, measure_latency=True)
+    reported = time.monotonic()
+    while True:
+        receiver.recv_batch(1000, REPORT_INTERVAL * 1000)
+        if time.monotonic() - reported > REPORT_INTERVAL:
+            # clear the terminal and redraw from the top left
+            print("\033[2J\033[H" + fmt_latency(receiver.latency.summary()), flush=True)
+            reported = time.monotonic()
@@ -0,0 +1,66 @@
+import random
+
+import pytest
+
+from omnibus import latency, wire
+from omnibus.latency import Histogram, LatencyStats
+
+
+class TestHistogram:
+    def test_buckets(self):
+        # every value is in a bucket which starts at or below it and within ~3% of it
+        for value in list(range(200)) + [random.randrange(latency.MAX_VALUE) for _ in range(1000)]:
+            bucket = latency._bucket(value)
+            assert latency._lowest(bucket) <= value < latency._lowest(bucket + 1)
+            assert value - latency._lowest(bucket) <= value / latency.SUB_BUCKETS
+
+    def test_percentiles(self):
+        h = Histogram()
+        for ms in range(1, 101):
+            h.record(ms / 1000)
+        assert h.count == 100
+        assert h.percentile(50) == pytest.approx(0.050, rel=0.04)
+        assert h.percentile(99) == pytest.approx(0.099, rel=0.04)
+        assert h.percentile(100) == h.summary()["max"] == 0.1
+        assert h.summary()["mean"] == pytest.approx(0.0505)
+
+    def test_clamp(self):
+        h = Histogram()
+        h.record(-1)
+        h.record(1e9)
+        assert h.percentile(0) == 0
+        assert h.summary()["max"] == latency.MAX_LATENCY
+
+    def test_empty(self):
+        assert Histogram().summary() == {"count": 0, "mean": 0, "p50": 0, "p90": 0, "p99": 0,
+                                         "max": 0}
+
+    def test_merge(self):
+        a, b = Histogram(), Histogram()
+        a.record(0.001)
+        b.record(0.002)
+        a.merge(b)
+        assert a.count == 2
+        assert a.summary()["max"] == 0.002
+
+
+class TestLatencyStats:
+    def test_segments(self):
+        stats = LatencyStats()
+        stats.record("CHAN", 1.0, (1.001, 1.002), now=1.005)
+        stats.record("OTHER", 1.0, now=1.5)
+        summary = stats.summary()
+        assert summary["CHAN"]["total"]["max"] == pytest.approx(0.005)
+        assert summary["CHAN"]["send"]["max"] == pytest.approx(0.001)
+        assert summary["CHAN"]["proxy"]["max"] == pytest.approx(0.001)
+        assert summary["CHAN"]["deliver"]["max"] == pytest.approx(0.003)
+        # without a stamp only the total is known
+        assert set(summary["OTHER"]) == {"total"}
+        assert "OTHER" in latency.fmt_latency(summary)
+
+    def test_replay(self):
+        packer = wire.new_packer()
+        envelope = wire.encode(packer, 0, "A", wire.FLAG_REPLAY) + wire.encode(packer, 0, "B")
+        stats = LatencyStats()
+        stats.add("CHAN", [b"CHAN", envelope])
+        assert stats.summary()["CHAN"]["total"]["count"] == 1
@@ -0,0 +1,68 @@
+"""
+Last value cache, which lets the server replay recent messages to sinks as
+soon as they subscribe instead of them waiting for the next message on each
+channel.
+"""
+
+from collections import OrderedDict, deque
+
+try:
+    from . import wire
+except ImportError:
+    # see omnibus.py
+    import wire
+
+LVC_DEPTH = 1  # messages kept per channel
+LVC_BYTES = 16 * 1024 * 1024  # total size of the cache
+
+
+class LastValueCache:
+    """
+    Keeps the last depth messages on each channel, evicting the channels which
+    were least recently sent to when the cache grows past max_bytes.
+    """
+
+    def __init__(self, depth=LVC_DEPTH, max_bytes=LVC_BYTES):
+        self.depth = depth
+        self.max_bytes = max_bytes
+        # raw channel: deque of envelopes, least recently updated first
+        self.channels = OrderedDict()
+        self.size = 0
+
+    def add(self, frames):
+        """
+        Cache a message as received from the wire.
+        """
+        # messages in the legacy format can't be flagged as replays, so aren't cached
+        if len(frames) != 2 or self.depth == 0:
+            return
+        channel, envelope = frames
+        if len(envelope) > self.max_bytes:
+            return
+        # arrays in shared memory may have been written over by the time they'd be replayed
+        if wire.any_flags(envelope, wire.FLAG_SHM):
+            return
+
+        if (entries := self.channels.get(channel)) is None:
+            entries = self.channels[channel] = deque()
+        else:
+            self.channels.move_to_end(channel)
+        entries.append(envelope)
+        self.size += len(envelope)
+        if len(entries) > self.depth:
+            self.size -= len(entries.popleft())
+
+        while self.size > self.max_bytes:
+            oldest_channel, oldest = next(iter(self.channels.items()))
+            self.size -= len(oldest.popleft())
+            if not oldest:
+                del self.channels[oldest_channel]
+
+    def replay(self, prefix):
+        """
+        Return the frames of the cached messages on each channel starting with
+        the raw prefix, flagged as replays. Each channel's messages are batched
+        together, since receivers only accept one replay per channel.
+        """
+        return [[channel, wire.add_flags(b"".join(entries), wire.FLAG_REPLAY)]
+                for channel, entries in self.channels.items() if channel.startswith(prefix)]
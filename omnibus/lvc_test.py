@@ -0,0 +1,61 @@
+from omnibus import wire
+from omnibus.lvc import LastValueCache
+
+
+def frames(channel, *payloads):
+    packer = wire.new_packer()
+    return [channel, b"".join(wire.encode(packer, 0, p) for p in payloads)]
+
+
+def payloads(replayed):
+    return [p for _, p in wire.decode(replayed)]
+
+
+class TestLastValueCache:
+    def test_depth(self):
+        c = LastValueCache(depth=2)
+        for i in range(3):
+            c.add(frames(b"CHAN", i))
+        (replayed,) = c.replay(b"CHAN")
+        assert replayed[0] == b"CHAN"
+        assert payloads(replayed) == [1, 2]
+        assert wire.flags(replayed) & wire.FLAG_REPLAY
+
+    def test_prefix(self):
+        c = LastValueCache()
+        c.add(frames(b"CAN/A", "A"))
+        c.add(frames(b"CAN/B", "B"))
+        c.add(frames(b"DAQ", "C"))
+        assert [f[0] for f in c.replay(b"CAN")] == [b"CAN/A", b"CAN/B"]
+        assert len(c.replay(b"")) == 3
+        assert c.replay(b"X") == []
+
+    def test_max_bytes(self):
+        size = len(frames(b"", "A" * 100)[1])
+        c = LastValueCache(depth=5, max_bytes=size * 2)
+        c.add(frames(b"A", "A" * 100))
+        c.add(frames(b"B", "B" * 100))
+        c.add(frames(b"A", "A" * 100))
+        # B was the least recently updated channel so is evicted first
+        assert [f[0] for f in c.replay(b"")] == [b"A"]
+        assert c.size <= size * 2
+        # messages larger than the whole cache are never kept
+        c.add(frames(b"C", "C" * 1000))
+        assert b"C" not in c.channels
+
+    def test_disabled(self):
+        c = LastValueCache(depth=0)
+        c.add(frames(b"CHAN", "A"))
+        assert c.replay(b"") == []
+
+    def test_shm(self):
+        # the arrays could have been written over by the time they're replayed
+        c = LastValueCache()
+        c.add([b"DAQ", wire.add_flags(frames(b"DAQ", "A")[1], wire.FLAG_SHM)])
+        c.add(frames(b"CAN", "B"))
+        assert [f[0] for f in c.replay(b"")] == [b"CAN"]
+
+    def test_legacy(self):
+        c = LastValueCache()
+        c.add([b"CHAN", b"\x0a", b"\xa1A"])
+        assert c.replay(b"") == []
@@ -1,17 +1,25 @@
-from dataclasses import dataclass
-import socket
+from collections import Counter, deque
+from enum import Enum
+import random
+import threading
 import time
 import typing
 
-import msgpack
 import zmq
 
 try:
-    from . import server
+    from . import compression, discovery, latency, sequence, server, shm, subscription, wire
 except ImportError:
     # Python complains if we run `python -m omnibus` from the omnibus folder.
     # This works around that complaint.
+    import compression
+    import discovery
+    import latency
+    import sequence
     import server
+    import shm
+    import subscription
+    import wire
 
 # Python also doesn't execute __main__ if we're in the omnibus folder.
 # If that is the case (we were directly executed), start the server ourselves.
@@ -19,65 +27,292 @@ if __name__ == "__main__":
     server.server()
 
 
-@dataclass(frozen=True)
+_UNPACKED = object()  # marks messages whose payload hasn't been unpacked yet
+
+
 class Message:
     """
     Represents a message as it is sent over the wire.
+
+    Messages from receivers keep their payload packed until it is first
+    accessed, so sinks which filter messages by channel or pass them on
+    without looking at them never unpack it. raw is the payload packed with
+    msgpack, as it was sent, which is much cheaper to log or forward.
+
+    Messages should be treated as immutable.
     """
-    channel: str
-    timestamp: float
-    payload: typing.Any
+    __slots__ = ("channel", "timestamp", "_payload", "_flags", "_data")
+
+    def __init__(self, channel: str, timestamp: float, payload: typing.Any):
+        self.channel = channel
+        self.timestamp = timestamp
+        self._payload = payload
+        self._flags = 0
+        self._data = None  # the payload data from the wire, if we have it
+
+    @classmethod
+    def packed(cls, channel: str, timestamp: float, flags, data):
+        """
+        Build a message from the flags and payload data of a record, as
+        returned by wire.records, without unpacking it.
+        """
+        message = cls.__new__(cls)
+        message.channel = channel
+        message.timestamp = timestamp
+        message._payload = _UNPACKED
+        message._flags = flags
+        message._data = data
+        return message
+
+    @property
+    def payload(self):
+        if self._payload is _UNPACKED:
+            self._payload = wire.unpack_payload(self._flags, self._data)
+        return self._payload
+
+    @property
+    def raw(self) -> bytes:
+        """
+        The payload packed with msgpack.
+        """
+        if self._data is None:
+            return wire.packb(self._payload)
+        return bytes(wire.packed_payload(self._flags, self._data))
+
+    def __eq__(self, other):
+        if not isinstance(other, Message):
+            return NotImplemented
+        return (self.channel, self.timestamp, self.payload) == \
+            (other.channel, other.timestamp, other.payload)
+
+    def __hash__(self):
+        return hash((self.channel, self.timestamp, self.payload))
+
+    def __repr__(self):
+        return f"Message(channel={self.channel!r}, timestamp={self.timestamp!r}, " \
+            f"payload={self.payload!r})"
 
 
 class OmnibusCommunicator:
     """
     Handles state shared between senders and receivers.
+
+    The server is found as described in discovery.py, once for every
+    communicator in the process unless one is given a server explicitly.
+    Setting server_ip skips discovery and uses the default ports.
+
+    When the server is running on this machine we connect to it over IPC,
+    which skips the TCP stack. Set transport to "tcp" or "ipc" to override this.
+
+    A sharded server (see server.server) is several proxies on consecutive
+    ports. Senders send each channel to the shard it belongs to and receivers
+    listen to all of them, so this is transparent to users.
     """
     server_ip = None
+    server_info = None
     context = None
+    transport = None  # "tcp", "ipc" or None to choose automatically
+    discovery_timeout = discovery.DISCOVERY_TIMEOUT
 
-    def __init__(self):
+    def __init__(self, server=None):
         if self.context is None:
             OmnibusCommunicator.context = zmq.Context()
-        if self.server_ip is None:
-            OmnibusCommunicator.server_ip = self._recv_ip()
-
-    def _recv_ip(self):
-        """
-        Listen for a UDP broadcast from the server telling us its IP. If the
-        broadcast isn't received, prompt to manually enter the IP.
-        """
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:  # UDP
-            # Allow the address to be re-used for when running multiple
-            # components on the same machine
-            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            sock.settimeout(0.6)  # 0.6 second timeout
-            sock.bind(('', server.BROADCAST_PORT))  # listen for broadcasts
-            print("Listening for server IP...")
-            while True:
-                try:
-                    data, (addr, _) = sock.recvfrom(16)
-                    if data == b'omnibus':
-                        print(f"Found {addr}")
-                        return addr
-                except socket.timeout:
-                    pass
-                print("Could not detect server IP. Please ensure it is running.")
-                if ip := input("Press enter to retry or manually enter the server IP: ").strip():
-                    return ip
-                print("Retrying...")
+        if server is not None:
+            self.server_info = discovery.parse(server)
+            self.server_ip = self.server_info.ip
+        elif self.server_info is None or self.server_info.ip != self.server_ip:
+            if self.server_ip is None:
+                info = discovery.discover(timeout=self.discovery_timeout)
+            else:
+                info = discovery.ServerInfo(self.server_ip)
+            OmnibusCommunicator.server_info = info
+            OmnibusCommunicator.server_ip = info.ip
+
+    def _socket(self, socket_type):
+        """
+        Create a ZeroMQ socket of the given type on the shared context.
+        """
+        return self.context.socket(socket_type)
+
+    def _transport(self):
+        if self.transport is None:
+            local = server.IPC_SUPPORTED and "ipc" in self.server_info.transports \
+                and server.is_local(self.server_ip)
+            return "ipc" if local else "tcp"
+        return self.transport
+
+    def _endpoint(self, port):
+        """
+        Return the address to connect to one of the server's ports on.
+        """
+        if self._transport() == "ipc":
+            return server.ipc_endpoint(port)
+        return f"tcp://{self.server_ip}:{port}"
+
+    def _blocking(self, sock):
+        """
+        Return a version of a socket from _socket with blocking methods.
+        """
+        return sock
 
 
 class Sender(OmnibusCommunicator):
     """
     Allows messages to be sent to all of the receivers listening on the provided
     channel.
+
+    The server tells senders which channels receivers are subscribed to, and
+    messages on other channels are never sent over the network. If
+    skip_unsubscribed is True they aren't even packed: sending them does
+    nothing at all. Sources can also check has_subscribers before going to the
+    trouble of building a payload.
+
+    If shm_size is given and the server is on this machine, large arrays are
+    passed to receivers through a shared memory ring buffer of that many bytes
+    rather than being copied through the server (see shm.py).
+
+    Payloads on some channels can be compressed for bandwidth-limited links by
+    mapping channel prefixes to codec names from compression.py, eg.
+    compress={"DAQ": "zlib"}. The longest matching prefix applies, and a
+    codec of None turns compression off. Payloads smaller than
+    compress_min_bytes are never compressed.
+
+    There is one publisher socket per server shard, and the subscriptions of
+    each are tracked separately since they arrive from different proxies.
+
+    Messages are numbered per channel so receivers can tell when some have
+    been dropped (see sequence.py). They are dropped when more than hwm
+    messages are waiting to be sent to the server, which defaults to ZeroMQ's
+    high water mark of 1000.
     """
 
-    def __init__(self):
-        super().__init__()
-        self.publisher = self.context.socket(zmq.PUB)
-        self.publisher.connect(f"tcp://{self.server_ip}:{server.SOURCE_PORT}")
+    def __init__(self, skip_unsubscribed=False, shm_size=None, compress=None,
+                 compress_min_bytes=compression.MIN_BYTES, hwm=None, server=None):
+        super().__init__(server)
+        # XPUB rather than PUB so we can read the subscriptions it receives
+        self.publishers = []
+        for source_port, _ in self.server_info.ports:
+            publisher = self._socket(zmq.XPUB)
+            if hwm is not None:
+                publisher.setsockopt(zmq.SNDHWM, hwm)
+            publisher.connect(self._endpoint(source_port))
+            self.publishers.append(publisher)
+        self._shards = {}  # cache of the shard each raw channel is sent through
+        self.ring = None
+        if shm_size is not None and self._transport() == "ipc":
+            self.ring = shm.Ring(shm_size)
+        self.packer = wire.new_packer(self.ring)
+
+        self.codecs = {prefix: codec and compression.get(codec)
+                       for prefix, codec in (compress or {}).items()}
+        self.compress_min_bytes = compress_min_bytes
+        self._channel_codecs = {}  # cache of the codec which applies to each channel
+
+        self.id = random.getrandbits(32)  # tells our messages apart from other senders'
+        self._sequences = {}  # channel: sequence number of the next message on it
+
+        self.skip_unsubscribed = skip_unsubscribed
+        # raw channel prefixes which receivers are subscribed to, per shard
+        self.shard_subscriptions = [set() for _ in self.publishers]
+        self._interest = {}  # cache of has_subscribers results
+        self._subscription_sockets = [self._blocking(publisher) for publisher in self.publishers]
+
+    @property
+    def subscriptions(self):
+        """
+        The raw channel prefixes which receivers are subscribed to on any shard.
+        """
+        return set().union(*self.shard_subscriptions)
+
+    def _shard(self, raw_channel: bytes):
+        if (shard := self._shards.get(raw_channel)) is None:
+            shard = self._shards[raw_channel] = server.shard_for(raw_channel, len(self.publishers))
+        return shard
+
+    def _publisher(self, raw_channel: bytes):
+        """
+        Return the socket to send messages on a raw channel through.
+        """
+        return self.publishers[self._shard(raw_channel)]
+
+    def _update_subscriptions(self):
+        """
+        Apply any (un)subscriptions which have arrived from the server.
+        """
+        for sock, subscriptions in zip(self._subscription_sockets, self.shard_subscriptions):
+            while sock.getsockopt(zmq.EVENTS) & zmq.POLLIN:
+                message = sock.recv()
+                if message[:1] == b"\x01":
+                    subscriptions.add(message[1:])
+                elif message[:1] == b"\x00":
+                    subscriptions.discard(message[1:])
+                self._interest.clear()
+
+    def has_subscribers(self, channel: str):
+        """
+        Return whether any receiver is listening to a channel.
+
+        Subscriptions take a moment to arrive after a sender or receiver is
+        created, so this may be False for a short time at startup.
+        """
+        self._update_subscriptions()
+        if (interested := self._interest.get(channel)) is None:
+            raw = channel.encode("utf-8")
+            interested = any(raw.startswith(prefix)
+                             for prefix in self.shard_subscriptions[self._shard(raw)])
+            self._interest[channel] = interested
+        return interested
+
+    def _wanted(self, channel: str):
+        return not self.skip_unsubscribed or self.has_subscribers(channel)
+
+    def _codec(self, channel):
+        if channel not in self._channel_codecs:
+            matches = [prefix for prefix in self.codecs if channel.startswith(prefix)]
+            self._channel_codecs[channel] = self.codecs[max(matches, key=len)] \
+                if matches else None
+        return self._channel_codecs[channel]
+
+    def _record(self, message: Message):
+        codec = self._codec(message.channel) if self.codecs else None
+        number = self._sequences.get(message.channel, 0)
+        self._sequences[message.channel] = (number + 1) % sequence.MODULUS
+        if message._payload is _UNPACKED:
+            # a received message being passed on, which we needn't unpack
+            return wire.encode_packed(message.timestamp,
+                                      wire.packed_payload(message._flags, message._data),
+                                      codec=codec, min_bytes=self.compress_min_bytes,
+                                      sequence=(self.id, number))
+        if self.ring is None:
+            return wire.encode(self.packer, message.timestamp, message.payload,
+                               codec=codec, min_bytes=self.compress_min_bytes,
+                               sequence=(self.id, number))
+        seq = self.ring.seq
+        record = wire.encode(self.packer, message.timestamp, message.payload,
+                             codec=codec, min_bytes=self.compress_min_bytes,
+                             sequence=(self.id, number))
+        if self.ring.seq != seq:  # some of the payload was written to the ring
+            record = wire.add_flags(record, wire.FLAG_SHM)
+        return record
+
+    def _encode(self, message: Message):
+        """
+        Build the frames which carry a single message.
+        """
+        return [message.channel.encode("utf-8"), self._record(message)]
+
+    def _encode_many(self, messages: typing.Iterable[Message]):
+        """
+        Build the frames for a number of messages, one ZeroMQ message per channel.
+        """
+        batches = {}
+        for message in messages:
+            if not self._wanted(message.channel):
+                continue
+            record = self._record(message)
+            batches.setdefault(message.channel, []).append(record)
+        return [[channel.encode("utf-8"), b"".join(records)]
+                for channel, records in batches.items()]
 
     def send_message(self, message: Message):
         """
@@ -86,18 +321,28 @@ class Sender(OmnibusCommunicator):
         Note that channel used is specified by the message object rather than
         the sender.
         """
-        self.publisher.send_multipart([
-            message.channel.encode("utf-8"),
-            msgpack.packb(message.timestamp),
-            msgpack.packb(message.payload)
-        ])
+        if self._wanted(message.channel):
+            frames = self._encode(message)
+            self._publisher(frames[0]).send_multipart(frames)
 
     def send(self, channel: str, payload):
         """
         Wrap a payload in a message object and send it on a provided channel.
         """
-        message = Message(channel, time.time(), payload)
-        self.send_message(message)
+        if self._wanted(channel):
+            message = Message(channel, time.time(), payload)
+            self.send_message(message)
+
+    def send_many(self, messages: typing.Iterable[Message]):
+        """
+        Send a number of built message objects to all receivers.
+
+        Messages are grouped by channel and each group is sent as a single
+        ZeroMQ message, which is much cheaper than sending them one at a time.
+        Ordering is preserved within a channel but not between channels.
+        """
+        for frames in self._encode_many(messages):
+            self._publisher(frames[0]).send_multipart(frames)
 
 
 class Receiver(OmnibusCommunicator):
@@ -107,16 +352,78 @@ class Receiver(OmnibusCommunicator):
     Filtering is based on only the beginning of the channel name, so for example
     a receiver listening to the channel 'foo' will also receive messages sent
     to 'foobar', and a receiver listing to the channel '' will receive all
-    messages.
+    messages. Channels can also be given as Exact('foo') to receive messages
+    on only that channel, or as globs like 'CAN/*/Status' (see subscription.py).
+
+    When a receiver subscribes, the server replays the most recent messages on
+    the channels it listens to. These are ignored unless replay is True, and
+    even then are only accepted for channels which haven't been received on
+    yet, since they are also sent to every other receiver on those channels.
+
+    If measure_latency is True, the time each live message took to arrive is
+    recorded in self.latency (see latency.py). If track_sequence is True,
+    messages which were dropped on the way are counted in self.sequence (see
+    sequence.py). They are dropped when more than hwm messages are waiting to
+    be received, which defaults to ZeroMQ's high water mark of 1000.
     """
 
-    def __init__(self, *channels):
-        super().__init__()
+    def __init__(self, *channels, replay=False, measure_latency=False, track_sequence=False,
+                 hwm=None, server=None):
+        super().__init__(server)
+        self.replay = replay
+        self.latency = latency.LatencyStats() if measure_latency else None
+        self.sequence = sequence.SequenceTracker() if track_sequence else None
+
+        self.subscriber = self._socket(zmq.SUB)
+        if hwm is not None:
+            self.subscriber.setsockopt(zmq.RCVHWM, hwm)
+        for _, sink_port in self.server_info.ports:
+            self.subscriber.connect(self._endpoint(sink_port))
+        prefixes, self.matcher = subscription.compile_channels(channels)
+        for prefix in prefixes:
+            self.subscriber.setsockopt(zmq.SUBSCRIBE, prefix.encode("utf-8"))
+
+        # messages unpacked from a batch which haven't been returned yet
+        self.pending = deque()
+        # raw channels which we've received messages on
+        self.seen = set()
+
+    def _decode(self, frames):
+        """
+        Unpack the frames of one ZeroMQ message, which may hold a batch of
+        messages or a replay we aren't interested in.
+        """
+        if self.matcher is not None and not self.matcher(frames[0]):
+            return []  # only shares a prefix with a channel we want
+        if wire.flags(frames) & wire.FLAG_REPLAY:
+            if not self.replay or frames[0] in self.seen:
+                return []
+        if self.replay:
+            self.seen.add(frames[0])
+        channel = frames[0].decode("utf-8")
+        if self.latency is not None:
+            self.latency.add(channel, frames)
+        if len(frames) == 3:
+            return [Message(channel, timestamp, payload)
+                    for timestamp, payload in wire.decode(frames)]
+        messages = []
+        for flags, timestamp, number, data in wire.records(frames[1]):
+            if self.sequence is not None and number is not None \
+                    and not flags & wire.FLAG_REPLAY:
+                self.sequence.add(channel, *number)
+            if flags & wire.FLAG_SHM:
+                # unpacked straight away, since the shared memory may be reused by the time
+                # the payload is looked at
+                messages.append(Message(channel, timestamp, wire.unpack_payload(flags, data)))
+            else:
+                messages.append(Message.packed(channel, timestamp, flags, data))
+        return messages
 
-        self.subscriber = self.context.socket(zmq.SUB)
-        self.subscriber.connect(f"tcp://{self.server_ip}:{server.SINK_PORT}")
-        for channel in channels:
-            self.subscriber.setsockopt(zmq.SUBSCRIBE, channel.encode("utf-8"))
+    def _recv_messages(self):
+        """
+        Receive and unpack one ZeroMQ message.
+        """
+        return self._decode(self.subscriber.recv_multipart())
 
     def recv_message(self, timeout=None):
         """
@@ -127,11 +434,44 @@ class Receiver(OmnibusCommunicator):
         zero timeout is supported for nonblocking operation.
         """
 
-        if self.subscriber.poll(timeout):
-            channel, timestamp, payload = self.subscriber.recv_multipart()
-            return Message(channel.decode("utf-8"), msgpack.unpackb(timestamp), msgpack.unpackb(payload))
+        if self._fill(timeout):
+            return self.pending.popleft()
         return None
 
+    def _fill(self, timeout):
+        """
+        Wait for timeout milliseconds (or forever if it is None) for there to be
+        a pending message, returning whether there is one.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout / 1000
+        while not self.pending:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0) * 1000
+            if not self.subscriber.poll(remaining):
+                return False
+            self.pending.extend(self._recv_messages())
+        return True
+
+    def recv_batch(self, max_n, timeout=None):
+        """
+        Receive up to max_n messages from senders.
+
+        This waits for the first message in the same way as recv_message, and
+        then returns it along with any other messages which have already
+        arrived. An empty list is returned if the timeout expires.
+        """
+
+        batch = []
+        if not self._fill(timeout):
+            return batch
+        while len(batch) < max_n:
+            if self.pending:
+                batch.append(self.pending.popleft())
+            elif self.subscriber.poll(0):
+                self.pending.extend(self._recv_messages())
+            else:
+                break
+        return batch
+
     def recv(self, timeout=None):
         """
         Receive the payload of one message from a sender, discarding metadata.
@@ -144,3 +484,121 @@ class Receiver(OmnibusCommunicator):
         if message := self.recv_message(timeout):
             return message.payload
         return None
+
+
+class DropPolicy(Enum):
+    """
+    What a BufferedReceiver does with messages when its queue is full.
+    """
+    DROP_OLDEST = "drop-oldest"  # discard the oldest queued message to make room
+    DROP_NEWEST = "drop-newest"  # discard the message which just arrived
+    KEEP_LATEST = "keep-latest"  # only ever queue the most recent message on each channel
+
+
+class BufferedReceiver(Receiver):
+    """
+    Receiver which drains its socket on a background thread into a bounded
+    queue, so messages are never left to pile up in ZeroMQ while the owner of
+    the receiver is busy.
+
+    policies maps channel prefixes to a DropPolicy, with the longest matching
+    prefix taking precedence and default_policy used for other channels. The
+    number of messages discarded on each channel is kept in self.dropped.
+    """
+
+    def __init__(self, *channels, maxsize=10000, policies=None,
+                 default_policy=DropPolicy.DROP_OLDEST, replay=False, measure_latency=False,
+                 track_sequence=False, hwm=None, server=None):
+        super().__init__(*channels, replay=replay, measure_latency=measure_latency,
+                         track_sequence=track_sequence, hwm=hwm, server=server)
+        self.maxsize = maxsize
+        self.policies = policies or {}
+        self.default_policy = default_policy
+        self._channel_policies = {}  # cache of the policy which applies to each channel
+
+        # Queued messages. KEEP_LATEST channels are queued as their name, with
+        # the message itself in self.latest so it can be replaced in place.
+        self.queue = deque()
+        self.latest = {}
+        self.dropped = Counter()
+        self.condition = threading.Condition()
+
+        self.running = True
+        self.thread = threading.Thread(target=self._drain, daemon=True)
+        self.thread.start()
+
+    def _policy(self, channel):
+        if (policy := self._channel_policies.get(channel)) is None:
+            matches = [prefix for prefix in self.policies if channel.startswith(prefix)]
+            policy = self.policies[max(matches, key=len)] if matches else self.default_policy
+            self._channel_policies[channel] = policy
+        return policy
+
+    def _drain(self):
+        while self.running:
+            # the timeout lets us notice when we've been closed
+            if self.subscriber.poll(100):
+                for message in self._recv_messages():
+                    self._put(message)
+
+    def _put(self, message):
+        with self.condition:
+            policy = self._policy(message.channel)
+            if policy == DropPolicy.KEEP_LATEST and message.channel in self.latest:
+                self.latest[message.channel] = message
+                self.dropped[message.channel] += 1
+                return
+
+            if len(self.queue) >= self.maxsize:
+                if policy == DropPolicy.DROP_NEWEST:
+                    self.dropped[message.channel] += 1
+                    return
+                oldest = self.queue.popleft()
+                if isinstance(oldest, str):
+                    oldest = self.latest.pop(oldest)
+                self.dropped[oldest.channel] += 1
+
+            if policy == DropPolicy.KEEP_LATEST:
+                self.latest[message.channel] = message
+                self.queue.append(message.channel)
+            else:
+                self.queue.append(message)
+            self.condition.notify()
+
+    def _get(self):
+        message = self.queue.popleft()
+        if isinstance(message, str):
+            message = self.latest.pop(message)
+        return message
+
+    def recv_message(self, timeout=None):
+        """
+        Receive one message from the queue, waiting in the same way as
+        Receiver.recv_message.
+        """
+
+        with self.condition:
+            if self.condition.wait_for(lambda: self.queue,
+                                       None if timeout is None else timeout / 1000):
+                return self._get()
+        return None
+
+    def recv_batch(self, max_n, timeout=None):
+        """
+        Receive up to max_n messages from the queue, waiting for the first one
+        in the same way as recv_message.
+        """
+
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.queue,
+                                           None if timeout is None else timeout / 1000):
+                return []
+            return [self._get() for _ in range(min(max_n, len(self.queue)))]
+
+    def close(self):
+        """
+        Stop the background thread and close the socket.
+        """
+        self.running = False
+        self.thread.join()
+        self.subscriber.close()
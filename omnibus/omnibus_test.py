@@ -1,11 +1,14 @@
-import io
 import multiprocessing as mp
-import sys
+import os
 import time
 
+import msgpack
+import numpy as np
 import pytest
+import zmq
 
-from omnibus import Sender, Receiver, Message, server
+from omnibus import Sender, Receiver, Message, BufferedReceiver, DropPolicy, Exact, server, stats
+from omnibus import compression, decimate, discovery, latency, wire
 from omnibus.omnibus import OmnibusCommunicator
 
 
@@ -36,8 +39,8 @@ class TestOmnibus:
 
     @pytest.fixture()
     def receiver(self):
-        def _receiver(*channels):
-            r = Receiver(*channels)
+        def _receiver(*channels, **kwargs):
+            r = Receiver(*channels, **kwargs)
             time.sleep(0.05)  # let the receiver connect to the server so messages aren't dropped
             return r
         return _receiver
@@ -82,6 +85,416 @@ class TestOmnibus:
         s.send("CHAN3", "C")
         assert r.recv(10) == "C"
 
+    def test_batch(self, sender, receiver):
+        s = sender()
+        r = receiver("CHAN1", "CHAN2")
+        s.send_many([Message("CHAN1", 1, "A"), Message("CHAN2", 2, "B"), Message("CHAN1", 3, "C")])
+        # each channel is sent separately, so they may not arrive together
+        batch = r.recv_batch(10, 10)
+        batch += r.recv_batch(10, 10)
+        assert sorted((m.channel, m.timestamp, m.payload) for m in batch) == [
+            ("CHAN1", 1, "A"), ("CHAN1", 3, "C"), ("CHAN2", 2, "B")]
+        assert r.recv_batch(10, 10) == []
+
+    def test_batch_max_n(self, sender, receiver):
+        s = sender()
+        r = receiver("CHAN")
+        s.send_many([Message("CHAN", i, i) for i in range(5)])
+        assert [m.payload for m in r.recv_batch(3, 10)] == [0, 1, 2]
+        # the rest of the batch is kept for the next call
+        assert r.recv(10) == 3
+        assert [m.payload for m in r.recv_batch(3, 10)] == [4]
+
+    def test_buffered(self, sender):
+        s = sender()
+        r = BufferedReceiver("CHAN")
+        time.sleep(0.05)
+        s.send("CHAN", "A")
+        s.send_many([Message("CHAN", 0, "B"), Message("CHAN", 0, "C")])
+        assert r.recv(100) == "A"
+        assert [m.payload for m in r.recv_batch(10, 100)] == ["B", "C"]
+        assert r.recv(10) is None
+        r.close()
+
+    def test_replay(self, sender, receiver):
+        s = sender()
+        early = receiver("REPLAY", replay=True)
+        s.send("REPLAY/A", "A")
+        s.send("REPLAY/B", "B")
+        assert early.recv(10) == "A"
+        assert early.recv(10) == "B"
+
+        late = receiver("REPLAY", replay=True)
+        assert sorted([late.recv(100), late.recv(100)]) == ["A", "B"]
+        # other receivers ignore replays, and don't get them twice
+        assert receiver("REPLAY").recv(50) is None
+        assert early.recv(50) is None
+        assert late.recv(50) is None
+
+    def test_stats(self, sender, receiver):
+        s = sender()
+        r = receiver(stats.STATS_CHANNEL)
+        listener = receiver("STATS/A")  # senders don't send on channels nobody is listening to
+        everything = receiver("")
+        assert self.wait_for_subscribers(s, "STATS/A/B")
+        s.send_many([Message("STATS/A/B", 0, "A") for _ in range(3)])
+        assert listener.recv(1000) == "A"
+        # the first snapshot may have been taken before our messages arrived
+        for _ in range(2):
+            channels = r.recv(2000)["channels"]
+            if "STATS/A" in channels:
+                break
+        c = channels["STATS/A"]
+        assert c["total_msgs"] == 3
+        assert c["min_size"] == c["max_size"] == len(wire.packb("A"))
+        assert stats.fmt_stats({"channels": channels})
+        # receivers of every channel, like the logger, don't get the server's own channels
+        received = everything.recv_batch(1000, 100)
+        assert "STATS/A/B" in {m.channel for m in received}
+        assert not any(m.channel.startswith("_omnibus/") for m in received)
+
+    def test_malformed(self, sender, receiver):
+        s = sender()
+        r = receiver("BAD")
+        assert self.wait_for_subscribers(s, "BAD")
+        for envelope in [b"garbage", b"\x01\x00"]:
+            s.publishers[0].send_multipart([b"BAD", envelope])
+        # the server drops what it can't handle, and carries on forwarding
+        s.send("BAD", "A")
+        assert r.recv(1000) == "A"
+
+    @staticmethod
+    def wait_for_subscribers(s, channel, expected=True):
+        deadline = time.time() + 1
+        while s.has_subscribers(channel) != expected and time.time() < deadline:
+            time.sleep(0.01)
+        return s.has_subscribers(channel)
+
+    def test_has_subscribers(self, sender, receiver):
+        s = sender()
+        assert not s.has_subscribers("SUBS/A")
+        r = receiver("SUBS/")
+        assert self.wait_for_subscribers(s, "SUBS/A")
+        assert not s.has_subscribers("OTHER")
+        r.subscriber.close()
+        assert not self.wait_for_subscribers(s, "SUBS/A", expected=False)
+
+    def test_skip_unsubscribed(self, sender, receiver):
+        s = sender(skip_unsubscribed=True)
+        r = receiver("SKIP/A")
+        assert self.wait_for_subscribers(s, "SKIP/A")
+        s.send("SKIP/B", "B")
+        s.send_many([Message("SKIP/B", 0, "B"), Message("SKIP/A", 0, "A")])
+        s.send("SKIP/A", "C")
+        assert r.recv(10) == "A"
+        assert r.recv(10) == "C"
+        assert r.recv(10) is None
+
+    @pytest.mark.parametrize("transport", ["tcp", "ipc"])
+    def test_transport(self, sender, receiver, transport, monkeypatch):
+        if transport == "ipc" and not server.IPC_SUPPORTED:
+            pytest.skip("ipc is not supported on this platform")
+        monkeypatch.setattr(OmnibusCommunicator, "transport", transport)
+        s = sender()
+        r = receiver("CHAN")
+        assert r.subscriber.getsockopt(zmq.LAST_ENDPOINT).startswith(transport.encode())
+        s.send("CHAN", "A")
+        assert r.recv(1000) == "A"
+
+    def test_shm(self, sender, receiver, monkeypatch):
+        if not server.IPC_SUPPORTED:
+            pytest.skip("shared memory is only used with ipc")
+        s = sender(shm_size=1024 * 1024)
+        assert s.ring is not None
+        local = receiver("SHM")
+        monkeypatch.setattr(OmnibusCommunicator, "transport", "tcp")
+        remote = receiver("SHM")
+        array = np.arange(10000, dtype=np.float64)
+        s.send("SHM", {"data": array})
+        assert np.array_equal(local.recv(1000)["data"], array)
+        assert np.array_equal(remote.recv(1000)["data"], array)
+        s.ring.close()
+
+    def test_patterns(self, sender, receiver):
+        s = sender()
+        r = receiver(Exact("PAT/A"), "PAT/*/Status")
+        for channel in ["PAT/AB", "PAT/A", "PAT/B/Other", "PAT/B/Status"]:
+            s.send(channel, channel)
+        assert r.recv(100) == "PAT/A"
+        assert r.recv(100) == "PAT/B/Status"
+        assert r.recv(100) is None
+
+    def test_hwm(self, sender, receiver):
+        s = sender(hwm=10)
+        r = receiver("HWM", hwm=10, track_sequence=True)
+        assert s.publishers[0].getsockopt(zmq.SNDHWM) == 10
+        assert r.subscriber.getsockopt(zmq.RCVHWM) == 10
+        assert self.wait_for_subscribers(s, "HWM")
+        for i in range(5):
+            s.send("HWM", i)
+        assert [r.recv(1000) for _ in range(5)] == list(range(5))
+        assert r.sequence.lost() == 0
+
+    def test_decimated(self, sender, receiver):
+        s = sender()
+        full = receiver("DEC")
+        everything = receiver("")
+        r = receiver(decimate.channel("DEC", 5))
+        assert self.wait_for_subscribers(s, "DEC/A")
+        for i in range(10):
+            s.send("DEC/A", {"timestamp": i, "data": {"S": np.full(4, float(i))}})
+            time.sleep(0.01)
+        msg = r.recv_message(1000)
+        assert msg.channel == "_omnibus/DEC@5Hz/A"
+        assert msg.payload == {"timestamp": 9, "data": {"S": {"mean": 4.5, "min": 0, "max": 9}}}
+        # receivers of the real channels, or of every channel, only get the real messages
+        assert [m.channel for m in full.recv_batch(100, 100)] == ["DEC/A"] * 10
+        assert [m.channel for m in everything.recv_batch(100, 100)
+                if m.channel.startswith("DEC")] == ["DEC/A"] * 10
+        assert not any(m.channel.startswith("_omnibus/") for m in everything.recv_batch(100, 100))
+        # the server stops subscribing for the virtual channel but not for the real one
+        r.subscriber.close()
+        time.sleep(0.3)
+        assert s.has_subscribers("DEC/A")
+
+    def test_compress(self, sender, receiver):
+        s = sender(compress={"COMP": "zlib", "COMP/RAW": None})
+        r = receiver("COMP")
+        payload = {"data": [0.5] * 1000}
+        s.send("COMP/A", payload)
+        s.send("COMP/RAW", payload)
+        assert r.recv(1000) == payload
+        assert r.recv(1000) == payload
+        assert s._codec("COMP/A").name == "zlib"
+        assert s._codec("COMP/RAW") is None
+        assert s._codec("OTHER") is None
+
+
+class TestSharded:
+    SERVER = "127.0.0.1:6275:6276:3"
+
+    @pytest.fixture(autouse=True, scope="class")
+    def server(self):
+        ctx = mp.get_context('spawn')
+        p = ctx.Process(target=server.server,
+                        kwargs={"source_port": 6275, "sink_port": 6276, "shards": 3})
+        p.start()
+        s = Sender(server=self.SERVER)
+        r = Receiver("_ALIVE", server=self.SERVER)
+        while r.recv(1) is None:
+            s.send("_ALIVE", "_ALIVE")
+        yield
+        p.terminate()
+        p.join()
+
+    def test_routing(self):
+        channels = [f"SHARD{i}/A" for i in range(10)]
+        # make sure the channels are spread across every shard
+        assert {server.shard_for(c.encode(), 3) for c in channels} == {0, 1, 2}
+        s = Sender(server=self.SERVER)
+        r = Receiver("SHARD", server=self.SERVER)
+        for channel in channels:
+            assert TestOmnibus.wait_for_subscribers(s, channel)
+        for channel in channels:
+            s.send(channel, channel)
+        assert sorted(r.recv(1000) for _ in channels) == sorted(channels)
+
+    def test_has_subscribers(self):
+        s = Sender(server=self.SERVER)
+        r = Receiver("SHARD1/", server=self.SERVER)
+        assert TestOmnibus.wait_for_subscribers(s, "SHARD1/A")
+        shard = server.shard_for(b"SHARD1", 3)
+        assert b"SHARD1/" in s.shard_subscriptions[shard]
+        assert not s.has_subscribers("SHARD2/A")
+        r.subscriber.close()
+
+
+class TestStamped:
+    SERVER = "127.0.0.1:6475:6476"
+
+    @pytest.fixture(autouse=True, scope="class")
+    def server(self):
+        ctx = mp.get_context('spawn')
+        p = ctx.Process(target=server.server,
+                        kwargs={"source_port": 6475, "sink_port": 6476, "stamp": True})
+        p.start()
+        s = Sender(server=self.SERVER)
+        r = Receiver("_ALIVE", server=self.SERVER)
+        while r.recv(1) is None:
+            s.send("_ALIVE", "_ALIVE")
+        yield
+        p.terminate()
+        p.join()
+
+    def test_latency(self):
+        s = Sender(server=self.SERVER)
+        r = Receiver("LAT", measure_latency=True, server=self.SERVER)
+        assert TestOmnibus.wait_for_subscribers(s, "LAT")
+        s.send_many([Message("LAT", time.time(), i) for i in range(3)])
+        assert [m.payload for m in r.recv_batch(3, 1000)] == [0, 1, 2]
+        summary = r.latency.summary()["LAT"]
+        assert set(summary) == set(latency.SEGMENTS)
+        assert summary["total"]["count"] == 3
+        assert 0 < summary["total"]["max"] < 1
+        assert summary["proxy"]["max"] <= summary["total"]["max"]
+
+
+class TestShardFor:
+    def test_single(self):
+        assert server.shard_for(b"DAQ/A", 1) == 0
+
+    def test_prefix(self):
+        # channels with the same first component always share a shard
+        assert server.shard_for(b"DAQ/A", 4) == server.shard_for(b"DAQ/B/C", 4) \
+            == server.shard_for(b"DAQ", 4)
+
+    def test_ports(self):
+        assert server.shard_ports(6000, 6001, 2) == [(6000, 6001), (6010, 6011)]
+
+
+class TestMessage:
+    def frames(self, *payloads, codec=None):
+        packer = wire.new_packer()
+        return [b"CHAN", b"".join(wire.encode(packer, 1.5, p, codec=codec, min_bytes=0)
+                                  for p in payloads)]
+
+    @pytest.fixture
+    def receiver(self):
+        OmnibusCommunicator.server_ip = "127.0.0.1"  # nothing is sent, so no server is needed
+        return Receiver()
+
+    def test_lazy(self, receiver, monkeypatch):
+        unpacked = []
+        monkeypatch.setattr(wire, "unpackb", lambda data: unpacked.append(data) or "A")
+        m1, m2 = receiver._decode(self.frames("A", "B"))
+        assert (m1.channel, m1.timestamp) == ("CHAN", 1.5)
+        assert m1.raw == msgpack.packb("A")
+        assert unpacked == []
+        assert m1.payload == "A"
+        assert m1.payload == "A"
+        assert len(unpacked) == 1
+
+    def test_compressed(self, receiver):
+        payload = {"data": [0.5] * 100}
+        m, = receiver._decode(self.frames(payload, codec=compression.get("zlib")))
+        assert m._flags & wire.FLAG_COMPRESSED
+        assert m.raw == wire.packb(payload)
+        assert m.payload == payload
+
+    def test_equality(self, receiver):
+        m, = receiver._decode(self.frames("A"))
+        assert m == Message("CHAN", 1.5, "A")
+        assert m != Message("CHAN", 1.5, "B")
+        assert repr(m) == "Message(channel='CHAN', timestamp=1.5, payload='A')"
+        assert hash(m) == hash(Message("CHAN", 1.5, "A"))
+        assert not hasattr(m, "__dict__")
+
+    def test_built(self):
+        m = Message("CHAN", 0, {"a": 1})
+        assert m.raw == wire.packb({"a": 1})
+
+    def test_pass_through(self, receiver, monkeypatch):
+        m, = receiver._decode(self.frames({"a": 1}))
+        monkeypatch.setattr(wire, "unpackb", None)  # passing it on mustn't unpack it
+        s = Sender()
+        frames = s._encode(m)
+        monkeypatch.undo()
+        assert wire.decode(frames) == [(1.5, {"a": 1})]
+
+    def test_sequence(self):
+        OmnibusCommunicator.server_ip = "127.0.0.1"
+        s = Sender()
+        r = Receiver(track_sequence=True)
+        frames = [s._encode(Message("CHAN", 0, i)) for i in range(5)]
+        for f in frames[:2] + frames[3:]:
+            r._decode(f)
+        stats = r.sequence.summary()["CHAN"][f"{s.id:08x}"]
+        assert (stats["received"], stats["lost"]) == (4, 1)
+        # the sequence continues across batches
+        r._decode(s._encode_many([Message("CHAN", 0, 5), Message("CHAN", 0, 6)])[0])
+        assert r.sequence.lost() == 1
+        assert r.sequence.summary()["CHAN"][f"{s.id:08x}"]["received"] == 6
+
+    def test_log_entry(self, receiver):
+        m, = receiver._decode(self.frames([1, 2]))
+        entry = wire.pack_log_entry(m.channel, m.timestamp, m.raw)
+        assert msgpack.unpackb(entry) == ["CHAN", 1.5, [1, 2]]
+
+
+class TestBufferedReceiver:
+    @pytest.fixture
+    def receiver(self):
+        OmnibusCommunicator.server_ip = "127.0.0.1"  # nothing is sent, so no server is needed
+        receivers = []
+
+        def _receiver(**kwargs):
+            r = BufferedReceiver(**kwargs)
+            receivers.append(r)
+            return r
+        yield _receiver
+        for r in receivers:
+            r.close()
+
+    def test_drop_oldest(self, receiver):
+        r = receiver(maxsize=2)
+        for i in range(3):
+            r._put(Message("CHAN", i, i))
+        assert [m.payload for m in r.recv_batch(10, 0)] == [1, 2]
+        assert r.dropped == {"CHAN": 1}
+
+    def test_drop_newest(self, receiver):
+        r = receiver(maxsize=2, default_policy=DropPolicy.DROP_NEWEST)
+        for i in range(3):
+            r._put(Message("CHAN", i, i))
+        assert [m.payload for m in r.recv_batch(10, 0)] == [0, 1]
+        assert r.dropped == {"CHAN": 1}
+
+    def test_keep_latest(self, receiver):
+        r = receiver(policies={"DAQ": DropPolicy.KEEP_LATEST})
+        r._put(Message("DAQ/A", 0, 0))
+        r._put(Message("CAN", 0, 1))
+        r._put(Message("DAQ/B", 0, 2))
+        r._put(Message("DAQ/A", 0, 3))
+        # DAQ/A keeps its place in the queue but only its latest value
+        assert [m.payload for m in r.recv_batch(10, 0)] == [3, 1, 2]
+        assert r.dropped == {"DAQ/A": 1}
+        r._put(Message("DAQ/A", 0, 4))
+        assert r.recv(0) == 4
+
+    def test_longest_prefix(self, receiver):
+        r = receiver(maxsize=1, policies={"CAN": DropPolicy.DROP_OLDEST,
+                                          "CAN/Parsley": DropPolicy.DROP_NEWEST})
+        r._put(Message("CAN/Parsley", 0, 0))
+        r._put(Message("CAN/Parsley", 0, 1))
+        assert r.recv(0) == 0
+        r._put(Message("CAN/RLCS", 0, 2))
+        r._put(Message("CAN/RLCS", 0, 3))
+        assert r.recv(0) == 3
+
+    def test_timeout(self, receiver):
+        r = receiver()
+        assert r.recv_message(10) is None
+        assert r.recv_batch(10, 10) == []
+
+
+class TestTransport:
+    def test_local(self, monkeypatch):
+        monkeypatch.setattr(OmnibusCommunicator, "server_ip", "127.0.0.1")
+        c = OmnibusCommunicator()
+        expected = "ipc" if server.IPC_SUPPORTED else "tcp"
+        assert c._endpoint(server.SINK_PORT).startswith(expected)
+
+    def test_remote(self, monkeypatch):
+        # reserved for documentation, so never this machine
+        monkeypatch.setattr(OmnibusCommunicator, "server_ip", "192.0.2.1")
+        c = OmnibusCommunicator()
+        assert c._endpoint(server.SINK_PORT) == f"tcp://192.0.2.1:{server.SINK_PORT}"
+
+    def test_is_local(self):
+        assert server.is_local("127.0.0.1")
+        assert server.is_local(server.get_ip())
+        assert not server.is_local("192.0.2.1")
+
 
 class TestIPBroadcast:
     @pytest.fixture()
@@ -93,20 +506,34 @@ class TestIPBroadcast:
         p.terminate()
         p.join()
 
-    def test_broadcast(self, broadcaster, monkeypatch):
-        # respond to the IP prompt if discovery times out
-        monkeypatch.setattr(sys, "stdin", io.StringIO("timeout"))
+    @pytest.fixture(autouse=True)
+    def undiscovered(self, monkeypatch, tmp_path):
+        monkeypatch.delenv(discovery.ENV_VAR, raising=False)
+        monkeypatch.setattr(discovery, "CACHE_PATH", str(tmp_path / "server.json"))
         # make sure the server_ip isn't stored from previous tests
-        OmnibusCommunicator.server_ip = None
+        monkeypatch.setattr(OmnibusCommunicator, "server_ip", None)
+        monkeypatch.setattr(OmnibusCommunicator, "server_info", None)
 
+    def test_broadcast(self, broadcaster):
         c = OmnibusCommunicator()
         assert c.server_ip == server.get_ip()
+        assert c.server_info.source_port == server.SOURCE_PORT
+        assert c.server_info.sink_port == server.SINK_PORT
+        assert os.path.exists(discovery.CACHE_PATH)
 
     def test_timeout(self, monkeypatch):
-        # respond to the IP prompt if discovery times out
-        monkeypatch.setattr(sys, "stdin", io.StringIO("timeout"))
-        # make sure the server_ip isn't stored from previous tests
-        OmnibusCommunicator.server_ip = None
+        monkeypatch.setattr(OmnibusCommunicator, "discovery_timeout", 0.1)
+        with pytest.raises(TimeoutError):
+            OmnibusCommunicator()
 
+    def test_env(self, monkeypatch):
+        monkeypatch.setenv(discovery.ENV_VAR, "192.0.2.1:6000:6001")
         c = OmnibusCommunicator()
-        assert c.server_ip == "timeout"
+        assert c.server_info == discovery.ServerInfo("192.0.2.1", 6000, 6001)
+
+    def test_argument(self):
+        OmnibusCommunicator.server_ip = "127.0.0.1"
+        c = OmnibusCommunicator(server="192.0.2.1")
+        assert c.server_ip == "192.0.2.1"
+        # other communicators still use the shared server
+        assert OmnibusCommunicator().server_ip == "127.0.0.1"
@@ -0,0 +1,122 @@
+"""
+Detection of dropped messages.
+
+ZeroMQ silently drops messages when a queue between a sender and a receiver
+fills up (see the hwm arguments of Sender, Receiver and the server). Senders
+number the messages they send on each channel (see wire.FLAG_SEQUENCE), so
+receivers created with Receiver(..., track_sequence=True) can count the
+messages which never arrived, or arrived out of order, from each sender on
+each channel. This tells a flat line on a plot caused by dropped messages
+apart from a sensor which really isn't changing.
+"""
+
+from collections import deque
+from dataclasses import dataclass
+import time
+
+MODULUS = 1 << 32  # sequence numbers wrap around after this many messages
+MAX_MISSING = 4096  # missing sequence numbers remembered per stream, to recognise late ones
+MAX_GAPS = 1000  # recent gaps remembered
+
+
+@dataclass(frozen=True)
+class Gap:
+    """
+    A run of messages which didn't arrive when they should have.
+    """
+    channel: str
+    sender: int
+    first: int  # sequence number of the first missing message
+    count: int
+    time: float  # when it was noticed
+
+
+class Stream:
+    """
+    The messages received from one sender on one channel.
+    """
+
+    def __init__(self, sequence):
+        self.next = (sequence + 1) % MODULUS
+        self.received = 1
+        self.lost = 0
+        self.reordered = 0
+        self.duplicates = 0
+        self.missing = {}  # sequence numbers we're still waiting for, oldest first
+
+    def add(self, sequence):
+        """
+        Count a message, returning how many messages before it are newly missing.
+        """
+        self.received += 1
+        ahead = (sequence - self.next) % MODULUS
+        if ahead == 0:
+            self.next = (sequence + 1) % MODULUS
+            return 0
+        if ahead < MODULUS // 2:
+            # skipped over some messages, which may still turn up late
+            for missing in range(max(ahead - MAX_MISSING, 0), ahead):
+                self.missing[(self.next + missing) % MODULUS] = None
+            while len(self.missing) > MAX_MISSING:
+                del self.missing[next(iter(self.missing))]
+            self.lost += ahead
+            self.next = (sequence + 1) % MODULUS
+            return ahead
+        # older than the last message we received
+        if sequence in self.missing:
+            del self.missing[sequence]
+            self.lost -= 1
+            self.reordered += 1
+        else:
+            self.duplicates += 1
+        return 0
+
+    def summary(self):
+        return {
+            "received": self.received,
+            "lost": self.lost,
+            "reordered": self.reordered,
+            "duplicates": self.duplicates,
+            "loss_rate": self.lost / (self.received + self.lost),
+        }
+
+
+class SequenceTracker:
+    """
+    Tracks the sequence numbers of messages from each sender on each channel.
+    """
+
+    def __init__(self):
+        self.streams = {}  # (channel, sender id): Stream
+        self.gaps = deque(maxlen=MAX_GAPS)
+
+    def add(self, channel, sender, sequence):
+        """
+        Count a live message sent by a sender with a sequence number.
+        """
+        if (stream := self.streams.get((channel, sender))) is None:
+            # the first message we've seen from it, whatever was sent before wasn't for us
+            self.streams[(channel, sender)] = Stream(sequence)
+            return
+        if lost := stream.add(sequence):
+            self.gaps.append(Gap(channel, sender, (sequence - lost) % MODULUS, lost, time.time()))
+
+    def lost(self):
+        """
+        Return the total number of messages which haven't arrived.
+        """
+        return sum(stream.lost for stream in self.streams.values())
+
+    def summary(self):
+        """
+        Return counts of the messages received and lost from each sender, by
+        their id in hex, on each channel.
+        """
+        summary = {}
+        for (channel, sender), stream in self.streams.items():
+            summary.setdefault(channel, {})[f"{sender:08x}"] = stream.summary()
+        return summary
+
+    def reset(self):
+        self.streams = {}
+        self.gaps.clear()
@@ -0,0 +1,52 @@
+from omnibus import sequence
+from omnibus.sequence import SequenceTracker
+
+
+class TestSequenceTracker:
+    def track(self, *numbers, sender=1):
+        tracker = SequenceTracker()
+        for number in numbers:
+            tracker.add("CHAN", sender, number)
+        return tracker, tracker.summary()["CHAN"][f"{sender:08x}"]
+
+    def test_in_order(self):
+        tracker, summary = self.track(5, 6, 7)
+        assert summary == {"received": 3, "lost": 0, "reordered": 0, "duplicates": 0,
+                           "loss_rate": 0}
+        assert not tracker.gaps
+
+    def test_gap(self):
+        tracker, summary = self.track(0, 1, 4, 5)
+        assert summary["lost"] == 2
+        assert summary["loss_rate"] == 2 / 6
+        gap, = tracker.gaps
+        assert (gap.channel, gap.sender, gap.first, gap.count) == ("CHAN", 1, 2, 2)
+
+    def test_reordered(self):
+        _, summary = self.track(0, 2, 1, 3)
+        assert summary["lost"] == 0
+        assert summary["reordered"] == 1
+
+    def test_duplicate(self):
+        _, summary = self.track(0, 1, 1, 2)
+        assert summary["duplicates"] == 1
+        assert summary["lost"] == 0
+
+    def test_wrap(self):
+        _, summary = self.track(sequence.MODULUS - 2, sequence.MODULUS - 1, 0, 2)
+        assert summary["lost"] == 1
+
+    def test_large_gap(self):
+        _, summary = self.track(0, sequence.MAX_MISSING * 3, 1)
+        assert summary["lost"] == sequence.MAX_MISSING * 3 - 1
+        # too long ago to remember, so it looks like a duplicate
+        assert summary["duplicates"] == 1
+
+    def test_senders(self):
+        tracker = SequenceTracker()
+        tracker.add("CHAN", 1, 0)
+        tracker.add("CHAN", 2, 10)
+        tracker.add("OTHER", 1, 3)
+        tracker.add("CHAN", 1, 2)
+        assert tracker.lost() == 1
+        assert set(tracker.summary()["CHAN"]) == {"00000001", "00000002"}
@@ -1,13 +1,58 @@
+from collections import Counter
+import multiprocessing as mp
+import os
+import signal
 import socket
+import sys
+import tempfile
 import threading
 import time
+import zlib
 
 import zmq
-from zmq.devices import ThreadProxy
+
+try:
+    from . import decimate, lvc, stats, wire
+except ImportError:
+    # see omnibus.py
+    import decimate
+    import lvc
+    import stats
+    import wire
 
 SOURCE_PORT = 5075
 SINK_PORT = 5076
 BROADCAST_PORT = 5077
+# sources and sinks on the same machine as the server connect over unix sockets instead of TCP
+IPC_SUPPORTED = zmq.has("ipc")
+# When the server is sharded across several processes, shard i listens on the
+# source and sink ports plus i * SHARD_PORT_STEP
+SHARD_PORT_STEP = 10
+
+
+def shard_ports(source_port, sink_port, shards):
+    """
+    Return the (source port, sink port) of each shard of a server.
+    """
+    return [(source_port + SHARD_PORT_STEP * i, sink_port + SHARD_PORT_STEP * i)
+            for i in range(shards)]
+
+
+def shard_for(channel: bytes, shards):
+    """
+    Return the shard a raw channel is sent through. Channels are sharded by
+    their first /-separated component, so that related channels stay together.
+    """
+    if shards == 1:
+        return 0
+    return zlib.crc32(channel.split(b"/", 1)[0]) % shards
+
+
+def ipc_endpoint(port):
+    """
+    Return the ipc:// endpoint the server binds alongside a TCP port.
+    """
+    return f"ipc://{os.path.join(tempfile.gettempdir(), f'omnibus-{port}')}"
 
 
 def get_ip():
@@ -25,11 +70,35 @@ def get_ip():
         s.close()
 
 
-def ip_broadcast():
+def is_local(ip):
+    """
+    Return whether an IP belongs to this machine.
+    """
+    if ip.startswith("127.") or ip in ("localhost", "::1"):
+        return True
+    try:
+        return ip in socket.gethostbyname_ex(socket.gethostname())[2] or ip == get_ip()
+    except OSError:
+        return ip == get_ip()
+
+
+def ip_broadcast(source_port=SOURCE_PORT, sink_port=SINK_PORT, shards=1):
     """
     Periodically send a UDP broadcast to the LAN. Sources and sinks can listen
-    to who sent the broadcast (filtering based on the content) to find our ip.
+    to who sent the broadcast (filtering based on the content) to find our ip,
+    and read our ports and transports from it.
     """
+    # imported here since discovery imports us for the default ports
+    try:
+        from . import discovery
+    except ImportError:
+        import discovery
+
+    messages = [discovery.announcement(source_port, sink_port, shards)]
+    if (source_port, sink_port, shards) == (SOURCE_PORT, SINK_PORT, 1):
+        # older sources and sinks only understand the bare magic
+        messages.append(discovery.BROADCAST_MAGIC)
+
     with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:  # UDP socket
         # Allow the address to be re-used for when running multiple components
         # on the same machine
@@ -40,48 +109,292 @@ def ip_broadcast():
         # This runs in a separate thread so we can loop
         while True:
             # 255.255.255.255 is a magic IP that means 'broadcast to the LAN'
-            sock.sendto(b"omnibus", ('255.255.255.255', BROADCAST_PORT))
+            for message in messages:
+                sock.sendto(message, ('255.255.255.255', BROADCAST_PORT))
             time.sleep(0.5)
 
 
-def server():
+class Proxy:
     """
-    Run the Omnibus server, display the current messages/sec.
+    Forwards messages from sources to sinks, keeping traffic statistics and a
+    cache of recent messages which is replayed to sinks as they subscribe.
+
+    Subscriptions are forwarded from sinks to sources, so sources only send
+    (and we only see) messages on channels that some sink is listening to.
+
+    Sinks on this machine connect over IPC to a separate socket from remote
+    sinks, which have any arrays in shared memory sent to them inline.
+
+    Subscriptions to virtual channels like "_omnibus/DAQ@10Hz" aren't forwarded, but
+    subscribe us to the real channels, which we decimate (see decimate.py).
     """
-    context = zmq.Context()
 
-    proxy = ThreadProxy(zmq.SUB, zmq.PUB, zmq.PUB)  # proxies messages in a separate thread
-    proxy.bind_in(f"tcp://*:{SOURCE_PORT}")
-    proxy.setsockopt_in(zmq.SUBSCRIBE, b"")
-    proxy.bind_out(f"tcp://*:{SINK_PORT}")
-    proxy.bind_mon("inproc://mon")  # use in-process communication for the monitor socket
-    proxy.daemon = True
-    proxy.context_factory = lambda: context
+    def __init__(self, context, lvc_depth=lvc.LVC_DEPTH, lvc_bytes=lvc.LVC_BYTES,
+                 source_port=SOURCE_PORT, sink_port=SINK_PORT, shard=0, stamp=False, hwm=None):
+        self.shard = shard
+        self.stamp = stamp
+        self.frontend = context.socket(zmq.XSUB)  # sources connect here
+        if hwm is not None:
+            self.frontend.setsockopt(zmq.RCVHWM, hwm)
+        self.frontend.bind(f"tcp://*:{source_port}")
+        if IPC_SUPPORTED:
+            self.frontend.bind(ipc_endpoint(source_port))
+
+        self.backend = self._backend(context, f"tcp://*:{sink_port}", hwm)  # sinks connect here
+        self.local_backend = None  # and local sinks here
+        if IPC_SUPPORTED:
+            self.local_backend = self._backend(context, ipc_endpoint(sink_port), hwm)
+        # prefixes remote sinks are subscribed to: number of subscriptions
+        self.remote_subscriptions = Counter()
+        # virtual channel prefixes sinks are subscribed to: number of subscriptions
+        self.virtual_subscriptions = Counter()
+        self.decimators = {}  # virtual channel prefix: Decimator
+        self.decimating = {}  # raw channel: decimators of messages on it
+
+        self.poller = zmq.Poller()
+        self.poller.register(self.frontend, zmq.POLLIN)
+        self.poller.register(self.backend, zmq.POLLIN)
+        if self.local_backend is not None:
+            self.poller.register(self.local_backend, zmq.POLLIN)
+
+        self.packer = wire.new_packer()
+        self.traffic = stats.TrafficStats()
+        self.cache = lvc.LastValueCache(lvc_depth, lvc_bytes)
+        self.count = 0  # messages since the console rate was last printed
+        self.errors = 0  # messages dropped because handling them raised
+        self.running = True
+
+    @staticmethod
+    def _backend(context, endpoint, hwm=None):
+        backend = context.socket(zmq.XPUB)
+        if hwm is not None:
+            backend.setsockopt(zmq.SNDHWM, hwm)  # per sink
+        # pass on every (un)subscription, not just the first, so each new sink gets a replay
+        backend.setsockopt(zmq.XPUB_VERBOSER, 1)
+        backend.bind(endpoint)
+        return backend
+
+    def send_remote(self, frames):
+        """
+        Send a message to remote sinks, first packing any arrays it has in
+        shared memory if some remote sink is subscribed to it.
+        """
+        if len(frames) == 2 and any(frames[0].startswith(prefix)
+                                    for prefix in self.remote_subscriptions):
+            frames = [frames[0], wire.resolve(frames[1], self.packer)]
+        self.backend.send_multipart(frames)
+
+    def forward(self, frames, received=None):
+        """
+        Pass a message from a source on to sinks. If we're stamping messages,
+        received is when it arrived.
+        """
+        if self.stamp and len(frames) == 2:
+            frames = [frames[0], wire.stamp(frames[1], received or time.time(), time.time())]
+        self.publish(frames)
+        if self.decimators:
+            self.decimate(frames)
+
+    def publish(self, frames):
+        """
+        Send a message to sinks, caching it and counting it in our statistics.
+        """
+        self.traffic.add(frames)
+        self.cache.add(frames)
+        if self.local_backend is not None:
+            self.local_backend.send_multipart(frames)
+        self.send_remote(frames)
+        self.count += 1
+
+    def subscribe(self, message, local=False):
+        """
+        Handle a subscription message from a sink, passing it on to sources and
+        replaying cached messages it is interested in.
+        """
+        subscribing = message[:1] == b"\x01"
+        if (virtual := decimate.parse(message[1:])) is not None:
+            self.subscribe_virtual(subscribing, *virtual)
+        else:
+            self.frontend.send(message)
+        if not local:
+            self.remote_subscriptions[message[1:]] += 1 if subscribing else -1
+            if self.remote_subscriptions[message[1:]] <= 0:
+                del self.remote_subscriptions[message[1:]]
+        if subscribing:
+            for frames in self.cache.replay(message[1:]):
+                if local:
+                    self.local_backend.send_multipart(frames)
+                else:
+                    self.send_remote(frames)
+
+    def subscribe_virtual(self, subscribing, prefix, virtual, rate):
+        """
+        Handle a sink subscribing or unsubscribing to a virtual channel,
+        subscribing to the real channels while any sink is subscribed to it.
+        """
+        self.virtual_subscriptions[virtual] += 1 if subscribing else -1
+        if subscribing and virtual not in self.decimators:
+            self.decimators[virtual] = decimate.Decimator(prefix, virtual, rate)
+            self.frontend.send(b"\x01" + prefix)
+        elif self.virtual_subscriptions[virtual] <= 0:
+            del self.virtual_subscriptions[virtual]
+            if self.decimators.pop(virtual, None) is not None:
+                self.frontend.send(b"\x00" + prefix)
+        self.decimating = {}
+
+    def decimate(self, frames):
+        """
+        Add a message from a source to the decimators of its channel, if any.
+        """
+        channel = frames[0]
+        if (decimators := self.decimating.get(channel)) is None:
+            if len(self.decimating) >= decimate.MAX_CACHED:
+                self.decimating = {}
+            decimators = self.decimating[channel] = [
+                d for d in self.decimators.values() if channel.startswith(d.prefix)]
+        if not decimators:
+            return
+        now = time.time()
+        try:
+            messages = wire.decode(frames)
+        except Exception:
+            return  # we can't summarise what we can't unpack, but sinks still got it
+        for timestamp, payload in messages:
+            for decimator in decimators:
+                decimator.add(channel, timestamp, payload, now)
+
+    def flush_decimators(self):
+        """
+        Send a message on each virtual channel whose window has ended.
+        """
+        now = time.time()
+        for decimator in self.decimators.values():
+            for channel, timestamp, payload in decimator.flush(now):
+                self.publish([channel, wire.encode(self.packer, timestamp, payload)])
+
+    def publish_stats(self):
+        snapshot = self.traffic.snapshot()
+        snapshot["shard"] = self.shard
+        self.forward([
+            stats.STATS_CHANNEL.encode("utf-8"),
+            wire.encode(self.packer, time.time(), snapshot)
+        ])
+
+    def _drain(self, sock, handle, multipart=False):
+        """
+        Handle every message waiting on a socket. Messages which can't be
+        handled are counted in errors and dropped, rather than stopping us.
+        """
+        while True:
+            try:
+                message = sock.recv_multipart(zmq.NOBLOCK) if multipart else sock.recv(zmq.NOBLOCK)
+            except zmq.Again:
+                return
+            try:
+                handle(message)
+            except Exception as e:
+                self.errors += 1
+                print(f"\nDropped message {message!r:.100}: {e!r}", file=sys.stderr)
+
+    def poll(self, timeout):
+        """
+        Wait up to timeout ms for messages and subscriptions and handle
+        everything which has arrived, before the time is checked again.
+        """
+        events = dict(self.poller.poll(timeout))
+        if self.frontend in events:
+            self._drain(self.frontend, lambda frames: self.forward(
+                frames, time.time() if self.stamp else None), multipart=True)
+        if self.backend in events:
+            self._drain(self.backend, self.subscribe)
+        if self.local_backend in events:
+            self._drain(self.local_backend, lambda message: self.subscribe(message, local=True))
+
+    def run(self, verbose=True):
+        """
+        Proxy messages until running is cleared, publishing statistics on
+        stats.STATS_CHANNEL and, if verbose, displaying the current messages/sec.
+        """
+        t = time.time()
+        published = t
+        while self.running:
+            # 200ms timeout, or less if a virtual channel needs sending more often
+            self.poll(min([200] + [d.period * 1000 for d in self.decimators.values()]))
+            if self.decimators:
+                self.flush_decimators()
+
+            if time.time() - t > 0.2:
+                if verbose:
+                    print(f"\r{self.count*5: <5} msgs/sec", end="")
+                t = time.time()
+                self.count = 0
+            if time.time() - published > stats.STATS_INTERVAL:
+                self.publish_stats()
+                published = time.time()
+
+
+def _run_shard(shard, lvc_depth, lvc_bytes, source_port, sink_port, stamp, hwm):
+    """
+    Run one shard of a sharded server, in its own process.
+    """
+    proxy = Proxy(zmq.Context(), lvc_depth, lvc_bytes, source_port, sink_port, shard, stamp, hwm)
+
+    # stop when the main server process does, however it exits
+    def watch_parent():
+        mp.parent_process().join()
+        proxy.running = False
+    threading.Thread(target=watch_parent, daemon=True).start()
+
+    proxy.run(verbose=False)
+
+
+def server(lvc_depth=lvc.LVC_DEPTH, lvc_bytes=lvc.LVC_BYTES,
+           source_port=SOURCE_PORT, sink_port=SINK_PORT, shards=1, stamp=False, hwm=None):
+    """
+    Run the Omnibus server.
+
+    The last lvc_depth messages on each channel, up to lvc_bytes in total, are
+    replayed to sinks when they subscribe. A depth of zero disables this.
+
+    With more than one shard, channels are spread across that many processes
+    (see shard_for) so the server can use more than one core. The first
+    shard runs in this process and the rest in their own, and clients send
+    each message to the right one.
+
+    If stamp is True, messages are stamped with when they passed through the
+    server, so receivers can tell how much of their latency it is responsible
+    for (see latency.py).
+
+    Messages are dropped when more than hwm are waiting to be received from a
+    source or sent to a sink, which defaults to ZeroMQ's high water mark.
+    """
+    ports = shard_ports(source_port, sink_port, shards)
+    if shards > 1:
+        # exit cleanly when terminated, so the other shards are stopped too
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        ctx = mp.get_context('spawn')
+        for shard, (shard_source, shard_sink) in enumerate(ports[1:], 1):
+            ctx.Process(target=_run_shard, daemon=True,
+                        args=(shard, lvc_depth, lvc_bytes, shard_source, shard_sink, stamp,
+                              hwm)).start()
+
+    context = zmq.Context()
+    proxy = Proxy(context, lvc_depth, lvc_bytes, source_port, sink_port, stamp=stamp, hwm=hwm)
 
-    proxy.start()
     # periodically broadcast our IP
-    threading.Thread(target=ip_broadcast, daemon=True).start()
+    threading.Thread(target=ip_broadcast, args=(source_port, sink_port, shards),
+                     daemon=True).start()
 
     local_ip = get_ip()
-    print(f"Serving {local_ip}:{SOURCE_PORT} -> {local_ip}:{SINK_PORT}")
-
-    # The monitor receives all proxied messages. With normal proxies this means
-    # messages going in both directions, but since this is a pub/sub proxy it
-    # just receives the same messages as any other sink.
-    monitor = context.socket(zmq.SUB)
-    monitor.connect("inproc://mon")
-    monitor.setsockopt(zmq.SUBSCRIBE, b"")
-
-    t = time.time()
-    count = 0
-    while True:
-        if monitor.poll(200):  # 200ms timeout
-            monitor.recv_multipart()
-            count += 1
-        if time.time() - t > 0.2:
-            print(f"\r{count*5: <5} msgs/sec", end="")
-            t = time.time()
-            count = 0
+    for shard_source, shard_sink in ports:
+        print(f"Serving {local_ip}:{shard_source} -> {local_ip}:{shard_sink}")
+        if IPC_SUPPORTED:
+            print(f"Serving {ipc_endpoint(shard_source)} -> {ipc_endpoint(shard_sink)}")
+    if shards > 1:
+        print("Rates below are for the first shard only, "
+              "use `python -m omnibus stats` for the rest")
+
+    proxy.run()
 
 
 if __name__ == '__main__':
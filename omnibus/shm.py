@@ -0,0 +1,144 @@
+"""
+Shared memory ring buffers, which let senders pass large arrays to receivers
+on the same machine without copying them through the server.
+
+A sender opts in with Sender(shm_size=...). Arrays of at least SHM_MIN_BYTES
+in its payloads are written to its ring and only a small descriptor (segment
+name, offset, length and sequence number) is sent over the bus. Local
+receivers map the segment and copy the arrays out of the ring, while the
+server replaces descriptors with the data itself for remote receivers.
+
+Entries are only valid until the sender wraps around and writes over them.
+Descriptors for data which has already been overwritten, or is written over
+while it's being copied, decode to None.
+"""
+
+import itertools
+import os
+import struct
+import weakref
+from multiprocessing import resource_tracker, shared_memory
+
+SHM_SIZE = 64 * 1024 * 1024  # default ring size
+SHM_MIN_BYTES = 4096  # arrays smaller than this are cheaper to send normally
+ALIGN = 64  # entries start on cache line boundaries, which also suits every dtype
+
+# each entry in a ring is a header followed by the data:
+# sequence number (u64) | length (u32)
+ENTRY_HEADER = struct.Struct("<QI")
+# descriptors are sent as: segment name length (u8), segment name, offset (u64), length (u32),
+# sequence number (u64)
+DESCRIPTOR_NAME = struct.Struct("<B")
+DESCRIPTOR = struct.Struct("<QIQ")
+
+
+class _Segment(shared_memory.SharedMemory):
+    def __del__(self):
+        try:
+            super().__del__()
+        except BufferError:
+            # arrays received from the segment are still around at exit
+            pass
+
+
+_names = itertools.count()
+_rings = weakref.WeakValueDictionary()  # segment name: Ring, of the rings this process writes
+
+
+class Ring:
+    """
+    A shared memory segment which a sender writes entries into, wrapping
+    around to the start when it reaches the end.
+    """
+
+    def __init__(self, size=SHM_SIZE):
+        name = f"omnibus-{os.getpid()}-{next(_names)}"
+        self.shm = _Segment(name, create=True, size=size)
+        self.name = self.shm.name.encode("utf-8")
+        self.size = size
+        self.offset = 0
+        self.seq = 0  # sequence number of the last entry written, 0 is never used
+        _rings[self.shm.name] = self
+        # free the segment when we're garbage collected or the process exits
+        self._finalizer = weakref.finalize(self, _destroy, self.shm)
+
+    def write(self, data):
+        """
+        Copy a bytes-like object into the ring, returning its descriptor.
+        """
+        data = memoryview(data).cast("B")
+        length = len(data)
+        total = ENTRY_HEADER.size + length
+        if total > self.size:
+            raise ValueError(f"{length} bytes does not fit in a ring of {self.size} bytes")
+        if self.offset + total > self.size:
+            self.offset = 0
+        offset = self.offset
+        self.seq += 1
+        buf = self.shm.buf
+        # invalidate the entry while it's being written
+        ENTRY_HEADER.pack_into(buf, offset, 0, 0)
+        start = offset + ENTRY_HEADER.size
+        buf[start:start + length] = data
+        ENTRY_HEADER.pack_into(buf, offset, self.seq, length)
+        self.offset = -(-(start + length) // ALIGN) * ALIGN
+        return DESCRIPTOR_NAME.pack(len(self.name)) + self.name + \
+            DESCRIPTOR.pack(offset, length, self.seq)
+
+    def close(self):
+        _rings.pop(self.shm.name, None)
+        self._finalizer()
+
+
+def _destroy(shm):
+    shm.unlink()
+    try:
+        shm.close()
+    except BufferError:
+        # arrays received from the ring are still around, the memory is freed when they are
+        pass
+
+
+_attached = {}  # segment name: SharedMemory of rings written by other processes
+
+
+def _attach(name):
+    if (ring := _rings.get(name)) is not None:
+        return ring.shm
+    if (shm := _attached.get(name)) is None:
+        shm = _Segment(name)
+        # the resource tracker would unlink the segment when we exit, pulling it
+        # out from under its sender, so tell it that isn't our job
+        if os.name == "posix":
+            resource_tracker.unregister(shm._name, "shared_memory")
+        _attached[name] = shm
+    return shm
+
+
+def read(descriptor, offset=0):
+    """
+    Return a copy of the data an entry's descriptor points to, or None if the
+    entry has been overwritten (even partly, while it was being copied) or its
+    sender has gone away.
+    The descriptor starts offset bytes into a bytes-like object.
+
+    Returns the data and the offset of the end of the descriptor.
+    """
+    name_len, = DESCRIPTOR_NAME.unpack_from(descriptor, offset)
+    offset += DESCRIPTOR_NAME.size
+    name = bytes(descriptor[offset:offset + name_len]).decode("utf-8")
+    offset += name_len
+    entry, length, seq = DESCRIPTOR.unpack_from(descriptor, offset)
+    offset += DESCRIPTOR.size
+    try:
+        buf = _attach(name).buf
+    except FileNotFoundError:
+        return None, offset
+    if ENTRY_HEADER.unpack_from(buf, entry) != (seq, length):
+        return None, offset
+    start = entry + ENTRY_HEADER.size
+    data = bytes(buf[start:start + length])
+    # the sender may have wrapped around and started writing over the entry while we copied it
+    if ENTRY_HEADER.unpack_from(buf, entry) != (seq, length):
+        return None, offset
+    return data, offset
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from omnibus import shm, wire
+
+
+@pytest.fixture
+def ring():
+    r = shm.Ring(64 * 1024)
+    yield r
+    r.close()
+
+
+def decode(envelope):
+    return [p for _, p in wire.decode([b"DAQ", envelope])]
+
+
+class TestRing:
+    def test_read(self, ring):
+        descriptor = ring.write(b"hello")
+        data, end = shm.read(descriptor)
+        assert data == b"hello"
+        assert end == len(descriptor)
+
+    def test_overwritten(self, ring):
+        first = ring.write(bytes(40 * 1024))
+        second = ring.write(bytes(40 * 1024))  # wraps around over the first
+        assert shm.read(first)[0] is None
+        assert len(shm.read(second)[0]) == 40 * 1024
+
+    def test_overwritten_while_copying(self, ring, monkeypatch):
+        descriptor = ring.write(b"hello")
+
+        class Lapped(bytearray):
+            # the sender wraps around and writes over the entry as it's copied
+            def __getitem__(self, key):
+                data = super().__getitem__(key)
+                shm.ENTRY_HEADER.pack_into(self, 0, 0, 0)
+                return data
+
+        class Segment:
+            buf = Lapped(ring.shm.buf)
+
+        monkeypatch.setattr(shm, "_attach", lambda name: Segment)
+        assert shm.read(descriptor)[0] is None
+
+    def test_too_big(self, ring):
+        with pytest.raises(ValueError):
+            ring.write(bytes(64 * 1024))
+
+    def test_closed(self):
+        r = shm.Ring(4096)
+        descriptor = r.write(b"hello")
+        r.close()
+        assert shm.read(descriptor)[0] is None
+
+
+class TestShmWire:
+    def test_round_trip(self, ring):
+        array = np.arange(2048, dtype=np.float32).reshape(2, 1024)
+        envelope = wire.encode(wire.new_packer(ring), 0, {"data": array, "small": np.ones(3)})
+        assert len(envelope) < 1024  # only the small array is packed inline
+        res = decode(envelope)[0]
+        assert np.array_equal(res["data"], array)
+        assert res["data"].dtype == array.dtype
+        assert not res["data"].flags.writeable
+        assert np.array_equal(res["small"], np.ones(3))
+
+    def test_resolve(self, ring):
+        array = np.arange(2048, dtype=np.float64)
+        packer = wire.new_packer()
+        envelope = wire.encode(wire.new_packer(ring), 0, array, wire.FLAG_SHM) + \
+            wire.encode(packer, 1, "A")
+        resolved = wire.resolve(envelope, packer)
+        ring.close()  # resolved envelopes don't need the shared memory
+        res = decode(resolved)
+        assert np.array_equal(res[0], array)
+        assert res[1] == "A"
+        assert not wire.flags([b"DAQ", resolved]) & wire.FLAG_SHM
+
+    def test_resolve_unchanged(self):
+        envelope = wire.encode(wire.new_packer(), 0, "A")
+        assert wire.resolve(envelope, wire.new_packer()) is envelope
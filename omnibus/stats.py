@@ -0,0 +1,170 @@
+"""
+Per-channel traffic statistics, collected by the server and published on
+STATS_CHANNEL, plus a live console view of them (`python -m omnibus stats`).
+"""
+
+import time
+
+try:
+    from . import subscription, wire
+except ImportError:
+    # see omnibus.py
+    import subscription
+    import wire
+
+STATS_CHANNEL = subscription.RESERVED + "stats"
+STATS_INTERVAL = 1  # seconds between publishing stats
+STATS_DEPTH = 2  # number of /-separated channel components statistics are grouped by
+SIZE_BUCKETS = 24  # payload size histogram buckets, the last holds everything >= 4MiB
+
+
+class ChannelStats:
+    """
+    Traffic counters for a single channel prefix.
+    """
+
+    def __init__(self):
+        self.msgs = 0  # counts since the last snapshot
+        self.bytes = 0
+        self.total_msgs = 0
+        self.total_bytes = 0
+        self.peak_msgs = 0  # highest per-second rates seen
+        self.peak_bytes = 0
+        self.payload_bytes = 0
+        self.min_size = None
+        self.max_size = 0
+        # histogram[i] counts payloads of size in [2**(i-1), 2**i), with 0 bytes in histogram[0]
+        self.histogram = [0] * SIZE_BUCKETS
+
+    def add(self, count, size, payload_size):
+        self.msgs += count
+        self.bytes += size
+        self.payload_bytes += payload_size
+        if count == 0:
+            return  # an empty envelope, with no messages to measure
+        # batches are counted as that many messages of their average size
+        average = payload_size // count
+        if self.min_size is None or average < self.min_size:
+            self.min_size = average
+        self.max_size = max(self.max_size, average)
+        self.histogram[min(average.bit_length(), SIZE_BUCKETS - 1)] += count
+
+    def snapshot(self, elapsed):
+        msg_rate = self.msgs / elapsed
+        byte_rate = self.bytes / elapsed
+        self.total_msgs += self.msgs
+        self.total_bytes += self.bytes
+        self.peak_msgs = max(self.peak_msgs, msg_rate)
+        self.peak_bytes = max(self.peak_bytes, byte_rate)
+        self.msgs = 0
+        self.bytes = 0
+        return {
+            "msgs_per_sec": msg_rate,
+            "bytes_per_sec": byte_rate,
+            "peak_msgs_per_sec": self.peak_msgs,
+            "peak_bytes_per_sec": self.peak_bytes,
+            "total_msgs": self.total_msgs,
+            "total_bytes": self.total_bytes,
+            "min_size": self.min_size or 0,
+            "max_size": self.max_size,
+            "mean_size": self.payload_bytes / self.total_msgs if self.total_msgs else 0,
+            "size_histogram": self.histogram,
+        }
+
+
+class TrafficStats:
+    """
+    Groups proxied messages by channel prefix and counts them.
+    """
+
+    def __init__(self, depth=STATS_DEPTH):
+        self.depth = depth
+        self.channels = {}
+        self.prefixes = {}  # cache of the prefix each raw channel is grouped under
+        self.last = time.time()
+
+    def add(self, frames):
+        """
+        Count a message as received from the wire. Reserved channels are ignored.
+        """
+        channel = frames[0]
+        if (prefix := self.prefixes.get(channel)) is None:
+            if channel.startswith(subscription.RESERVED_RAW):
+                prefix = ""
+            else:
+                # channels aren't checked to be valid UTF-8 before they get here
+                name = channel.decode("utf-8", errors="replace")
+                prefix = "/".join(name.split("/")[:self.depth])
+            self.prefixes[channel] = prefix
+        if prefix == "":
+            return
+        if (stats := self.channels.get(prefix)) is None:
+            stats = self.channels[prefix] = ChannelStats()
+        count, payload_size = wire.measure(frames)
+        stats.add(count, sum(len(frame) for frame in frames), payload_size)
+
+    def snapshot(self):
+        """
+        Return the statistics of each channel prefix since the last snapshot.
+        """
+        now = time.time()
+        elapsed = max(now - self.last, 1e-6)
+        self.last = now
+        return {
+            "timestamp": now,
+            "channels": {prefix: stats.snapshot(elapsed) for prefix, stats in self.channels.items()}
+        }
+
+
+def _fmt_bytes(n):
+    for unit in ["B", "KB", "MB"]:
+        if n < 1024:
+            return f"{n:.1f}{unit}"
+        n /= 1024
+    return f"{n:.1f}GB"
+
+
+def fmt_stats(stats):
+    """
+    Format a published stats payload as a table, busiest channels first.
+    """
+    lines = [f"{'Channel':<24} {'msgs/s':>9} {'peak':>9} {'bytes/s':>9} {'peak':>9} "
+             f"{'min':>8} {'max':>8} {'total':>10}"]
+    channels = sorted(stats["channels"].items(), key=lambda c: c[1]["bytes_per_sec"], reverse=True)
+    for prefix, c in channels:
+        lines.append(f"{prefix:<24} {c['msgs_per_sec']:>9.1f} {c['peak_msgs_per_sec']:>9.1f} "
+                     f"{_fmt_bytes(c['bytes_per_sec']):>9} "
+                     f"{_fmt_bytes(c['peak_bytes_per_sec']):>9} "
+                     f"{_fmt_bytes(c['min_size']):>8} {_fmt_bytes(c['max_size']):>8} "
+                     f"{c['total_msgs']:>10}")
+    return "\n".join(lines)
+
+
+def merge(snapshots):
+    """
+    Combine the latest stats payloads from each shard of a sharded server.
+    Each channel is only ever sent through one shard, so they don't overlap.
+    """
+    channels = {}
+    for snapshot in snapshots:
+        channels.update(snapshot["channels"])
+    return {
+        "timestamp": max((snapshot["timestamp"] for snapshot in snapshots), default=0),
+        "channels": channels,
+    }
+
+
+def view():
+    """
+    Print the server's traffic statistics as they are published.
+    """
+    # imported here since omnibus.py imports the server, which imports us
+    from .omnibus import Receiver
+
+    receiver = Receiver(STATS_CHANNEL)
+    latest = {}  # shard: most recent stats from it
+    while True:
+        stats = receiver.recv()
+        latest[stats.get("shard", 0)] = stats
+        # clear the terminal and redraw from the top left
+        print("\033[2J\033[H" + fmt_stats(merge(latest.values())), flush=True)
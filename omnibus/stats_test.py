@@ -0,0 +1,75 @@
+from omnibus import wire
+from omnibus.stats import TrafficStats, merge
+
+
+def frames(channel, *payloads):
+    packer = wire.new_packer()
+    return [channel.encode("utf-8"), b"".join(wire.encode(packer, 0, p) for p in payloads)]
+
+
+class TestTrafficStats:
+    def test_grouping(self):
+        t = TrafficStats(depth=2)
+        t.add(frames("CAN/Parsley", "A"))
+        t.add(frames("DAQ/Fake/1", "A", "B"))
+        t.add(frames("DAQ/Fake/2", "A"))
+        channels = t.snapshot()["channels"]
+        assert set(channels) == {"CAN/Parsley", "DAQ/Fake"}
+        assert channels["DAQ/Fake"]["total_msgs"] == 3
+
+    def test_reserved(self):
+        t = TrafficStats()
+        t.add(frames("_omnibus/stats", "A"))
+        assert t.snapshot()["channels"] == {}
+
+    def test_sizes(self):
+        t = TrafficStats()
+        t.add(frames("CHAN", "A"))
+        t.add(frames("CHAN", "A" * 100))
+        c = t.snapshot()["channels"]["CHAN"]
+        small, large = len(wire.packb("A")), len(wire.packb("A" * 100))
+        assert c["min_size"] == small
+        assert c["max_size"] == large
+        assert c["mean_size"] == (small + large) / 2
+        assert c["size_histogram"][small.bit_length()] == 1
+        assert c["size_histogram"][large.bit_length()] == 1
+
+    def test_rates(self):
+        t = TrafficStats()
+        t.add(frames("CHAN", "A"))
+        first = t.snapshot()["channels"]["CHAN"]
+        assert first["msgs_per_sec"] > 0
+        second = t.snapshot()["channels"]["CHAN"]
+        assert second["msgs_per_sec"] == 0
+        assert second["peak_msgs_per_sec"] == first["msgs_per_sec"]
+        assert second["total_msgs"] == 1
+
+    def test_empty(self):
+        t = TrafficStats()
+        t.add([b"CHAN", b""])
+        t.add(frames("CHAN", "A"))
+        c = t.snapshot()["channels"]["CHAN"]
+        assert c["total_msgs"] == 1
+        assert c["min_size"] == len(wire.packb("A"))
+
+    def test_garbage(self):
+        t = TrafficStats()
+        t.add([b"CHAN", b"garbage"])
+        t.add([b"CHAN"])
+        c = t.snapshot()["channels"]["CHAN"]
+        assert c["total_msgs"] == 2
+        assert c["max_size"] == len(b"garbage")
+
+    def test_not_utf8(self):
+        t = TrafficStats()
+        t.add([b"CAN/\xff/1", frames("", "A")[1]])
+        assert set(t.snapshot()["channels"]) == {"CAN/\ufffd"}
+
+
+class TestMerge:
+    def test_merge(self):
+        a, b = TrafficStats(), TrafficStats()
+        a.add(frames("CAN", "A"))
+        b.add(frames("DAQ", "A"))
+        merged = merge([a.snapshot(), b.snapshot()])
+        assert set(merged["channels"]) == {"CAN", "DAQ"}
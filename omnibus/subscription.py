@@ -0,0 +1,123 @@
+"""
+The channels a receiver listens to.
+
+Receivers are given channels in three forms:
+
+    "CAN/Parsley": every channel starting with this, as ZeroMQ subscriptions work
+    Exact("CAN/Parsley"): only this channel
+    "CAN/*/Status": channels matching a glob, where * matches anything but /,
+        ** matches anything and ? matches any one character but /
+
+ZeroMQ only filters by prefix, so receivers subscribe to the longest prefix
+each channel has in common with everything it matches and then check the
+channels of the messages which arrive, before unpacking any of them.
+
+Channels starting with RESERVED are ones the server sends itself, like its
+statistics and decimated virtual channels, and are only received by
+receivers given a channel starting with RESERVED. So a receiver listening to
+"" (like the global logger) gets every message sources send, but not these.
+"""
+
+import re
+
+GLOB_CHARS = "*?"
+MAX_CACHED = 10000  # channels whose match results are remembered
+RESERVED = "_omnibus/"  # the prefix of channels the server sends on
+RESERVED_RAW = RESERVED.encode("utf-8")
+
+
+class Exact(str):
+    """
+    A channel to receive messages on exactly, rather than on every channel
+    starting with it.
+    """
+
+
+def is_glob(channel: str):
+    return not isinstance(channel, Exact) and any(c in channel for c in GLOB_CHARS)
+
+
+def prefix(channel: str):
+    """
+    Return the prefix to subscribe to for a channel given to a receiver.
+    """
+    if is_glob(channel):
+        return re.split(r"[*?]", channel, 1)[0]
+    return str(channel)
+
+
+def _translate(pattern: str):
+    """
+    Return a regular expression matching the same channels as a glob.
+    """
+    regex = []
+    for part in re.split(r"(\*\*|\*|\?)", pattern):
+        if part == "**":
+            regex.append(".*")
+        elif part == "*":
+            regex.append("[^/]*")
+        elif part == "?":
+            regex.append("[^/]")
+        else:
+            regex.append(re.escape(part))
+    return "".join(regex)
+
+
+def is_reserved(channel: str):
+    return channel.startswith(RESERVED)
+
+
+class Patterns:
+    """
+    The prefixes, exact channels and globs among some channels given to a
+    receiver, which raw channels can be matched against.
+    """
+
+    def __init__(self, channels):
+        self.prefixes = tuple(c.encode("utf-8") for c in channels
+                              if not isinstance(c, Exact) and not is_glob(c))
+        self.exact = {c.encode("utf-8") for c in channels if isinstance(c, Exact)}
+        globs = [_translate(c) for c in channels if is_glob(c)]
+        self.glob = re.compile("|".join(f"(?:{glob})" for glob in globs)) if globs else None
+
+    def match(self, raw: bytes):
+        if raw.startswith(self.prefixes) or raw in self.exact:
+            return True
+        return self.glob is not None and self.glob.fullmatch(raw.decode("utf-8")) is not None
+
+
+class Matcher:
+    """
+    Decides whether messages on a raw channel are ones a receiver asked for.
+    """
+
+    def __init__(self, channels):
+        self.patterns = Patterns([c for c in channels if not is_reserved(c)])
+        self.reserved = Patterns([c for c in channels if is_reserved(c)])
+        self.cache = {}
+
+    def _match(self, raw: bytes):
+        if raw.startswith(RESERVED_RAW):
+            return self.reserved.match(raw)
+        return self.patterns.match(raw)
+
+    def __call__(self, raw: bytes):
+        if (matched := self.cache.get(raw)) is None:
+            if len(self.cache) >= MAX_CACHED:
+                self.cache.clear()
+            matched = self.cache[raw] = self._match(raw)
+        return matched
+
+
+def compile_channels(channels):
+    """
+    Return the prefixes to subscribe to for some channels given to a receiver,
+    and a Matcher for the messages which arrive, or None if every message
+    matching the prefixes is wanted.
+    """
+    prefixes = sorted({prefix(channel) for channel in channels})
+    # prefixes like "" also match reserved channels, which have to be filtered out
+    if all(not isinstance(c, Exact) and not is_glob(c)
+           and (is_reserved(c) or not RESERVED.startswith(c)) for c in channels):
+        return prefixes, None
+    return prefixes, Matcher(channels)
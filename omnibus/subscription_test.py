@@ -0,0 +1,64 @@
+import pytest
+
+from omnibus.subscription import Exact, Matcher, compile_channels, prefix
+
+
+class TestPrefix:
+    @pytest.mark.parametrize("channel, expected", [
+        ("CAN/Parsley", "CAN/Parsley"),
+        (Exact("CAN/*"), "CAN/*"),
+        ("CAN/*/Status", "CAN/"),
+        ("CAN/Pars?ey", "CAN/Pars"),
+        ("**", ""),
+    ])
+    def test_prefix(self, channel, expected):
+        assert prefix(channel) == expected
+
+
+class TestMatcher:
+    @pytest.mark.parametrize("channel, matches, others", [
+        ("CAN", ["CAN", "CAN/A", "CANX"], ["DAQ"]),
+        (Exact("CAN/A"), ["CAN/A"], ["CAN/AB", "CAN", "CAN/A/B"]),
+        ("CAN/*/Status", ["CAN/A/Status", "CAN//Status"], ["CAN/A/B/Status", "CAN/A/StatusX"]),
+        ("CAN/**/Status", ["CAN/A/Status", "CAN/A/B/Status"], ["CAN/A/StatusX"]),
+        ("CAN/?", ["CAN/A"], ["CAN/AB", "CAN//"]),
+        ("DAQ.*", ["DAQ.x"], ["DAQxx"]),  # other characters are literal
+    ])
+    def test_match(self, channel, matches, others):
+        matcher = Matcher([channel])
+        for raw in matches:
+            assert matcher(raw.encode())
+        for raw in others:
+            assert not matcher(raw.encode())
+
+    def test_several(self):
+        matcher = Matcher([Exact("A"), "B/*", "C"])
+        assert [matcher(raw) for raw in [b"A", b"AB", b"B/x", b"B/x/y", b"CD"]] == \
+            [True, False, True, False, True]
+
+    def test_reserved(self):
+        matcher = Matcher(["", "**"])
+        assert matcher(b"DAQ")
+        assert not matcher(b"_omnibus/stats")
+        matcher = Matcher(["DAQ", "_omnibus/stats"])
+        assert matcher(b"_omnibus/stats")
+        assert not matcher(b"_omnibus/DAQ@10Hz/Fake")
+        assert Matcher(["_omnibus/**"])(b"_omnibus/DAQ@10Hz/Fake")
+
+
+class TestCompile:
+    def test_prefixes(self):
+        assert compile_channels(["CAN", "DAQ", "CAN"]) == (["CAN", "DAQ"], None)
+        assert compile_channels(["_omnibus/stats"]) == (["_omnibus/stats"], None)
+
+    def test_reserved(self):
+        # "" would otherwise receive the server's own channels too
+        prefixes, matcher = compile_channels([""])
+        assert prefixes == [""]
+        assert matcher(b"CAN") and not matcher(b"_omnibus/stats")
+
+    def test_patterns(self):
+        prefixes, matcher = compile_channels(["CAN/*/Status", Exact("DAQ")])
+        assert prefixes == ["CAN/", "DAQ"]
+        assert matcher(b"CAN/A/Status")
+        assert not matcher(b"CAN/A")
@@ -1 +1,3 @@
 from .tick_counter import TickCounter
+from .line_reader import LineReader
+from .console import Console
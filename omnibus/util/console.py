@@ -0,0 +1,133 @@
+import queue
+import sys
+import threading
+import time
+
+QUEUE_SIZE = 10000  # items waiting to be printed before new ones are dropped
+REFRESH_RATE = 4  # times per second the summary is redrawn
+CLOSE_TIMEOUT = 5  # seconds close waits for the queue to be printed
+
+
+class Console:
+    """
+    Console prints what a source is doing from a background thread, so a slow
+    terminal never holds up sending. Items are put on a bounded queue and
+    dropped (and counted) if the terminal can't keep up.
+
+    Without key, each item is printed as a line by fmt. With key, the terminal
+    instead shows a summary redrawn refresh times a second: a row for each
+    value of key(item), with the number of items seen and the latest one
+    formatted by fmt.
+
+    Items which fmt or key raise on are reported, and counted in errors,
+    instead of stopping the thread.
+    """
+
+    def __init__(self, fmt, key=None, refresh=REFRESH_RATE, maxsize=QUEUE_SIZE, out=None):
+        self.fmt = fmt
+        self.key = key
+        self.interval = 1 / refresh
+        self.out = out or sys.stdout
+        self.queue = queue.Queue(maxsize)
+        self.dropped = 0
+        self.errors = 0
+        self.error = None  # the latest exception raised by fmt or key
+        self.counts = {}  # key: number of items
+        self.latest = {}  # key: the latest item
+        self.total = 0
+        self.started = time.monotonic()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    # called by the sending thread, never blocks
+    def put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    # print everything still queued and stop the thread, giving up after timeout seconds
+    def close(self, timeout=CLOSE_TIMEOUT):
+        if not self.thread.is_alive():
+            return
+        try:
+            # waits for room rather than being dropped
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self.thread.join(timeout)
+
+    def _format(self, item, count=True):
+        """
+        Return fmt(item), or the exception it raised as text.
+        """
+        try:
+            return self.fmt(item)
+        except Exception as e:
+            if count:
+                self.errors += 1
+                self.error = e
+            return f"... could not print {item!r}: {e!r}"
+
+    def _drain(self):
+        """
+        Return everything queued, waiting up to the refresh interval for the first.
+        """
+        try:
+            items = [self.queue.get(timeout=self.interval)]
+        except queue.Empty:
+            return []
+        try:
+            while True:
+                items.append(self.queue.get_nowait())
+        except queue.Empty:
+            return items
+
+    def _run(self):
+        drawn = 0
+        dropped = 0
+        while True:
+            items = self._drain()
+            closing = None in items
+            items = [item for item in items if item is not None]
+            if self.key is None:
+                lines = [self._format(item) for item in items]
+                if self.dropped > dropped:
+                    lines.append(f"... {self.dropped - dropped} lines not printed to keep up")
+                    dropped = self.dropped
+                if lines:
+                    # one write for the whole batch
+                    self.out.write("\n".join(lines) + "\n")
+                    self.out.flush()
+            else:
+                for item in items:
+                    try:
+                        key = self.key(item)
+                    except Exception as e:
+                        self.errors += 1
+                        self.error = e
+                        continue
+                    self.counts[key] = self.counts.get(key, 0) + 1
+                    self.latest[key] = item
+                self.total += len(items)
+                if closing or time.monotonic() - drawn >= self.interval:
+                    # clear the terminal and redraw from the top left
+                    self.out.write("\033[2J\033[H" + self.summary() + "\n")
+                    self.out.flush()
+                    drawn = time.monotonic()
+            if closing:
+                return
+
+    def summary(self):
+        """
+        Return the summary view as text.
+        """
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        lines = [f"{self.total} messages, {self.total / elapsed:.1f}/s"
+                 + (f", {self.dropped} not shown to keep up" if self.dropped else "")
+                 + (f", {self.errors} errors (latest: {self.error!r})" if self.errors else "")]
+        width = max([len(str(key)) for key in self.counts] + [0])
+        for key in sorted(self.counts, key=str):
+            latest = self._format(self.latest[key], count=False)
+            lines.append(f"{str(key):<{width}} {self.counts[key]:>8}  {latest}")
+        return "\n".join(lines)
@@ -0,0 +1,86 @@
+import io
+import threading
+
+import pytest
+
+from omnibus.util import Console
+
+
+class BlockingOutput(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writing = threading.Event()
+        self.unblocked = threading.Event()
+
+    def write(self, s):
+        self.writing.set()
+        self.unblocked.wait()
+        return super().write(s)
+
+
+class TestConsole():
+    def test_lines(self):
+        out = io.StringIO()
+        c = Console(str, out=out)
+        for i in range(3):
+            c.put(i)
+        c.close()
+        assert out.getvalue() == "0\n1\n2\n"
+
+    def test_dropped(self):
+        out = BlockingOutput()
+        c = Console(str, maxsize=2, out=out)
+        c.put("first")
+        out.writing.wait()  # the thread is stuck writing it
+        for i in range(5):
+            c.put(i)  # never blocks
+        assert c.dropped == 3
+        out.unblocked.set()
+        c.close()
+        assert out.getvalue() == "first\n0\n1\n... 3 lines not printed to keep up\n"
+
+    def test_summary(self):
+        out = io.StringIO()
+        c = Console(lambda item: f"value: {item[1]}", key=lambda item: item[0], out=out)
+        for item in [("B", 1), ("A", 2), ("B", 3)]:
+            c.put(item)
+        c.close()
+        summary = out.getvalue().split("\033[H")[-1]
+        lines = summary.splitlines()
+        assert lines[0].startswith("3 messages")
+        assert lines[1:] == ["A        1  value: 2", "B        2  value: 3"]
+
+    def test_fmt_raises(self):
+        out = io.StringIO()
+        c = Console(lambda item: str(1 / item), out=out)
+        for i in [1, 0, 2]:
+            c.put(i)
+        c.close()
+        lines = out.getvalue().splitlines()
+        assert lines[0] == "1.0"
+        assert lines[1].startswith("... could not print 0: ZeroDivisionError")
+        assert lines[2] == "0.5"
+        assert c.errors == 1
+
+    def test_key_raises(self):
+        out = io.StringIO()
+        c = Console(str, key=lambda item: 1 / item, out=out)
+        for i in [1, 0, 2]:
+            c.put(i)
+        c.close()
+        lines = out.getvalue().split("\033[H")[-1].splitlines()
+        assert "1 errors (latest: ZeroDivisionError" in lines[0]
+        assert lines[1:] == ["0.5        1  2", "1.0        1  1"]
+
+    @pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+    def test_thread_died(self):
+        class BrokenOutput(io.StringIO):
+            def write(self, s):
+                raise OSError("terminal gone")
+
+        c = Console(str, maxsize=2, out=BrokenOutput())
+        c.put("first")
+        c.thread.join(1)
+        for i in range(3):
+            c.put(i)  # fills the queue which nothing is emptying
+        c.close(timeout=0.5)  # returns rather than waiting for room forever
@@ -0,0 +1,58 @@
+CHUNK_SIZE = 64 * 1024  # most bytes read at once
+MAX_LINE = 4096  # longest line kept, anything longer is garbage from a noisy port
+
+
+class LineReader:
+    """
+    LineReader splits the bytes from a stream into lines itself, so that
+    whatever has arrived can be read in one call rather than a call per line
+    (or per byte, as serial.Serial.readline does).
+
+    read is called with the most bytes to return, and should block until some
+    are available, returning b"" at the end of the stream. Lines are yielded
+    as bytes without their line ending.
+    """
+
+    def __init__(self, read, chunk_size=CHUNK_SIZE, max_line=MAX_LINE):
+        self.read = read
+        self.chunk_size = chunk_size
+        self.max_line = max_line
+        self.buffer = b""  # the start of a line which hasn't finished arriving
+        self.dropped = 0  # lines thrown away for being too long
+        self.dropping = False  # whether the rest of the current line is being thrown away
+
+    # all the lines which a single read finishes, or [] at the end of the stream
+    def readlines(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                # the last line might not have had a line ending
+                lines = [self.buffer.rstrip(b"\r")] if self.buffer else []
+                self.buffer = b""
+                return lines
+            *lines, self.buffer = (self.buffer + chunk).split(b"\n")
+            if self.dropping and lines:
+                # the line we were throwing away has ended
+                lines.pop(0)
+                self.dropping = False
+            if len(self.buffer) > self.max_line:
+                self.buffer = b""
+                if not self.dropping:
+                    self.dropped += 1
+                self.dropping = True
+            if lines:
+                return [line.rstrip(b"\r") for line in lines]
+
+    def __iter__(self):
+        while lines := self.readlines():
+            yield from lines
+
+
+def serial_reader(port):
+    """
+    Return a read function for LineReader which reads whatever has arrived
+    on a serial.Serial port, waiting for at least one byte.
+    """
+    def read(size):
+        return port.read(min(max(port.in_waiting, 1), size))
+    return read
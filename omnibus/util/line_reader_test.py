@@ -0,0 +1,38 @@
+import io
+
+from omnibus.util import LineReader
+from omnibus.util.line_reader import serial_reader
+
+
+class TestLineReader():
+    def test_nominal(self):
+        r = LineReader(io.BytesIO(b"a\r\nb\nc").read1)
+        assert list(r) == [b"a", b"b", b"c"]
+
+    def test_split_chunks(self):
+        chunks = [b"ab", b"c\nd", b"e"]
+        r = LineReader(lambda size: chunks.pop(0) if chunks else b"")
+        assert r.readlines() == [b"abc"]
+        assert r.readlines() == [b"de"]  # the end of the stream ends the line too
+        assert r.readlines() == []
+
+    def test_many_lines(self):
+        r = LineReader(io.BytesIO(b"1\n2\n3\n").read1)
+        assert r.readlines() == [b"1", b"2", b"3"]
+
+    def test_too_long(self):
+        r = LineReader(io.BytesIO(b"x" * 100 + b"\nok\n").read1, chunk_size=10, max_line=50)
+        assert list(r) == [b"ok"]
+        assert r.dropped == 1
+
+    def test_serial_reader(self):
+        class Port:
+            in_waiting = 0
+
+            def read(self, size):
+                return b"x" * size
+        port = Port()
+        read = serial_reader(port)
+        assert read(100) == b"x"
+        port.in_waiting = 1000
+        assert read(100) == b"x" * 100
@@ -0,0 +1,524 @@
+"""
+Encoding and decoding of messages as they are sent over the wire.
+
+A message is sent as two frames: the channel, so that ZeroMQ can filter on it,
+followed by an envelope holding one or more records. Each record is a fixed
+size header followed by the msgpack encoded payload:
+
+    version (u8) | flags (u8) | timestamp (f64) | payload length (u32) | payload
+
+Several records in one envelope are a batch of messages on the same channel.
+Flags mark records which need special treatment by receivers:
+
+    FLAG_REPLAY: replayed from the server's cache rather than sent live
+    FLAG_SHM: the payload holds arrays in shared memory (see shm.py)
+    FLAG_COMPRESSED: the payload is a codec id (u8) followed by the compressed
+        msgpack data (see compression.py)
+    FLAG_ORIGIN: the payload is preceded by the route of the message, the
+        names of the servers bridges have forwarded it from, starting with the
+        one it was first sent to, as a length (u8) and then the names
+        separated by zero bytes, which bridges use to avoid sending messages
+        round in loops (see bridge.py)
+    FLAG_STAMPED: the payload is preceded by the times the server received
+        and forwarded the message, as two f64s (see latency.py)
+    FLAG_SEQUENCE: the payload is preceded by the id of the sender (u32) and
+        the number of messages it had sent on the channel before (u32), which
+        receivers use to notice dropped messages (see sequence.py)
+
+When several sections precede the payload they are in the order stamp,
+route, sequence, codec id.
+
+Older senders used three frames, [channel, timestamp, payload] with the
+timestamp and payload packed separately, or [channel, BATCH_MARKER, payload]
+where the payload is a packed list of [timestamp, payload] pairs. Both are
+still understood by decode.
+
+NumPy arrays in payloads are packed as a msgpack extension type holding their
+dtype, shape and raw bytes, and are unpacked as read-only arrays which are
+views of the unpacked bytes rather than lists of numbers. Arrays in shared
+memory are packed as another extension type holding the same header followed
+by a descriptor of where in shared memory to find the data.
+"""
+
+import struct
+
+import msgpack
+
+try:
+    from . import compression, shm
+except ImportError:
+    # see omnibus.py
+    import compression
+    import shm
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is only needed by components which send or receive arrays
+    np = None
+
+VERSION = 1
+HEADER = struct.Struct("<BBdI")
+
+FLAG_REPLAY = 0x01
+FLAG_SHM = 0x02
+FLAG_COMPRESSED = 0x04
+FLAG_ORIGIN = 0x08
+FLAG_STAMPED = 0x10
+FLAG_SEQUENCE = 0x20
+
+ORIGIN_LENGTH = struct.Struct("<B")
+ROUTE_SEPARATOR = b"\0"
+STAMP = struct.Struct("<dd")
+SEQUENCE = struct.Struct("<II")
+
+EXT_NDARRAY = 1
+EXT_SHM_NDARRAY = 2
+# dtype string length (u8), dtype string, number of dimensions (u8), then a u32 per dimension
+NDARRAY_HEADER = struct.Struct("<B")
+NDARRAY_DIM = struct.Struct("<I")
+
+# msgpack's marker for an array of three items, which log entries are
+LOG_ENTRY = b"\x93"
+
+# 0xc1 is never used by msgpack, so receivers expecting a packed timestamp in
+# the second frame fail loudly instead of misreading a legacy batch.
+BATCH_MARKER = b"\xc1"
+
+
+def _ndarray_header(obj):
+    if obj.dtype.hasobject:
+        raise TypeError("Cannot serialize arrays of Python objects")
+    dtype = obj.dtype.str.encode("ascii")
+    header = [NDARRAY_HEADER.pack(len(dtype)), dtype, NDARRAY_HEADER.pack(obj.ndim)]
+    header += [NDARRAY_DIM.pack(dim) for dim in obj.shape]
+    return b"".join(header)
+
+
+def _unpack_ndarray_header(data):
+    """
+    Return the dtype and shape from an array's header and the offset of the end of it.
+    """
+    dtype_len, = NDARRAY_HEADER.unpack_from(data, 0)
+    offset = NDARRAY_HEADER.size
+    dtype = np.dtype(bytes(data[offset:offset + dtype_len]).decode("ascii"))
+    offset += dtype_len
+    ndim, = NDARRAY_HEADER.unpack_from(data, offset)
+    offset += NDARRAY_HEADER.size
+    shape = tuple(NDARRAY_DIM.unpack_from(data, offset + NDARRAY_DIM.size * i)[0]
+                  for i in range(ndim))
+    return dtype, shape, offset + NDARRAY_DIM.size * ndim
+
+
+def default(obj):
+    """
+    Pack objects msgpack doesn't natively support, for use as msgpack's default.
+    """
+    if np is not None and isinstance(obj, np.ndarray):
+        return msgpack.ExtType(EXT_NDARRAY, _ndarray_header(obj) + obj.tobytes())
+    if np is not None and isinstance(obj, np.generic):
+        return obj.item()  # numpy scalars, eg. the result of np.mean
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+
+def shm_default(ring):
+    """
+    Return a version of default which writes large arrays into a shm.Ring.
+    """
+    def _default(obj):
+        if np is not None and isinstance(obj, np.ndarray) and obj.nbytes >= shm.SHM_MIN_BYTES:
+            header = _ndarray_header(obj)  # checks the array can be serialized before writing it
+            # C order, like tobytes, without copying arrays which already are
+            descriptor = ring.write(np.ascontiguousarray(obj).reshape(-1).view(np.uint8))
+            return msgpack.ExtType(EXT_SHM_NDARRAY, header + descriptor)
+        return default(obj)
+    return _default
+
+
+def ext_hook(code, data):
+    """
+    Unpack extension types produced by default, for use as msgpack's ext_hook.
+    """
+    if code == EXT_NDARRAY and np is not None:
+        dtype, shape, offset = _unpack_ndarray_header(data)
+        # frombuffer doesn't copy, the array is a read-only view of data
+        return np.frombuffer(data, dtype, offset=offset).reshape(shape)
+    if code == EXT_SHM_NDARRAY and np is not None:
+        dtype, shape, offset = _unpack_ndarray_header(data)
+        buf, _ = shm.read(data, offset)
+        if buf is None:
+            return None
+        # a read-only view of the copy of the shared memory
+        return np.frombuffer(buf, dtype).reshape(shape)
+    return msgpack.ExtType(code, data)
+
+
+def packb(obj):
+    """
+    Pack an object with msgpack, supporting the same types as messages do.
+    """
+    return msgpack.packb(obj, default=default)
+
+
+def unpackb(data):
+    """
+    Unpack an object packed by packb.
+    """
+    return msgpack.unpackb(data, ext_hook=ext_hook)
+
+
+def unpacker(file_like=None):
+    """
+    Return a msgpack.Unpacker which understands the same types as messages do,
+    for reading logs of concatenated packed objects.
+    """
+    return msgpack.Unpacker(file_like, ext_hook=ext_hook)
+
+
+def new_packer(ring=None):
+    """
+    Return a msgpack.Packer suitable for passing to encode. If a shm.Ring is
+    given, large arrays are written to it instead of being packed.
+    """
+    return msgpack.Packer(default=default if ring is None else shm_default(ring))
+
+
+def encode(packer, timestamp, payload, flags=0, codec=None, min_bytes=compression.MIN_BYTES,
+           sequence=None):
+    """
+    Encode a single record using a packer from new_packer, which should be
+    reused between calls to avoid setting up a new one for every message.
+
+    If a compression.Codec is given, packed payloads of at least min_bytes are
+    compressed with it, unless that doesn't make them any smaller. If a
+    (sender id, sequence number) is given the record is marked with it.
+    """
+    return encode_packed(timestamp, packer.pack(payload), flags, codec, min_bytes, sequence)
+
+
+def encode_packed(timestamp, data, flags=0, codec=None, min_bytes=compression.MIN_BYTES,
+                  sequence=None):
+    """
+    Encode a single record from a payload which has already been packed, such
+    as the raw payload of a received message, in the same way as encode.
+    """
+    compressed, data = _compress(data, codec, min_bytes)
+    if sequence is None:
+        return HEADER.pack(VERSION, flags | compressed, timestamp, len(data)) + data
+    return HEADER.pack(VERSION, flags | compressed | FLAG_SEQUENCE, timestamp,
+                       SEQUENCE.size + len(data)) + SEQUENCE.pack(*sequence) + data
+
+
+def _compress(data, codec, min_bytes):
+    """
+    Return the flags to add to a record and its possibly compressed data.
+    """
+    if codec is not None and len(data) >= min_bytes:
+        compressed = codec.compress(data)
+        if len(compressed) + 1 < len(data):
+            return FLAG_COMPRESSED, bytes((codec.id,)) + compressed
+    return 0, data
+
+
+def _split_stamp(flags, body):
+    """
+    Return the server's (ingress, egress) stamp of a record, or None, and the
+    rest of its body.
+    """
+    if not flags & FLAG_STAMPED:
+        return None, body
+    return STAMP.unpack_from(body), body[STAMP.size:]
+
+
+def _split_origin(flags, body):
+    """
+    Return the route of a record, as the raw section, or None, and the rest
+    of its body.
+    """
+    _, body = _split_stamp(flags, body)
+    if not flags & FLAG_ORIGIN:
+        return None, body
+    length = body[0]
+    return bytes(body[1:1 + length]), body[1 + length:]
+
+
+def _split_sequence(flags, body):
+    """
+    Return the (sender id, sequence number) of a record, or None, and its
+    payload data.
+    """
+    _, body = _split_origin(flags, body)
+    if not flags & FLAG_SEQUENCE:
+        return None, body
+    return SEQUENCE.unpack_from(body), body[SEQUENCE.size:]
+
+
+def _unpack_payload(body, flags):
+    _, data = _split_sequence(flags, body)
+    return unpack_payload(flags, data)
+
+
+def packed_payload(flags, data):
+    """
+    Return the packed payload of a record from records, decompressing it if needed.
+    """
+    if flags & FLAG_COMPRESSED:
+        return compression.decompress(data[0], data[1:])
+    return data
+
+
+def unpack_payload(flags, data):
+    """
+    Unpack the payload of a record from records.
+    """
+    return unpackb(packed_payload(flags, data))
+
+
+def iter_records(envelope):
+    """
+    Yield the flags, timestamp and body of each record in an envelope, where
+    the body is everything after the header, without decoding them.
+    """
+    view = memoryview(envelope)
+    offset = 0
+    while offset < len(view):
+        version, flags, timestamp, length = HEADER.unpack_from(view, offset)
+        if version != VERSION:
+            raise ValueError(f"Unsupported envelope version {version}")
+        start = offset + HEADER.size
+        offset = start + length
+        yield flags, timestamp, view[start:offset]
+
+
+def records(envelope):
+    """
+    Return the flags, timestamp, (sender id, sequence number) or None and
+    payload data of each record in an envelope without unpacking them, where
+    the data is the packed payload (still compressed if the record is) for
+    unpack_payload or packed_payload.
+    """
+    return [(flags, timestamp, *_split_sequence(flags, body))
+            for flags, timestamp, body in iter_records(envelope)]
+
+
+def pack_log_entry(channel: str, timestamp, raw):
+    """
+    Pack a [channel, timestamp, payload] log entry, as written by globallog and
+    read with unpacker, from a payload which has already been packed.
+    """
+    return LOG_ENTRY + packb(channel) + packb(timestamp) + raw
+
+
+def pack_record(flags, timestamp, body):
+    """
+    Build a record from the parts yielded by iter_records.
+    """
+    return HEADER.pack(VERSION, flags, timestamp, len(body)) + body
+
+
+def route(flags, body):
+    """
+    Return the names of the servers a record from iter_records has been
+    forwarded from by bridges, starting with the one it was first sent to.
+    """
+    names, _ = _split_origin(flags, body)
+    return [] if names is None else names.split(ROUTE_SEPARATOR)
+
+
+def origin(flags, body):
+    """
+    Return the name of the server a record from iter_records was first sent
+    to, if it has been forwarded by a bridge, or None.
+    """
+    names, _ = _split_origin(flags, body)
+    return None if names is None else names.split(ROUTE_SEPARATOR, 1)[0]
+
+
+def _set_route(flags, body, names: bytes):
+    if len(names) > 255:
+        raise ValueError(f"Route {names} is too long to send")
+    stamp = body[:STAMP.size] if flags & FLAG_STAMPED else b""
+    _, rest = _split_origin(flags, body)
+    return flags | FLAG_ORIGIN, bytes(stamp) + ORIGIN_LENGTH.pack(len(names)) + names + rest
+
+
+def add_to_route(flags, body, name: bytes):
+    """
+    Return the flags and body of a record from iter_records with a server
+    added to the end of its route. Raises ValueError if the route would be
+    too long.
+    """
+    names, _ = _split_origin(flags, body)
+    return _set_route(flags, body, name if names is None else names + ROUTE_SEPARATOR + name)
+
+
+def stamp_record(flags, body, ingress, egress):
+    """
+    Return the flags and body of a record from iter_records stamped with the
+    times the server received and forwarded it, replacing any earlier stamp.
+    """
+    _, body = _split_stamp(flags, body)
+    return flags | FLAG_STAMPED, STAMP.pack(ingress, egress) + body
+
+
+def strip_stamp(flags, body):
+    """
+    Return the flags and body of a record from iter_records without its stamp.
+    """
+    return flags & ~FLAG_STAMPED, _split_stamp(flags, body)[1]
+
+
+def stamp(envelope, ingress, egress):
+    """
+    Return a copy of an envelope with each record stamped as by stamp_record.
+    """
+    records = []
+    for flags, timestamp, body in iter_records(envelope):
+        flags, body = stamp_record(flags, body, ingress, egress)
+        records.append(pack_record(flags, timestamp, body))
+    return b"".join(records)
+
+
+def stamps(envelope):
+    """
+    Yield the flags, timestamp and server stamp (or None) of each record in an
+    envelope, without unpacking their payloads.
+    """
+    for flags, timestamp, body in iter_records(envelope):
+        yield flags, timestamp, _split_stamp(flags, body)[0]
+
+
+def compress_record(flags, body, codec, min_bytes=compression.MIN_BYTES):
+    """
+    Return the flags and body of a record from iter_records compressed as
+    encode would have, if it isn't already.
+    """
+    if flags & (FLAG_COMPRESSED | FLAG_SHM):
+        return flags, body
+    _, data = _split_sequence(flags, body)
+    prefix = body[:len(body) - len(data)]  # the stamp, origin and sequence, if there are any
+    compressed, data = _compress(data, codec, min_bytes)
+    if not compressed:
+        return flags, body
+    return flags | compressed, bytes(prefix) + data
+
+
+def flags(frames):
+    """
+    Return the flags of the first record in the frames of a received message.
+    """
+    if len(frames) == 3:
+        return 0
+    return frames[1][1]
+
+
+def any_flags(envelope, flags):
+    """
+    Return whether any record in an envelope has any of flags set.
+    """
+    offset = 0
+    while offset < len(envelope):
+        if envelope[offset + 1] & flags:
+            return True
+        offset += HEADER.size + HEADER.unpack_from(envelope, offset)[3]
+    return False
+
+
+def add_flags(envelope, flags):
+    """
+    Return a copy of an envelope with flags set on each of its records.
+    """
+    envelope = bytearray(envelope)
+    offset = 0
+    while offset < len(envelope):
+        envelope[offset + 1] |= flags
+        offset += HEADER.size + HEADER.unpack_from(envelope, offset)[3]
+    return bytes(envelope)
+
+
+def resolve(envelope, packer):
+    """
+    Return a copy of an envelope where records flagged with FLAG_SHM have their
+    arrays in shared memory packed inline, for receivers on other machines.
+    """
+    records = []
+    resolved = False
+    for flags, timestamp, body in iter_records(envelope):
+        if flags & FLAG_SHM:
+            data = packer.pack(_unpack_payload(body, flags))
+            # left uncompressed, since we don't know which codec the sender would have used
+            new_flags = flags & ~(FLAG_SHM | FLAG_COMPRESSED | FLAG_ORIGIN | FLAG_STAMPED
+                                  | FLAG_SEQUENCE)
+            if (sequence := _split_sequence(flags, body)[0]) is not None:
+                new_flags |= FLAG_SEQUENCE
+                data = SEQUENCE.pack(*sequence) + data
+            if (names := _split_origin(flags, body)[0]) is not None:
+                new_flags, data = _set_route(new_flags, data, names)
+            if (server_stamp := _split_stamp(flags, body)[0]) is not None:
+                new_flags, data = stamp_record(new_flags, data, *server_stamp)
+            records.append(pack_record(new_flags, timestamp, data))
+            resolved = True
+        else:
+            records.append(pack_record(flags, timestamp, body))
+    # avoid copying envelopes which don't use shared memory
+    return b"".join(records) if resolved else envelope
+
+
+def measure(frames):
+    """
+    Return the number of messages in the frames of a received message and the
+    total size of their payloads, without unpacking them. Frames which can't
+    be read are counted as one message the size of the envelope, if any.
+    """
+    if len(frames) == 3:
+        return 1, len(frames[2])
+    if len(frames) < 2:
+        return 1, 0
+    envelope = frames[1]
+    count = 0
+    size = 0
+    offset = 0
+    try:
+        while offset < len(envelope):
+            _, flags, _, length = HEADER.unpack_from(envelope, offset)
+            offset += HEADER.size
+            # the sections before the payload don't count towards its size
+            sections = 0
+            if flags & FLAG_STAMPED:
+                sections += STAMP.size
+            if flags & FLAG_ORIGIN:
+                sections += ORIGIN_LENGTH.size + envelope[offset + sections]
+            if flags & FLAG_SEQUENCE:
+                sections += SEQUENCE.size
+            if sections > length:
+                raise ValueError(f"Record of {length} bytes is too short for its flags")
+            offset += length
+            count += 1
+            size += length - sections
+    except (struct.error, IndexError, ValueError):
+        # not an envelope we can read, so count it as one message of all of it
+        return 1, len(envelope)
+    return count, size
+
+
+def decode(frames):
+    """
+    Decode the frames of a received message into a list of (timestamp, payload)
+    tuples. The channel is left for the caller to decode.
+    """
+    if len(frames) == 3:
+        _, timestamp, payload = frames
+        if timestamp == BATCH_MARKER:
+            return [(t, p) for t, p in unpackb(payload)]
+        return [(unpackb(timestamp), unpackb(payload))]
+
+    envelope = memoryview(frames[1])
+    records = []
+    offset = 0
+    while offset < len(envelope):
+        version, flags, timestamp, length = HEADER.unpack_from(envelope, offset)
+        if version != VERSION:
+            raise ValueError(f"Unsupported envelope version {version}")
+        offset += HEADER.size + length
+        records.append((timestamp, _unpack_payload(envelope[offset - length:offset], flags)))
+    return records
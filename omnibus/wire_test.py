@@ -0,0 +1,173 @@
+import msgpack
+import numpy as np
+import pytest
+
+from omnibus import compression, wire
+
+
+class TestWire:
+    @pytest.fixture
+    def packer(self):
+        return wire.new_packer()
+
+    def test_round_trip(self, packer):
+        frames = [b"CHAN", wire.encode(packer, 12.5, {"a": [1, 2]})]
+        assert wire.decode(frames) == [(12.5, {"a": [1, 2]})]
+
+    def test_batch(self, packer):
+        envelope = b"".join(wire.encode(packer, t, t * 2) for t in range(3))
+        assert wire.decode([b"CHAN", envelope]) == [(0, 0), (1, 2), (2, 4)]
+
+    def test_legacy(self):
+        frames = [b"CHAN", msgpack.packb(10), msgpack.packb("PAYLOAD")]
+        assert wire.decode(frames) == [(10, "PAYLOAD")]
+
+    def test_legacy_batch(self):
+        frames = [b"CHAN", wire.BATCH_MARKER, msgpack.packb([[1, "A"], [2, "B"]])]
+        assert wire.decode(frames) == [(1, "A"), (2, "B")]
+
+    def test_version(self, packer):
+        envelope = bytearray(wire.encode(packer, 0, "PAYLOAD"))
+        envelope[0] = wire.VERSION + 1
+        with pytest.raises(ValueError):
+            wire.decode([b"CHAN", bytes(envelope)])
+
+
+class TestNDArray:
+    @pytest.mark.parametrize("array", [
+        np.arange(20, dtype=np.float64),
+        np.arange(12, dtype=">i2").reshape(3, 4),
+        np.zeros((2, 0, 3), dtype=np.uint8),
+        np.array(1.5, dtype=np.float32),
+    ])
+    def test_round_trip(self, array):
+        res = wire.unpackb(wire.packb({"data": array}))["data"]
+        assert res.dtype == array.dtype
+        assert res.shape == array.shape
+        assert np.array_equal(res, array)
+
+    def test_non_contiguous(self):
+        array = np.arange(20).reshape(4, 5)[:, 1]
+        assert np.array_equal(wire.unpackb(wire.packb(array)), array)
+
+    def test_zero_copy(self):
+        res = wire.unpackb(wire.packb(np.arange(10)))
+        assert res.base is not None
+        assert not res.flags.writeable
+
+    def test_scalar(self):
+        assert wire.unpackb(wire.packb(np.float32(1.5))) == 1.5
+
+    def test_object(self):
+        with pytest.raises(TypeError):
+            wire.packb(np.array([None]))
+
+    def test_envelope(self):
+        frames = [b"DAQ", wire.encode(wire.new_packer(), 0, {"data": {"S": np.ones(5)}})]
+        (_, payload), = wire.decode(frames)
+        assert np.array_equal(payload["data"]["S"], np.ones(5))
+
+    def test_unpacker(self):
+        data = wire.packb([np.ones(3)]) + wire.packb([np.zeros(2)])
+        unpacker = wire.unpacker()
+        unpacker.feed(data)
+        assert [len(a[0]) for a in unpacker] == [3, 2]
+
+
+class TestFlags:
+    def test_add_flags(self):
+        packer = wire.new_packer()
+        envelope = b"".join(wire.encode(packer, t, "A" * t) for t in range(3))
+        flagged = wire.add_flags(envelope, wire.FLAG_REPLAY)
+        assert wire.flags([b"CHAN", envelope]) == 0
+        assert wire.flags([b"CHAN", flagged]) == wire.FLAG_REPLAY
+        # flags don't change the contents
+        assert wire.decode([b"CHAN", flagged]) == wire.decode([b"CHAN", envelope])
+
+    def test_legacy(self):
+        assert wire.flags([b"CHAN", msgpack.packb(10), msgpack.packb("PAYLOAD")]) == 0
+
+
+class TestRecords:
+    def test_route(self):
+        record = wire.encode(wire.new_packer(), 1.5, "A")
+        (flags, timestamp, body), = wire.iter_records(record)
+        assert wire.origin(flags, body) is None
+        assert wire.route(flags, body) == []
+        flags, body = wire.add_to_route(flags, body, b"pad")
+        assert wire.origin(flags, body) == b"pad"
+        flags, body = wire.add_to_route(flags, body, b"control")
+        assert wire.route(flags, body) == [b"pad", b"control"]
+        assert wire.origin(flags, body) == b"pad"
+        assert wire.decode([b"CHAN", wire.pack_record(flags, timestamp, body)]) == [(1.5, "A")]
+        with pytest.raises(ValueError):
+            wire.add_to_route(flags, body, b"x" * 250)
+
+    def test_compress(self):
+        payload = [0.5] * 1000
+        record = wire.encode(wire.new_packer(), 0, payload)
+        (flags, timestamp, body), = wire.iter_records(record)
+        flags, body = wire.add_to_route(flags, body, b"pad")
+        flags, body = wire.compress_record(flags, body, compression.get("zlib"))
+        assert flags & wire.FLAG_COMPRESSED
+        assert wire.origin(flags, body) == b"pad"
+        assert wire.decode([b"CHAN", wire.pack_record(flags, timestamp, body)]) == [(0, payload)]
+
+    def test_stamp(self):
+        envelope = b"".join(wire.encode(wire.new_packer(), t, t) for t in range(2))
+        stamped = wire.stamp(envelope, 10, 11)
+        assert [(t, s) for _, t, s in wire.stamps(stamped)] == [(0, (10, 11)), (1, (10, 11))]
+        assert wire.decode([b"CHAN", stamped]) == [(0, 0), (1, 1)]
+        # restamping replaces the stamp
+        assert [s for _, _, s in wire.stamps(wire.stamp(stamped, 20, 21))] == [(20, 21)] * 2
+
+    def test_stamp_origin(self):
+        record = wire.stamp(wire.encode(wire.new_packer(), 0, "A"), 10, 11)
+        (flags, timestamp, body), = wire.iter_records(record)
+        flags, body = wire.add_to_route(flags, body, b"pad")
+        assert wire.origin(flags, body) == b"pad"
+        stamped = wire.pack_record(flags, timestamp, body)
+        assert [s for _, _, s in wire.stamps(stamped)] == [(10, 11)]
+        flags, body = wire.strip_stamp(flags, body)
+        assert not flags & wire.FLAG_STAMPED
+        assert wire.origin(flags, body) == b"pad"
+        assert wire.decode([b"CHAN", wire.pack_record(flags, timestamp, body)]) == [(0, "A")]
+
+    def test_sequence(self):
+        packer = wire.new_packer()
+        envelope = b"".join(wire.encode(packer, t, t, sequence=(7, t)) for t in range(2))
+        assert [(s, wire.unpack_payload(f, d)) for f, _, s, d in wire.records(envelope)] == \
+            [((7, 0), 0), ((7, 1), 1)]
+        assert wire.decode([b"CHAN", envelope]) == [(0, 0), (1, 1)]
+        assert wire.records(wire.encode(packer, 0, "A"))[0][2] is None
+
+    def test_sequence_sections(self):
+        payload = [0.5] * 1000
+        record = wire.encode(wire.new_packer(), 0, payload, sequence=(7, 3))
+        (flags, timestamp, body), = wire.iter_records(wire.stamp(record, 10, 11))
+        flags, body = wire.add_to_route(flags, body, b"pad")
+        flags, body = wire.compress_record(flags, body, compression.get("zlib"))
+        envelope = wire.pack_record(flags, timestamp, body)
+        (flags, _, number, data), = wire.records(envelope)
+        assert number == (7, 3)
+        assert flags & wire.FLAG_COMPRESSED
+        assert wire.unpack_payload(flags, data) == payload
+        assert [s for _, _, s in wire.stamps(envelope)] == [(10, 11)]
+        assert wire.origin(flags, body) == b"pad"
+
+    def test_measure(self):
+        packer = wire.new_packer()
+        record = wire.encode(packer, 0, "A" * 10, sequence=(7, 3))
+        (flags, timestamp, body), = wire.iter_records(wire.stamp(record, 10, 11))
+        flags, body = wire.add_to_route(flags, body, b"pad")
+        envelope = wire.pack_record(flags, timestamp, body) + wire.encode(packer, 0, "B")
+        assert wire.measure([b"CHAN", envelope]) == (2, len(wire.packb("A" * 10)) + 2)
+
+    @pytest.mark.parametrize("frames, res", [
+        ([b"CHAN", b""], (0, 0)),
+        ([b"CHAN", b"garbage"], (1, 7)),
+        ([b"CHAN", wire.HEADER.pack(wire.VERSION, wire.FLAG_ORIGIN, 0, 0)], (1, wire.HEADER.size)),
+        ([b"CHAN"], (1, 0)),
+    ])
+    def test_measure_unreadable(self, frames, res):
+        assert wire.measure(frames) == res
@@ -2,11 +2,9 @@
 
 from datetime import datetime
 
-import msgpack
+from omnibus import Receiver, wire
 
-from omnibus import Receiver
-
-# Will log all messages passing through bus
+# Will log all messages passing through bus, except the server's own (like _omnibus/stats)
 CHANNEL = ""
 # Retrieves current date and time
 CURTIME = datetime.now().strftime("%Y_%m_%d-%I_%M_%S_%p")
@@ -17,4 +15,5 @@ receiver = Receiver(CHANNEL)
 with open(fname, "wb") as f:
     while True:
         msg = receiver.recv_message()
-        f.write(msgpack.packb([msg.channel, msg.timestamp, msg.payload]))
+        # written from the raw payload, so messages are never unpacked
+        f.write(wire.pack_log_entry(msg.channel, msg.timestamp, msg.raw))
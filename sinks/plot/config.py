@@ -1,5 +1,10 @@
 GRAPH_DURATION = 30  # size of x axis in seconds
 GRAPH_RESOLUTION = 10  # data points per second
+# DAQ data decimated by the server to the resolution we plot at (see omnibus/decimate.py), set to
+# "DAQ" for every message
+DAQ_CHANNEL = f"_omnibus/DAQ@{GRAPH_RESOLUTION}Hz"
 GRAPH_STEP = GRAPH_DURATION / 60  # how often to shift the graphs left in seconds.
 # last n seconds to be accounted for in running average, please don't set it larger than GRAPH_DURATION
 RUNNING_AVG_DURATION = 2
+QUEUE_SIZE = 10000  # messages buffered between frames before the oldest are dropped
+DISCOVERY_QUIET = 0.1  # seconds without new series before the plot layout is decided at startup
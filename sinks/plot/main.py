@@ -1,9 +1,13 @@
-from omnibus import Receiver
+from omnibus import BufferedReceiver
 
+import config
 from parsers import Parser
 from plot import Plotter
 
-receiver = Receiver("")  # subscribe to all channels
+# subscribe to the channels we have parsers for, draining them in the background so bursts
+# don't stall the GUI. replay=True gets the latest message on each channel from the server
+# straight away
+receiver = BufferedReceiver(*Parser.channels(), maxsize=config.QUEUE_SIZE, replay=True)
 
 
 def update():  # gets called every frame
@@ -1,5 +1,11 @@
 from collections import defaultdict
 
+import numpy as np
+
+from omnibus import can
+from sources.parsley import parsley
+
+import config
 from series import Series
 
 
@@ -38,6 +44,13 @@ class Parser:
             if channel.startswith(parser.channel):
                 parser.parse(payload)
 
+    @staticmethod
+    def channels():
+        """
+        Return the channels parsers need messages from.
+        """
+        return sorted({parser.channel for parser in Parser.parsers})
+
     @staticmethod
     def get_series():
         res = []
@@ -48,11 +61,12 @@ class Parser:
 
 class DAQParser(Parser):
     """
-    Parses DAQ messages, returning the average for each sensor in each message
+    Parses DAQ messages, returning the average for each sensor in each message,
+    including those decimated by the server (see config.DAQ_CHANNEL)
     """
 
     def __init__(self):
-        super().__init__("DAQ")
+        super().__init__(config.DAQ_CHANNEL)
         # The unix timestamp of the first message received (so the x axis is reasonable)
         self.start = None
 
@@ -63,7 +77,11 @@ class DAQParser(Parser):
         time = payload["timestamp"] - self.start
 
         for sensor, data in payload["data"].items():
-            self.series[sensor].add(time, sum(data)/len(data))
+            if isinstance(data, dict):  # already averaged by the server
+                self.series[sensor].add(time, data["mean"])
+            else:
+                # data may be a list or a numpy array depending on the source
+                self.series[sensor].add(time, np.mean(data))
 
 
 DAQParser()
@@ -156,3 +174,23 @@ class AnalogSensorParser(ParsleyParser):
 
 
 AnalogSensorParser()
+
+
+class RawParsleyParser(Parser):
+    """
+    Decodes the raw frames the Parsley source sends with --raw, only of the
+    message types there are ParsleyParsers for, and hands them to those parsers.
+    """
+
+    def __init__(self):
+        super().__init__(can.RAW_CHANNEL)
+        self.parsley_parsers = [p for p in Parser.parsers if isinstance(p, ParsleyParser)]
+        self.decoder = parsley.decoder(*{p.msg_type for p in self.parsley_parsers})
+
+    def parse(self, payload):
+        for message in self.decoder.decode_all(payload):
+            for parser in self.parsley_parsers:
+                parser.parse(message)
+
+
+RawParsleyParser()  # after every ParsleyParser
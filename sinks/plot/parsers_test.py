@@ -1,7 +1,11 @@
+import struct
 from collections import defaultdict
 
 import pytest
 
+from omnibus import can
+from sources.parsley import message_types as mt
+
 import parsers
 
 
@@ -31,6 +35,14 @@ class TestDAQParser:
         assert parser.series.get("SENSOR 1").data == [(0, 3)]
         assert parser.series.get("SENSOR 2").data == [(0, 5)]
 
+    def test_decimated(self, parser):
+        payload = {
+            "timestamp": 0,
+            "data": {"SENSOR": {"mean": 3, "min": 1, "max": 6}}
+        }
+        parser.parse(payload)
+        assert parser.series.get("SENSOR").data == [(0, 3)]
+
     def test_multiple(self, parser):
         payload = {
             "timestamp": 00,
@@ -164,3 +176,22 @@ class TestAnalogSensorParser:
         }
         parser.parse(payload)
         assert parser.series.get("CAN Sensor SENSOR").data == [(1, 3)]
+
+
+class TestRawParsleyParser:
+    @pytest.fixture
+    def parser(self, monkeypatch):
+        monkeypatch.setattr(parsers.Parser, "parsers", [])
+        accel = parsers.AccelParser()
+        accel.series = defaultdict(MockSeries)
+        return parsers.RawParsleyParser(), accel
+
+    def test_nominal(self, parser):
+        parser, accel = parser
+        acc = mt.msg_type_hex["SENSOR_ACC"] | mt.board_id_hex["SENSOR"]
+        gyro = mt.msg_type_hex["SENSOR_GYRO"] | mt.board_id_hex["SENSOR"]
+        parser.parse(can.pack_frames([(acc, struct.pack(">Hhhh", 1000, 1, -2, 3)),
+                                      (gyro, struct.pack(">Hhhh", 1000, 4, 5, 6))]))
+        assert accel.series.get("Acceleration (x)").data == [(1, 1)]
+        assert accel.series.get("Acceleration (y)").data == [(1, -2)]
+        assert accel.series.get("Acceleration (z)").data == [(1, 3)]
@@ -23,13 +23,20 @@ class Plotter:
     def __init__(self, callback):
         self.callback = callback  # called every frame to get new data
 
-        # use 1 second of messages to determine which series are available
+        # The server replays the latest message on each channel when we subscribe, so
+        # every available series shows up almost immediately. Stop listening once some
+        # series have been found and no new ones have appeared for a little while, or
+        # after a second at most.
         # note: this is very temporary and will be replaced by dynamic plotter layouts soon
         print("Listening for series...")
-        listen = time.time()
-        while time.time() < listen + 1:
+        limit = time.time() + 1
+        deadline = limit
+        series = []
+        while time.time() < deadline:
             callback()
-        series = Parser.get_series()
+            if len(Parser.get_series()) != len(series):
+                series = Parser.get_series()
+                deadline = min(limit, time.time() + config.DISCOVERY_QUIET)
 
         # try for a square layout
         columns = int(np.ceil(np.sqrt(len(series) + 1)))
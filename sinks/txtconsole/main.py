@@ -1,18 +1,17 @@
 import sys
 
-from omnibus import Receiver
+from omnibus import Exact, Receiver
 
 
 def print_console(channels_filter):
-    receiver = Receiver(CHANNEL)
+    # only the channels asked for are received, rather than filtering the whole bus here
+    receiver = Receiver(*[Exact(channel) for channel in channels_filter])
     print('Filter/Cmd line arguments entered: ')
     print(channels_filter)
     while True:
         msg = receiver.recv_message()
-        if msg.channel in channels_filter:
-            print(msg.payload)
+        print(msg.payload)
 
 
 if __name__ == '__main__':
-    CHANNEL = ""  # all channels
     print_console(sys.argv[1:])
@@ -1,17 +1,16 @@
 # FakeNI - Mimic the output of the NI source with dummy data for testing.
 
-import random
 import time
 
-import msgpack
+import numpy as np
 
-from omnibus import Sender
+from omnibus import Sender, wire
 
 READ_BULK = 200  # mimic how the real NI box samples in bulk for better performance
 SAMPLE_RATE = 10000  # total samples/second
 CHANNELS = 8  # number of analog channels to read from
 
-sender = Sender()
+sender = Sender(skip_unsubscribed=True)  # nothing is sent unless a sink is listening
 CHANNEL = "DAQ/Fake"
 
 now = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())  # 2021-07-12_22-35-08
@@ -21,9 +20,9 @@ with open(f"log_{now}.dat", "wb") as log:
         # send a tuple of when the data was recorded and an array of the data for each channel
         data = {
             "timestamp": start,
-            "data": {f"Fake{i}": [random.random() for _ in range(READ_BULK)] for i in range(CHANNELS)}
+            "data": {f"Fake{i}": np.random.random(READ_BULK) for i in range(CHANNELS)}
         }
 
-        log.write(msgpack.packb(data))
+        log.write(wire.packb(data))
         sender.send(CHANNEL, data)
         time.sleep(max(READ_BULK/SAMPLE_RATE - (time.time() - start), 0))
@@ -2,6 +2,7 @@ from enum import Enum
 import math
 
 import nidaqmx
+import numpy as np
 
 
 class Connection(Enum):
@@ -27,6 +28,12 @@ class Calibration:
         """
         return value
 
+    def calibrate_array(self, values):
+        """
+        Apply the calibration to a sequence of input voltages, returning a numpy array.
+        """
+        return np.fromiter((self.calibrate(v) for v in values), float, len(values))
+
     def __repr__(self):
         return f"x ({self.unit})"
 
@@ -44,6 +51,9 @@ class LinearCalibration(Calibration):
     def calibrate(self, value):
         return self.slope * value + self.offset
 
+    def calibrate_array(self, values):
+        return self.calibrate(np.asarray(values, dtype=float))
+
     def __repr__(self):
         return f"{self.slope}*x + {self.offset} ({self.unit})"
 
@@ -117,5 +127,5 @@ class Sensor:
         """
         res = {}
         for i, sensor in enumerate(Sensor.sensors):
-            res[sensor.name] = [sensor.calibration.calibrate(d) for d in data[i]]
+            res[sensor.name] = sensor.calibration.calibrate_array(data[i])
         return res
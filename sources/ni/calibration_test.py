@@ -1,3 +1,4 @@
+import numpy as np
 import pytest
 
 from calibration import LinearCalibration, ThermistorCalibration
@@ -28,6 +29,12 @@ class TestLinearCalibration:
         assert c.calibrate(-10) == -47
         assert c.calibrate(15) == 78
 
+    def test_array(self):
+        c = LinearCalibration(5, 3, "unit")
+        res = c.calibrate_array([0, -10, 15])
+        assert isinstance(res, np.ndarray)
+        assert list(res) == [3, -47, 78]
+
 
 class TestThermistorCalibration:
     def test_thermistor(self):
@@ -37,3 +44,8 @@ class TestThermistorCalibration:
         assert c.calibrate(2) == pytest.approx(35.9, 0.1)
         assert c.calibrate(3) == pytest.approx(14.9, 0.1)
         assert c.calibrate(4) == pytest.approx(-7, 0.1)
+
+    def test_array(self):
+        c = ThermistorCalibration(10000, 3434, 0.099524)
+        res = c.calibrate_array([0, 1, 2])
+        assert list(res) == [c.calibrate(0), c.calibrate(1), c.calibrate(2)]
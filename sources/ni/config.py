@@ -2,6 +2,11 @@ from calibration import Sensor, Connection, LinearCalibration, ThermistorCalibra
 
 RATE = 1000  # Analog data sample rate
 READ_BULK = 20  # Number of samples to read at once for better performance
+# Bytes of shared memory to pass reads to sinks on this machine through, or None. Only arrays
+# of at least omnibus.shm.SHM_MIN_BYTES go through it, so this needs a READ_BULK of 512 or more
+SHM_SIZE = None
+# Codec to compress data with when sinks are across a slow link, eg. "zlib", or None
+COMPRESSION = None
 
 
 def setup():
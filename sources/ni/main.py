@@ -1,10 +1,9 @@
 import time
 import sys
 
-import msgpack
 import nidaqmx
 
-from omnibus import Sender
+from omnibus import Sender, wire
 import config
 import calibration
 
@@ -25,8 +24,10 @@ if len(system.devices) > 1:
     sys.exit(1)
 print(f"Found device {system.devices[0].product_type}.")
 
-sender = Sender()  # omnibus channel
 CHANNEL = "DAQ"
+# omnibus channel, skipped unless a sink is listening
+sender = Sender(skip_unsubscribed=True, shm_size=config.SHM_SIZE,
+                compress={CHANNEL: config.COMPRESSION})
 
 
 def read_data(ai):
@@ -53,7 +54,7 @@ def read_data(ai):
             }
 
             # we can concatenate msgpack outputs as a backup logging option
-            log.write(msgpack.packb(data))
+            log.write(wire.packb(data))
 
             sender.send(CHANNEL, data)  # send data to omnibus
 
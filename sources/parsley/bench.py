@@ -0,0 +1,61 @@
+# Compare the time parsley.parse takes on each message type with the hand
+# written parsers it replaced:
+#
+#     python sources/parsley/bench.py
+
+import argparse
+import random
+import struct
+import time
+
+import message_types as mt
+import parsley
+
+# typical data for each message type (parse_usb_debug and parse_logger give it as bytes)
+MESSAGES = {
+    "GENERAL_BOARD_STATUS": [0, 0x12, 0x34, mt.board_stat_hex["E_BUS_OVER_VOLTAGE"], 0x30, 0x39],
+    "ACTUATOR_STATUS": [0, 0x12, 0x34, mt.actuator_id_hex["VENT_VALVE"],
+                        mt.actuator_states_hex["ACTUATOR_OPEN"],
+                        mt.actuator_states_hex["ACTUATOR_CLOSED"]],
+    "ALT_ARM_STATUS": [0, 0x12, 0x34, 0x11, 0x30, 0x39, 0x30, 0x39],
+    "SENSOR_TEMP": [0, 0x12, 0x34, 2, *struct.pack(">i", int(21.5 * 2**10))[1:]],
+    "SENSOR_ALTITUDE": [0, 0x12, 0x34, *struct.pack(">i", -1234)],
+    "SENSOR_ACC": list(struct.pack(">Hhhh", 1234, -1, 2, 300)),
+    "SENSOR_ANALOG": [0x12, 0x34, mt.sensor_id_hex["SENSOR_PRESSURE_OX"], 0x30, 0x39],
+    "GPS_LATITUDE": [0, 0x12, 0x34, 48, 12, 0x30, 0x39, ord("N")],
+    "FILL_LVL": [0, 0x12, 0x34, 7, mt.fill_direction_hex["FILLING"]],
+    "DEBUG_PRINTF": list(b"Hello!\0\0"),
+}
+
+
+def measure(fn, args, repeat=9):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for msg_sid, msg_data in args:
+            fn(msg_sid, msg_data)
+        best = min(best, (time.perf_counter() - start) / len(args))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=10000, help='messages per measurement')
+    args = parser.parse_args()
+
+    board = mt.board_id_hex["SENSOR"]
+    mixes = {msg_type: [(mt.msg_type_hex[msg_type] | board, bytes(data))] * args.count
+             for msg_type, data in MESSAGES.items()}
+    everything = [message for mix in mixes.values() for message in mix[:args.count // len(mixes)]]
+    random.shuffle(everything)
+    mixes["all (shuffled)"] = everything
+
+    print(f"{'message type':<22} {'funcs':>9} {'layouts':>9} {'speedup':>8}")
+    for name, mix in mixes.items():
+        funcs = measure(parsley._parse_funcs, mix)
+        layouts = measure(parsley.parse, mix)
+        print(f"{name:<22} {funcs*1e6:>7.2f}us {layouts*1e6:>7.2f}us {funcs/layouts:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,474 @@
+"""
+Bulk decoding of whole RocketCAN logger or USB debug dumps, for after a
+flight, into a NumPy structured array per message type:
+
+    python sources/parsley/bulk.py flight.txt --format logger -o flight.npz
+
+Rather than building a dict per message like parsley.parse, the whole file
+is read into one array of bytes with NumPy (see read_frames), grouped by
+message type and each field of message_types.msg_fields is extracted from a
+whole group at once. Every array has the columns
+
+    index: the line of the file the message was on, to put types back in order
+    board: the name of the board which sent it
+    length: the number of bytes of data the frame had
+    time: the board's timestamp in ms, unwrapped (see unwrap), if it has one
+
+followed by the type's fields as parsley.parse names them. Names are looked up
+as strings, left empty if they aren't in their table, ascii fields are the
+data as a string and rest fields are the raw bytes, padded with zeros.
+GENERAL_BOARD_STATUS arrays have the fields of every status, set only on
+messages with that status. Frames of unknown types, and frames too short for
+the fields of their type (which parse would raise on), are kept in "unknown".
+
+The result is saved as one column per field (see save and load).
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+import message_types as mt
+import parsley
+
+DATA_BYTES = 8  # the most data a CAN frame has
+TIME_BITS = {"u24": 24, "u16": 16}  # timestamp formats and the bits they have before wrapping
+
+_DTYPES = {
+    "u8": np.uint8, "i8": np.int8, "u16": np.uint16, "i16": np.int16,
+    "u24": np.uint32, "i24": np.int32, "u32": np.uint32, "i32": np.int32,
+    "hi4": np.uint8, "lo4": np.uint8, "lo12": np.uint16,
+    "char": "U1", "ascii": f"U{DATA_BYTES}",
+}
+_SIZES = {"u8": 1, "i8": 1, "u16": 2, "i16": 2, "u24": 3, "i24": 3, "u32": 4, "i32": 4}
+# the bytes of data a field of each format needs, from its offset
+_BYTES = {**_SIZES, "hi4": 1, "lo4": 1, "lo12": 2, "char": 1, "ascii": 0, "rest": 0}
+
+CHUNK_BYTES = 1 << 22  # bytes of a dump read at once, to bound the memory used
+_HEX = np.zeros(256, np.uint8)  # the value of each hex digit
+_HEX[np.frombuffer(b"0123456789abcdef", np.uint8)] = np.arange(16)
+_HEX[np.frombuffer(b"ABCDEF", np.uint8)] = np.arange(10, 16)
+
+
+def _is_hex(chars):
+    """
+    Return which characters are hex digits, by comparison as it's much
+    faster than looking each up in a table.
+    """
+    lower = chars | np.uint8(0x20)
+    return ((chars - np.uint8(ord("0"))) <= 9) | ((lower - np.uint8(ord("a"))) <= 5)
+
+
+def _is_whitespace(chars):
+    """
+    Return which characters bytes.split splits on, ie. space and \\t to \\r.
+    """
+    return (chars == ord(" ")) | ((chars - np.uint8(ord("\t"))) <= 4)
+
+
+def _chunks(buffer):
+    """
+    Yield the start and end of pieces of a buffer of about CHUNK_BYTES of whole lines.
+    """
+    start = 0
+    while start < len(buffer):
+        end = buffer.find(b"\n", start + CHUNK_BYTES) + 1 or len(buffer)
+        yield start, end
+        start = end
+
+
+def _lines(chars):
+    """
+    Return the start and end of each line of some characters.
+    """
+    newlines = np.flatnonzero(chars == ord("\n"))
+    starts = np.concatenate([[0], newlines + 1])
+    ends = np.concatenate([newlines, [len(chars)]])
+    if len(chars) == 0 or chars[-1] == ord("\n"):
+        return starts[:-1], ends[:-1]  # there's no line after the last newline
+    return starts, ends
+
+
+def _hex_values(chars, starts, lengths, width):
+    """
+    Return the values of the hex numbers of up to width digits at starts.
+    """
+    value = np.zeros(len(starts), np.int64)
+    for i in range(width):
+        digit = _HEX[chars[np.minimum(starts + i, len(chars) - 1)]]
+        value = np.where(i < lengths, value << 4 | digit, value)
+    return value
+
+
+class _Tokens:
+    """
+    The runs of characters matching a mask, with the line each is on (from
+    the line of each character) and its number on that line, of count lines.
+    """
+
+    def __init__(self, mask, line_of, count):
+        edges = np.diff(mask.view(np.int8), prepend=np.int8(0), append=np.int8(0))
+        self.starts = np.flatnonzero(edges == 1)
+        self.ends = np.flatnonzero(edges == -1)
+        self.lengths = self.ends - self.starts
+        self.lines = line_of[self.starts]
+        self.count = np.bincount(self.lines, minlength=count)  # on each line
+        self.first = np.cumsum(self.count) - self.count  # on each line
+        self.rank = np.arange(len(self.starts)) - self.first[self.lines]
+
+    def on_lines(self, values, rank):
+        """
+        Return values of the token of some rank on each line, or 0 where there isn't one.
+        """
+        if len(values) == 0:
+            return np.zeros(len(self.count), np.int64)
+        position = np.clip(self.first + rank, 0, len(values) - 1)
+        return np.where((rank >= 0) & (rank < self.count), values[position], 0)
+
+    def any(self, mask):
+        """
+        Return whether each line has any tokens matching a mask.
+        """
+        return np.bincount(self.lines[mask], minlength=len(self.count)) > 0
+
+
+def _read_logger(chars, line_of, line_starts, line_ends):
+    """
+    Find the lines of a chunk of a logger dump in the usual format, eg.
+    "00012345 2A1 3: 01 02 FF 00054321", and return which they are, the sid
+    and data length on each line, the (line, byte number, value) of their
+    data, which other lines might be frames and how many certainly aren't.
+    """
+    nonblank = ~_is_whitespace(chars)
+    words = _Tokens(nonblank, line_of, len(line_starts))
+    # the few words with anything but hex digits in them, like "3:"
+    odd = np.flatnonzero(nonblank & ~_is_hex(chars))
+    is_hex = np.ones(len(words.starts), bool)
+    is_hex[np.searchsorted(words.starts, odd, "right") - 1] = False
+    # the sid is the second word and the data the fourth to the second last, as parse_logger has
+    lengths = np.maximum(words.count - 4, 0)
+    usual = ((words.count >= 3) & (lengths <= DATA_BYTES) & (words.on_lines(is_hex, 1) != 0)
+             & (words.on_lines(words.lengths, 1) <= 3))
+    data = (words.rank >= 3) & (words.rank < words.count[words.lines] - 1)
+    usual &= ~words.any(data & ~(is_hex & (words.lengths == 2)))
+    sids = _hex_values(chars, words.on_lines(words.starts, 1), words.on_lines(words.lengths, 1), 3)
+    data &= usual[words.lines]
+    values = _hex_values(chars, words.starts[data], 2, 2)
+    # parse_logger raises on lines of fewer than three words
+    maybe = ~usual & (words.count >= 3)
+    return (usual, sids, lengths, (words.lines[data], words.rank[data] - 3, values),
+            maybe, np.count_nonzero(words.count < 3))
+
+
+def _read_usb(chars, line_of, line_starts, line_ends):
+    """
+    Like _read_logger, for the lines of a usb debug dump, eg. "$2A1:1,2,FF".
+    Only lines of exactly that (and maybe a \\r) are usual, so any with
+    padding or spaces are left to parsley.
+    """
+    numbers = _Tokens(_is_hex(chars), line_of, len(line_starts))  # the sid and then the data
+    lengths = np.maximum(numbers.count - 1, 0)
+    sid_start = numbers.on_lines(numbers.starts, 0)
+    sid_end = numbers.on_lines(numbers.ends, 0)
+    after = np.where(lengths > 0, numbers.on_lines(numbers.ends, numbers.count - 1), sid_end + 1)
+    last = len(chars) - 1
+    usual = ((numbers.count >= 1) & (lengths <= DATA_BYTES)
+             & (numbers.on_lines(numbers.lengths, 0) <= 3)
+             & (sid_start == line_starts + 1) & (chars[line_starts] == ord("$"))
+             & (chars[np.minimum(sid_end, last)] == ord(":"))
+             & ((after == line_ends)
+                | ((after + 1 == line_ends) & (chars[np.minimum(after, last)] == ord("\r")))))
+    # each byte of data is just after the ":" or a ","
+    data = numbers.rank >= 1
+    separator = np.where(numbers.rank == 1, ord(":"), ord(","))
+    gaps = numbers.starts - np.concatenate([[0], numbers.ends[:-1]])
+    usual &= ~numbers.any(data & ((numbers.lengths > 2) | (gaps != 1)
+                                  | (chars[numbers.starts - 1] != separator)))
+
+    sids = _hex_values(chars, sid_start, numbers.on_lines(numbers.lengths, 0), 3)
+    data &= usual[numbers.lines]
+    values = _hex_values(chars, numbers.starts[data], numbers.lengths[data], 2)
+    # lines without a $ are never frames
+    dollars = np.flatnonzero(chars == ord("$"))
+    maybe = ~usual & (np.bincount(line_of[dollars], minlength=len(line_starts)) > 0)
+    return usual, sids, lengths, (numbers.lines[data], numbers.rank[data] - 1, values), maybe, 0
+
+
+def read_frames(buffer, fmt="logger"):
+    """
+    Read the frames from the whole of a logger or usb debug dump (as bytes),
+    returning the line index, sid, data (padded with zeros) and data length
+    of each, as arrays, and the number of lines which couldn't be read.
+
+    The lines in the usual format are read all at once with NumPy, and only
+    the few others are read one at a time by parsley.
+    """
+    read_chunk = _read_logger if fmt == "logger" else _read_usb
+    parse_line = parsley.parse_logger if fmt == "logger" else parsley.parse_usb_debug
+    indices = [np.zeros(0, np.int64)]
+    sids = [np.zeros(0, np.int64)]
+    data = [np.zeros((0, DATA_BYTES), np.uint8)]
+    lengths = [np.zeros(0, np.int64)]
+    skipped = 0
+    first_line = 0
+    for start, end in _chunks(buffer):
+        chars = np.frombuffer(buffer, np.uint8, end - start, start)
+        line_starts, line_ends = _lines(chars)
+        line_of = np.repeat(np.arange(len(line_starts), dtype=np.int32),
+                            line_ends - line_starts + 1)  # the line of each character
+        usual, chunk_sids, chunk_lengths, (lines, columns, values), maybe, unreadable = \
+            read_chunk(chars, line_of, line_starts, line_ends)
+        chunk_data = np.zeros((len(usual), DATA_BYTES), np.uint8)
+        chunk_data[lines, columns] = values
+        indices.append(first_line + np.flatnonzero(usual))
+        sids.append(chunk_sids[usual])
+        data.append(chunk_data[usual])
+        lengths.append(chunk_lengths[usual])
+        skipped += unreadable
+
+        for i in np.flatnonzero(maybe):
+            try:
+                frame = parse_line(buffer[start + line_starts[i]:start + line_ends[i]])
+                if frame is not None and len(frame[1]) > DATA_BYTES:
+                    raise ValueError(f"{len(frame[1])} bytes of data")
+            except ValueError:  # including binascii.Error
+                skipped += 1
+                continue
+            if frame is None:
+                continue  # not a frame, like the '.' of repeated messages in usb dumps
+            sid, msg_data = frame
+            indices.append([first_line + i])
+            sids.append([sid])
+            data.append(np.frombuffer(bytes(msg_data).ljust(DATA_BYTES, b"\0"), np.uint8)[None])
+            lengths.append([len(msg_data)])
+        first_line += len(line_starts)
+
+    indices = np.concatenate(indices).astype(np.int64)
+    order = np.argsort(indices, kind="stable")
+    return (indices[order], np.concatenate(sids).astype(np.uint16)[order],
+            np.concatenate(data)[order], np.concatenate(lengths).astype(np.uint8)[order], skipped)
+
+
+def _integer(data, field):
+    """
+    Return the values of an integer field of the data of many messages.
+    """
+    size = _SIZES[field.format]
+    value = np.zeros(len(data), np.int64)
+    for i in range(size):
+        value = value << 8 | data[:, field.offset + i]
+    if field.format.startswith("i"):
+        bits = 8 * size
+        value -= (value >> (bits - 1) & 1) << bits  # undo two's complement
+    return value
+
+
+def _names(values, names):
+    """
+    Look up the name of each of an array of integers, or "" for any which
+    aren't in the table.
+    """
+    table = np.array([""] + list(names.values()))
+    lookup = np.zeros(max(names) + 1, np.int64)
+    lookup[list(names)] = np.arange(1, len(names) + 1)
+    found = (values >= 0) & (values < len(lookup))
+    return table[np.where(found, lookup[np.clip(values, 0, len(lookup) - 1)], 0)]
+
+
+def column(data, field):
+    """
+    Return the values of a field of the data of many messages, as an array.
+    """
+    if field.format in _SIZES:
+        value = _integer(data, field)
+    elif field.format == "hi4":
+        value = data[:, field.offset] >> 4
+    elif field.format == "lo4":
+        value = data[:, field.offset] & 0x0F
+    elif field.format == "lo12":
+        value = (data[:, field.offset].astype(np.uint16) & 0x0F) << 8 | data[:, field.offset + 1]
+    elif field.format == "char":
+        return np.char.decode(data[:, field.offset].copy().view("S1"), "latin-1")
+    elif field.format == "ascii":
+        # zero bytes would end the string early, so they're dropped as parse does
+        text = [bytes(row).replace(b"\0", b"").decode("latin-1") for row in data]
+        return np.array(text, _DTYPES["ascii"])
+    elif field.format == "rest":
+        return data[:, field.offset:]
+    else:
+        raise ValueError(f"Unknown field format {field.format}")
+
+    if field.names is not None:
+        return _names(value.astype(np.int64), field.names)
+    if field.scale is not None:
+        return value / field.scale
+    return value.astype(_DTYPES[field.format])
+
+
+def _end(fields):
+    """
+    Return the number of bytes of data fields need.
+    """
+    return max([field.offset + _BYTES[field.format] for field in fields] + [0])
+
+
+def _dtype(field):
+    if field.names is not None:
+        return f"U{max(len(name) for name in field.names.values())}"
+    if field.scale is not None:
+        return np.float64
+    if field.format == "rest":
+        return (np.uint8, (DATA_BYTES - field.offset,))
+    return _DTYPES[field.format]
+
+
+def unwrap(times, bits):
+    """
+    Return the timestamps, which count up to 2**bits and then wrap around to
+    0, counting up from the first instead. Only a drop of more than half the
+    range is taken as wrapping around, so messages logged slightly out of
+    order don't count. Wraps are missed if messages are more than a whole
+    range apart.
+    """
+    times = times.astype(np.int64)
+    modulus = 1 << bits
+    wrapped = np.diff(times, prepend=times[:1]) < -modulus // 2
+    return times + np.cumsum(wrapped) * modulus
+
+
+def decode(indices, sids, data, lengths):
+    """
+    Decode the frames from read_frames into a structured array of each
+    message type's messages.
+    """
+    msg_types = sids & 0x7e0
+    board_ids = sids & 0x1f
+    boards = _names(board_ids, mt.board_id_str)
+    # sort the frames by type once, keeping them in order within each, so each type is a slice
+    order = np.argsort(msg_types, kind="stable")
+    types, starts = np.unique(msg_types[order], return_index=True)
+    ends = np.append(starts[1:], len(order))
+
+    decoded = {}
+    unknown = [np.zeros(0, np.int64)]
+    for msg_type_hex, start, end in zip(types, starts, ends):
+        rows = order[start:end]
+        msg_type = mt.msg_type_str.get(int(msg_type_hex))
+        if msg_type not in mt.msg_fields:
+            unknown.append(rows)
+            continue
+        fields = mt.msg_fields[msg_type]
+        variants = mt.board_stat_fields if msg_type == "GENERAL_BOARD_STATUS" else {}
+        extra = {field.name: field for status_fields in variants.values()
+                 for field in status_fields}
+
+        # frames too short for their fields would decode as zeros, so they're left unknown
+        needed = np.full(len(rows), _end(fields))
+        if variants:
+            statuses = column(data[rows], next(f for f in fields if f.name == "status"))
+            for status, status_fields in variants.items():
+                needed[statuses == status] = _end(fields + status_fields)
+        short = lengths[rows] < needed
+        unknown.append(rows[short])
+        rows = rows[~short]
+
+        columns = [("index", np.int64), ("board", boards.dtype), ("length", np.uint8)]
+        columns += [(f.name, np.int64 if f.format in TIME_BITS and f.name == "time" else _dtype(f))
+                    for f in fields]
+        columns += [(f.name, _dtype(f)) for f in extra.values()]
+        array = np.zeros(len(rows), columns)
+        array["index"] = indices[rows]
+        array["board"] = boards[rows]
+        array["length"] = lengths[rows]
+        group = data[rows]
+        for field in fields:
+            array[field.name] = column(group, field)
+        for status, status_fields in variants.items():
+            matching = array["status"] == status
+            for field in status_fields:
+                array[field.name][matching] = column(group[matching], field)
+
+        if "time" in array.dtype.names:
+            # each board has its own clock
+            time_format = next(f for f in fields if f.name == "time").format
+            group_boards = board_ids[rows]
+            for board in np.unique(group_boards):
+                same = group_boards == board
+                array["time"][same] = unwrap(array["time"][same], TIME_BITS[time_format])
+        decoded[msg_type] = array
+
+    rows = np.sort(np.concatenate(unknown))
+    array = np.zeros(len(rows), [("index", np.int64), ("sid", np.uint16), ("length", np.uint8),
+                                 ("data", (np.uint8, (DATA_BYTES,)))])
+    array["index"] = indices[rows]
+    array["sid"] = sids[rows]
+    array["length"] = lengths[rows]
+    array["data"] = data[rows]
+    decoded["unknown"] = array
+    return decoded
+
+
+def decode_file(path, fmt="logger"):
+    """
+    Decode a whole logger or usb debug dump, returning the arrays from decode
+    and the number of lines which couldn't be read.
+    """
+    with open(path, "rb") as f:
+        indices, sids, data, lengths, skipped = read_frames(f.read(), fmt)
+    return decode(indices, sids, data, lengths), skipped
+
+
+def save(decoded, path):
+    """
+    Save decoded messages to a .npz file, with each field of each message
+    type as a separate array named "<msg_type>/<field>", so reading a few
+    fields back doesn't read the rest.
+    """
+    np.savez_compressed(path, **{f"{msg_type}/{name}": array[name]
+                                 for msg_type, array in decoded.items()
+                                 for name in array.dtype.names})
+
+
+def load(path):
+    """
+    Load messages saved by save, as the same structured arrays.
+    """
+    with np.load(path) as f:
+        columns = {}
+        for key in f.files:
+            msg_type, name = key.split("/")
+            columns.setdefault(msg_type, {})[name] = f[key]
+    decoded = {}
+    for msg_type, fields in columns.items():
+        length = len(next(iter(fields.values())))
+        array = np.zeros(length, [(name, value.dtype, value.shape[1:])
+                                  for name, value in fields.items()])
+        for name, value in fields.items():
+            array[name] = value
+        decoded[msg_type] = array
+    return decoded
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file', help='the logger or usb debug dump to decode')
+    parser.add_argument('--format', default='logger', choices=['logger', 'usb'],
+                        help='Parse input in RocketCAN Logger or USB format')
+    parser.add_argument('-o', '--output', help='the .npz file to save the decoded messages to')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    decoded, skipped = decode_file(args.file, args.format)
+    total = sum(len(array) for array in decoded.values())
+    print(f"Decoded {total} messages in {time.perf_counter() - start:.2f}s"
+          + (f", skipping {skipped} unreadable lines" if skipped else ""))
+    for msg_type, array in sorted(decoded.items()):
+        if len(array):
+            print(f"  {msg_type:<22} {len(array):>9}")
+    if args.output:
+        save(decoded, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import random
+
+import numpy as np
+import pytest
+
+import bulk
+import message_types as mt
+import parsley
+
+
+def logger_line(msg_sid, msg_data):
+    data = " ".join(f"{b:02X}" for b in msg_data)
+    return f"12345678 {msg_sid:03X} {len(msg_data)}: {data} 87654321"
+
+
+def usb_line(msg_sid, msg_data):
+    return f"${msg_sid:03X}:" + ",".join(f"{b:X}" for b in msg_data)
+
+
+def valid_data(msg_type, rng):
+    """
+    Return random data for a message type, with a valid value for every field
+    which is looked up in a table.
+    """
+    data = [rng.randrange(256) for _ in range(8)]
+    fields = mt.msg_fields[msg_type]
+    if msg_type == "GENERAL_BOARD_STATUS":
+        status = rng.choice(list(mt.board_stat_hex))
+        fields = fields + mt.board_stat_fields.get(status, [])
+    for field in fields:
+        if field.names is not None:
+            value = rng.choice(list(field.names))
+            if field.format == "hi4":
+                value = value << 4 | data[field.offset] & 0x0F
+            data[field.offset] = value
+    if msg_type == "GENERAL_BOARD_STATUS":
+        data[3] = mt.board_stat_hex[status]
+    return data
+
+
+@pytest.fixture
+def messages():
+    rng = random.Random(0)
+    # every type which can be told apart by its sid
+    msg_types = [msg_type for msg_type in mt.msg_fields
+                 if mt.msg_type_str.get(mt.msg_type_hex.get(msg_type)) == msg_type]
+    res = []
+    for _ in range(500):
+        msg_type = rng.choice(msg_types)
+        board = rng.choice(list(mt.board_id_str))
+        res.append((mt.msg_type_hex[msg_type] | board, valid_data(msg_type, rng)))
+    return res
+
+
+class TestBulk:
+    @pytest.mark.parametrize("fmt, line", [("logger", logger_line), ("usb", usb_line)])
+    def test_read_frames(self, fmt, line):
+        lines = [line(0x555, [1, 2, 0xFF]).encode(), b"garbage",
+                 line(0x123, list(range(8))).encode(), line(0x7E1, []).encode()]
+        indices, sids, data, lengths, skipped = bulk.read_frames(b"\n".join(lines) + b"\n", fmt)
+        assert list(indices) == [0, 2, 3]
+        assert list(sids) == [0x555, 0x123, 0x7E1]
+        assert data.tolist() == [[1, 2, 0xFF, 0, 0, 0, 0, 0], list(range(8)), [0] * 8]
+        assert list(lengths) == [3, 8, 0]
+        assert skipped == (1 if fmt == "logger" else 0)  # usb dumps have other lines in them
+
+    @pytest.mark.parametrize("fmt, lines, skipped", [
+        # lines which aren't quite in the usual format are read one at a time, like parsley does
+        ("logger", [b"12345678 555 3:  01 02 FF  87654321", b"", b"1 2 3: 0G 4",
+                    b"1 555 3: 0102FF 4", b"1 555 9: 01 02 03 04 05 06 07 08 09 4",
+                    b"12345678 123 1: 07 8"], 3),
+        ("usb", [b"\0 $555:01,02,FF", b".", b"$55G:01", b"$0555:1,2,FF",
+                 b"$555:1,2,3,4,5,6,7,8,9", b"$123:7"], 2),
+    ])
+    def test_read_other_lines(self, fmt, lines, skipped):
+        indices, sids, data, lengths, res = bulk.read_frames(b"\r\n".join(lines), fmt)
+        assert list(indices) == [0, 3, 5]
+        assert list(sids) == [0x555, 0x555, 0x123]
+        assert data[:, :3].tolist() == [[1, 2, 0xFF], [1, 2, 0xFF], [7, 0, 0]]
+        assert list(lengths) == [3, 3, 1]
+        assert res == skipped
+
+    @pytest.mark.parametrize("fmt, line", [("logger", logger_line), ("usb", usb_line)])
+    def test_read_chunks(self, fmt, line, messages, monkeypatch):
+        buffer = b"\n".join(line(msg_sid, msg_data).encode() for msg_sid, msg_data in messages)
+        whole = bulk.read_frames(buffer + b"\ngarbage", fmt)
+        monkeypatch.setattr(bulk, "CHUNK_BYTES", 100)
+        chunked = bulk.read_frames(buffer + b"\ngarbage", fmt)
+        assert len(whole[0]) == len(messages)
+        for expected, res in zip(whole[:4], chunked[:4]):
+            assert np.array_equal(expected, res)
+        assert whole[4] == chunked[4]
+
+    def test_read_nothing(self):
+        indices, sids, data, lengths, skipped = bulk.read_frames(b"")
+        assert len(indices) == len(sids) == len(data) == len(lengths) == skipped == 0
+
+    def test_same_as_parse(self, messages):
+        lines = [logger_line(msg_sid, msg_data).encode() for msg_sid, msg_data in messages]
+        decoded = bulk.decode(*bulk.read_frames(b"\n".join(lines))[:4])
+        assert sum(len(array) for array in decoded.values()) == len(messages)
+        rows = {}
+        for array in decoded.values():
+            for row in array:
+                rows[row["index"]] = row
+        for i, (msg_sid, msg_data) in enumerate(messages):
+            expected = parsley.parse(msg_sid, msg_data)
+            row = rows[i]
+            assert row["board"] == expected["board_id"]
+            for name, value in expected["data"].items():
+                if name == "time":
+                    continue  # unwrapped, see test_unwrap
+                if isinstance(value, list):
+                    assert row[name].tolist()[:len(value)] == value
+                else:
+                    assert row[name] == value, (expected["msg_type"], name)
+
+    def test_unknown(self):
+        sids = np.array([0x7a0], np.uint16)
+        decoded = bulk.decode(np.array([0]), sids, np.zeros((1, 8), np.uint8), np.array([8]))
+        assert list(decoded["unknown"]["sid"]) == [0x7a0]
+
+    def test_short(self):
+        analog = mt.msg_type_hex["SENSOR_ANALOG"] | mt.board_id_hex["SENSOR"]
+        status = mt.msg_type_hex["GENERAL_BOARD_STATUS"] | mt.board_id_hex["SENSOR"]
+        voltage = mt.board_stat_hex["E_BATT_UNDER_VOLTAGE"]
+        lines = [usb_line(analog, []), usb_line(analog, [0, 1, 2, 0, 3]),
+                 usb_line(status, [0, 0, 1, voltage, 0x12]),
+                 usb_line(status, [0, 0, 1, voltage, 0x12, 0x34])]
+        decoded = bulk.decode(*bulk.read_frames("\n".join(lines).encode(), "usb")[:4])
+        # parse would raise on the short ones, rather than giving zeros
+        assert list(decoded["unknown"]["index"]) == [0, 2]
+        assert list(decoded["unknown"]["length"]) == [0, 5]
+        assert list(decoded["SENSOR_ANALOG"]["length"]) == [5]
+        assert list(decoded["GENERAL_BOARD_STATUS"]["voltage"]) == [0x1234]
+
+    def test_names(self):
+        names = bulk._names(np.array([0, 1, 3, 300]), {0: "A", 1: "B"})
+        assert list(names) == ["A", "B", "", ""]
+
+    def test_unwrap(self):
+        times = np.array([65000, 65500, 100, 90, 600, 65530, 5])
+        assert list(bulk.unwrap(times, 16)) == [65000, 65500, 65636, 65626, 66136, 131066, 131077]
+
+    def test_time(self):
+        sid = mt.msg_type_hex["SENSOR_ANALOG"] | mt.board_id_hex["SENSOR"]
+        other = mt.msg_type_hex["SENSOR_ANALOG"] | mt.board_id_hex["INJECTOR"]
+        lines = [logger_line(board, [t >> 8, t & 0xFF, 0, 0, 0]).encode()
+                 for board, t in [(sid, 65000), (other, 10), (sid, 200), (other, 20)]]
+        array = bulk.decode(*bulk.read_frames(b"\n".join(lines))[:4])["SENSOR_ANALOG"]
+        # each board's clock is unwrapped separately
+        assert list(array["time"]) == [65000, 10, 65736, 20]
+
+    def test_save(self, messages, tmp_path):
+        lines = [usb_line(msg_sid, msg_data).encode() for msg_sid, msg_data in messages]
+        decoded = bulk.decode(*bulk.read_frames(b"\n".join(lines), "usb")[:4])
+        bulk.save(decoded, tmp_path / "flight.npz")
+        loaded = bulk.load(tmp_path / "flight.npz")
+        assert set(loaded) == set(decoded)
+        for msg_type, array in decoded.items():
+            assert np.array_equal(loaded[msg_type], array)
@@ -1,18 +1,58 @@
 import argparse
+import sys
+
 import serial
 
-from omnibus import Sender
+from omnibus import Sender, can
+from omnibus.util import Console, LineReader
+from omnibus.util.line_reader import serial_reader
 import parsley
 
 
-def reader(port):
+def reader(port, baud):
+    # read whatever has arrived in one go and split it into lines ourselves, as bytes
     if port == "-":
-        return input
-    s = serial.Serial(port, 9600)
+        return LineReader(sys.stdin.buffer.read1)
+    return LineReader(serial_reader(serial.Serial(port, baud)))
+
 
-    def _reader():
-        return s.readline().strip(b'\r\n').decode('utf-8')
-    return _reader
+def console_for(args, decoded):
+    """
+    Return the Console for the --output asked for, or None to print each
+    message as it's sent. decoded turns what is put on it into a parsed message.
+    """
+    if args.output == 'background':
+        return Console(lambda item: parsley.fmt_line(decoded(item)))
+    if args.output == 'summary':
+        return Console(lambda item: parsley.fmt_data(decoded(item)),
+                       key=lambda item: parsley.summary_key(decoded(item)),
+                       refresh=args.refresh)
+    return None
+
+
+def read_frames(batch, parse_line, console):
+    """
+    Yield the (sid, data) of each frame in a batch of lines.
+    """
+    for line in batch:
+        if not line.strip():
+            continue
+        # treat repeated messages in the same way as USB debug
+        if line.strip() == b'.':
+            if console is None:
+                print('.')
+            continue
+
+        try:
+            frame = parse_line(line)
+            # noise can run frames together, which can't be sent as one raw frame
+            if frame is not None and len(frame[1]) > can.MAX_DATA:
+                raise ValueError(f"{len(frame[1])} bytes of data")
+        except ValueError:
+            print(f"Warning: unreadable line {line}", file=sys.stderr)
+            continue
+        if frame is not None:
+            yield frame
 
 
 def main():
@@ -22,30 +62,53 @@ def main():
                         help='Options: logger, usb. Parse input in RocketCAN Logger or USB format')
     parser.add_argument('--solo', action='store_true',
                         help="Don't connect to omnibus - just print to stdout.")
+    parser.add_argument('--baud', type=int, default=9600, help='baud rate of the serial port')
+    parser.add_argument('--output', default='print', choices=['print', 'background', 'summary'],
+                        help='print each message as it is sent, print them from a separate '
+                             'thread so the terminal never slows down sending (dropping lines if '
+                             'it cannot keep up), or show a summary of each type and board')
+    parser.add_argument('--refresh', type=float, default=4,
+                        help='times a second the summary is redrawn')
+    parser.add_argument('--raw', action='store_true',
+                        help=f'send the raw frames on {can.RAW_CHANNEL} in batches, for sinks to '
+                             'decode, instead of sending each message decoded on CAN/Parsley')
     args = parser.parse_args()
 
-    readline = reader(args.port)
+    # with --raw, raw frames are printed, decoding them (on the console's thread if it has one)
+    decoder = parsley.decoder()
+
+    def decoded(item):
+        return decoder.decode(*item) if args.raw else item
+
+    console = console_for(args, decoded)
+    lines = reader(args.port, args.baud)
     parser = parsley.parse_logger if args.format == 'logger' else parsley.parse_usb_debug
     if not args.solo:
-        sender = Sender()
+        sender = Sender(skip_unsubscribed=True)
         CHANNEL = "CAN/Parsley"
 
-    while True:
-        line = readline()
-        if not line:
-            break
+    # all the lines which arrived together, so that with --raw they're sent as one message
+    for batch in iter(lines.readlines, []):
+        frames = []
+        for frame in read_frames(batch, parser, console):
+            if args.raw:
+                frames.append(frame)
+                item = frame
+            else:
+                item = parsley.parse(*frame)
+                if not args.solo:
+                    sender.send(CHANNEL, item)
 
-        # treat repeated messages in the same way as USB debug
-        if line.strip() == '.':
-            print('.')
-            continue
+            if console is None:
+                print(parsley.fmt_line(decoded(item)))
+            else:
+                console.put(item)
 
-        msg_sid, msg_data = parser(line)
-        parsed_data = parsley.parse(msg_sid, msg_data)
+        if frames and not args.solo:
+            sender.send(can.RAW_CHANNEL, can.pack_frames(frames))
 
-        print(parsley.fmt_line(parsed_data))
-        if not args.solo:
-            sender.send(CHANNEL, parsed_data)
+    if console is not None:
+        console.close()
 
 
 if __name__ == '__main__':
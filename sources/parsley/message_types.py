@@ -20,6 +20,8 @@
 # LEDS_OFF:        None        None         None           None                    None            None            None            None
 # FILL_LVL:        TSTAMP_MS_H TSTAMP_MS_M  TSTAMP_MS_L    FILL_LEVEL              DIRECTION       None            None            None
 
+from typing import NamedTuple
+
 msg_type_hex = {
     "GENERAL_CMD": 0x060,
     "ACTUATOR_CMD": 0x0C0,
@@ -161,3 +163,115 @@ actuator_id_hex = {
     "INJECTOR_VALVE": 1,
 }
 actuator_id_str = {v: k for k, v in actuator_id_hex.items()}
+
+reset_board_id_str = {**board_id_str, 0: "ALL"}  # RESET_CMD uses board id 0 for every board
+
+
+class Field(NamedTuple):
+    """
+    A field of a message's data: its name, the byte it starts at, its format
+    and either the table its value names are looked up in or what to divide it by.
+
+    Formats are big endian, signed if they start with i:
+        u8, i8, u16, i16, u24, i24, u32, i32: integers
+        hi4, lo4: the high or low half of a byte
+        lo12: the low half of a byte followed by the next byte
+        char: a single ASCII character
+        ascii: every non-zero byte of the data as a string
+        rest: every byte from here on, as given
+    """
+    name: str
+    offset: int
+    format: str
+    names: dict = None
+    scale: float = None
+
+
+_time = Field("time", 0, "u24")
+_time16 = Field("time", 0, "u16")  # the sensor messages have space for the low 16 bits only
+
+# the fields of each message type (see the table at the top)
+msg_fields = {
+    "GENERAL_CMD": [_time, Field("command", 3, "u8", gen_cmd_str)],
+    "ACTUATOR_CMD": [
+        _time, Field("actuator", 3, "u8", actuator_id_str),
+        Field("req_state", 4, "u8", actuator_states_str),
+    ],
+    "ALT_ARM_CMD": [_time, Field("altimeter", 3, "lo4"), Field("state", 3, "hi4", arm_states_str)],
+    "RESET_CMD": [_time, Field("board_id", 3, "u8", reset_board_id_str)],
+
+    "DEBUG_MSG": [
+        _time, Field("level", 3, "hi4"), Field("line", 3, "lo12"), Field("data", 5, "rest"),
+    ],
+    "DEBUG_PRINTF": [Field("string", 0, "ascii")],
+    "DEBUG_RADIO_CMD": [Field("string", 0, "ascii")],
+
+    "ALT_ARM_STATUS": [
+        _time, Field("altimeter", 3, "lo4"), Field("state", 3, "hi4", arm_states_str),
+        Field("drogue_v", 4, "u16"), Field("main_v", 6, "u16"),
+    ],
+    "ACTUATOR_STATUS": [
+        _time, Field("actuator", 3, "u8", actuator_id_str),
+        Field("req_state", 5, "u8", actuator_states_str),
+        Field("cur_state", 4, "u8", actuator_states_str),
+    ],
+    # followed by the fields in board_stat_fields for its status
+    "GENERAL_BOARD_STATUS": [_time, Field("status", 3, "u8", board_stat_str)],
+
+    "SENSOR_TEMP": [
+        _time, Field("sensor_id", 3, "u8"), Field("temperature", 4, "i24", scale=2**10),
+    ],
+    "SENSOR_ALTITUDE": [_time, Field("altitude", 3, "i32")],
+    "SENSOR_ACC": [_time16, Field("x", 2, "i16"), Field("y", 4, "i16"), Field("z", 6, "i16")],
+    "SENSOR_GYRO": [_time16, Field("x", 2, "i16"), Field("y", 4, "i16"), Field("z", 6, "i16")],
+    "SENSOR_MAG": [_time16, Field("x", 2, "i16"), Field("y", 4, "i16"), Field("z", 6, "i16")],
+    "SENSOR_ANALOG": [
+        _time16, Field("sensor_id", 2, "u8", sensor_id_str), Field("value", 3, "u16"),
+    ],
+
+    "GPS_TIMESTAMP": [
+        _time, Field("hrs", 3, "u8"), Field("mins", 4, "u8"), Field("secs", 5, "u8"),
+        Field("dsecs", 6, "u8"),
+    ],
+    "GPS_LATITUDE": [
+        _time, Field("degs", 3, "u8"), Field("mins", 4, "u8"), Field("dmins", 5, "u16"),
+        Field("direction", 7, "char"),
+    ],
+    "GPS_LONGITUDE": [
+        _time, Field("degs", 3, "u8"), Field("mins", 4, "u8"), Field("dmins", 5, "u16"),
+        Field("direction", 7, "char"),
+    ],
+    "GPS_ALTITUDE": [
+        _time, Field("altitude", 3, "u16"), Field("daltitude", 5, "u8"), Field("unit", 6, "char"),
+    ],
+    "GPS_INFO": [_time, Field("num_sats", 3, "u8"), Field("quality", 4, "u8")],
+
+    "RADI_VALUE": [_time, Field("radi_board", 3, "u8"), Field("radi", 4, "u16")],
+    "FILL_LVL": [
+        _time, Field("level", 3, "u8"), Field("direction", 4, "u8", fill_direction_str),
+    ],
+
+    "LEDS_ON": [],
+    "LEDS_OFF": [],
+}
+
+# the extra fields of GENERAL_BOARD_STATUS messages with each status (see the table above)
+_voltage = [Field("voltage", 4, "u16")]
+_err_time = [Field("err_time", 4, "u16")]
+_dead_board = [Field("board_id", 4, "u8", board_id_str)]
+board_stat_fields = {
+    "E_BUS_OVER_CURRENT": [Field("current", 4, "u16")],
+    "E_BUS_UNDER_VOLTAGE": _voltage,
+    "E_BUS_OVER_VOLTAGE": _voltage,
+    "E_BATT_UNDER_VOLTAGE": _voltage,
+    "E_BATT_OVER_VOLTAGE": _voltage,
+    "E_BOARD_FEARED_DEAD": _dead_board,
+    "E_MISSING_CRITICAL_BOARD": _dead_board,
+    "E_NO_CAN_TRAFFIC": _err_time,
+    "E_RADIO_SIGNAL_LOST": _err_time,
+    "E_SENSOR": [Field("sensor_id", 4, "u8", sensor_id_str)],
+    "E_ACTUATOR_STATE": [
+        Field("req_state", 4, "u8", actuator_states_str),
+        Field("cur_state", 5, "u8", actuator_states_str),
+    ],
+}
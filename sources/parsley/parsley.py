@@ -1,5 +1,17 @@
-import message_types as mt
+import binascii
+import re
+import struct
 
+from omnibus import can
+
+try:
+    from . import message_types as mt
+except ImportError:
+    # run from this folder, rather than imported by sinks as sources.parsley.parsley
+    import message_types as mt
+
+# The hand written parser of each message type. parse uses the layouts in
+# message_types.msg_fields instead, which must agree with these (see parsley_test.py).
 _func_map = {}
 
 
@@ -261,6 +273,128 @@ def parse_leds_off(msg_data):
     return {}
 
 
+_CODES = {"u8": "B", "i8": "b", "u16": "H", "i16": "h", "u32": "I", "i32": "i", "char": "c"}
+
+
+def _slots(field):
+    """
+    Return the (offset, struct format code) of each part of the data a field
+    is made from.
+    """
+    offset = field.offset
+    if field.format in _CODES:
+        return [(offset, _CODES[field.format])]
+    if field.format in ("u24", "i24"):
+        return [(offset, "B" if field.format == "u24" else "b"), (offset + 1, "H")]
+    if field.format in ("hi4", "lo4"):
+        return [(offset, "B")]
+    if field.format == "lo12":
+        return [(offset, "B"), (offset + 1, "B")]
+    if field.format in ("ascii", "rest"):
+        return []  # made from the data as a whole
+    raise ValueError(f"Unknown field format {field.format}")
+
+
+# slots read by indexing the data rather than unpacking, since that's faster for unsigned
+# values (and works on lists of ints as well as bytes)
+_INDEXED = {
+    "B": "msg_data[{0}]",
+    "H": "(msg_data[{0}] << 8 | msg_data[{0} + 1])",
+    "I": "(msg_data[{0}] << 24 | msg_data[{0} + 1] << 16 | msg_data[{0} + 2] << 8 "
+         "| msg_data[{0} + 3])",
+    "c": "chr(msg_data[{0}])",
+}
+
+
+def _expression(field, values):
+    """
+    Return the Python expression for the value of a field, in terms of the
+    raw msg_data, where values is the expression for each slot.
+    """
+    i, j = ([values[slot] for slot in _slots(field)] + [None, None])[:2]
+    expressions = {
+        "u24": f"({i} << 16 | {j})",
+        "i24": f"({i} << 16 | {j})",
+        "hi4": f"({i} >> 4)",
+        "lo4": f"({i} & 0x0F)",
+        "lo12": f"(({i} & 0x0F) << 8 | {j})",
+        "ascii": "bytes(msg_data).replace(b'\\0', b'').decode('latin-1')",
+        "rest": f"msg_data[{field.offset}:]",
+    }
+    expression = expressions.get(field.format, i)
+    if field.names is not None:
+        expression = f"names_{field.name}[{expression}]"
+    if field.scale is not None:
+        expression = f"{expression} / {field.scale!r}"
+    return expression
+
+
+class Layout:
+    """
+    A message type's fields compiled into a function building the dict of
+    their values straight from the data, unpacking any signed values with one
+    struct unpack. If key is given, the message has more fields depending on
+    the name of the value of that u8 field, given by variants.
+    """
+
+    def __init__(self, fields, key=None, variants=None):
+        slots = sorted({slot for field in fields for slot in _slots(field)})
+        end = 0
+        for offset, code in slots:
+            if offset < end:
+                raise ValueError(f"Overlapping fields at byte {offset}")
+            end = offset + struct.calcsize(">" + code)
+
+        values = {}  # slot: the expression for its value
+        fmt = ">"
+        end = 0
+        for offset, code in slots:
+            if code in _INDEXED:
+                values[(offset, code)] = _INDEXED[code].format(offset)
+            else:
+                values[(offset, code)] = f"v{len(values)}"
+                fmt += "x" * (offset - end) + code
+                end = offset + struct.calcsize(">" + code)
+        unpacked = [value for value in values.values() if value.startswith("v")]
+        self.struct = struct.Struct(fmt)
+
+        # generate the function, like namedtuple does, so parsing a message
+        # makes as few calls as possible
+        namespace = {"unpack": self.struct.unpack_from}
+        namespace.update({f"names_{field.name}": field.names for field in fields
+                          if field.names is not None})
+        items = ", ".join(f"{field.name!r}: {_expression(field, values)}" for field in fields)
+        source = "def parse(msg_data):\n"
+        if unpacked:
+            source += (f"    {', '.join(unpacked)}, = unpack(msg_data if type(msg_data) is bytes "
+                       "else bytes(msg_data))\n")
+        source += f"    return {{{items}}}\n"
+        exec(source, namespace)
+        self._parse = namespace["parse"]
+
+        self.parse = self._parse
+        if key is not None:
+            # choose the variant by the byte the key is in, before unpacking anything
+            key, = (field for field in fields if field.name == key)
+            self.variants = {raw: Layout(fields + variants[name])
+                             for raw, name in key.names.items() if name in variants}
+            self.parse = self._variant_parser(key.offset)
+
+    def _variant_parser(self, key_offset):
+        # everything looked up once here rather than on each message
+        parsers = {raw: layout._parse for raw, layout in self.variants.items()}
+        default = self._parse
+
+        def parse(msg_data):
+            return parsers.get(msg_data[key_offset], default)(msg_data)
+        return parse
+
+
+_layouts = {msg_type: Layout(fields) for msg_type, fields in mt.msg_fields.items()}
+_layouts["GENERAL_BOARD_STATUS"] = Layout(mt.msg_fields["GENERAL_BOARD_STATUS"],
+                                          "status", mt.board_stat_fields)
+
+
 def parse(msg_sid, msg_data):
     # lol @ bitwise manips in python
     msg_type = mt.msg_type_str[msg_sid & 0x7e0]
@@ -268,6 +402,37 @@ def parse(msg_sid, msg_data):
 
     res = {"msg_type": msg_type, "board_id": board_id}
 
+    if (layout := _layouts.get(msg_type)) is not None:
+        res["data"] = layout.parse(msg_data)
+    else:
+        res["data"] = {"unknown": msg_data}
+
+    return res
+
+
+# message types without a timestamp, whose frames repeat exactly and so are worth remembering
+_UNTIMED = [mt.msg_type_hex[msg_type] for msg_type, fields in mt.msg_fields.items()
+            if msg_type in mt.msg_type_hex and all(field.name != "time" for field in fields)]
+
+
+def decoder(*msg_types):
+    """
+    Return a can.Decoder for raw frames from CAN/Raw which decodes messages
+    of the named types like parse, or every type if none are named.
+    """
+    return can.Decoder(parse, [mt.msg_type_hex[msg_type] for msg_type in msg_types] or None,
+                       _UNTIMED)
+
+
+def _parse_funcs(msg_sid, msg_data):
+    """
+    Parse a message like parse, with the hand written parsers.
+    """
+    msg_type = mt.msg_type_str[msg_sid & 0x7e0]
+    board_id = mt.board_id_str[msg_sid & 0x1f]
+
+    res = {"msg_type": msg_type, "board_id": board_id}
+
     if msg_type in _func_map:
         res["data"] = _func_map[msg_type](msg_data)
     else:
@@ -276,7 +441,33 @@ def parse(msg_sid, msg_data):
     return res
 
 
+# a line of USB debug output, as bytes: $<sid>:<data bytes in hex, separated by commas>
+_USB_DEBUG = re.compile(rb"[ \0]*\$([0-9A-Fa-f]+):([0-9A-Fa-f,]*?)\s*")
+
+
+def _parse_usb_debug_bytes(line):
+    if (match := _USB_DEBUG.fullmatch(line)) is None:
+        if line.lstrip(b" \0").startswith(b"$"):
+            raise ValueError(f"Unreadable USB debug line {line!r}")
+        return None
+    msg_sid, msg_data = match.groups()
+    if not msg_data:
+        msg_data = b""
+    elif len(msg_data) % 3 == 2 and msg_data[2::3] == b"," * (len(msg_data) // 3):
+        # every byte has two digits, so they can all be converted at once
+        msg_data = binascii.unhexlify(msg_data.replace(b",", b""))
+    else:
+        msg_data = bytes(int(byte, 16) for byte in msg_data.split(b","))
+    return int(msg_sid, 16), msg_data
+
+
 def parse_usb_debug(line):
+    """
+    Parse a line of USB debug output, giving the data as a list of ints, or
+    as bytes if the line is bytes.
+    """
+    if isinstance(line, bytes):
+        return _parse_usb_debug_bytes(line)
     line = line.lstrip(' \0')
     if len(line) == 0 or line[0] != '$':
         return None
@@ -290,8 +481,15 @@ def parse_usb_debug(line):
 
 
 def parse_logger(line):
+    """
+    Parse a line of RocketCAN logger output, giving the data as a list of ints,
+    or as bytes if the line is bytes.
+    """
     # see cansw_logger/can_syslog.c for format
     _, msg_sid, _, *msg_data = line.split()
+    if isinstance(line, bytes):
+        # last 'byte' is the recv_timestamp
+        return int(msg_sid, 16), binascii.unhexlify(b"".join(msg_data[:-1]))
     msg_sid = int(msg_sid, 16)
     # last 'byte' is the recv_timestamp
     msg_data = [int(byte, 16) for byte in msg_data[:-1]]
@@ -302,11 +500,16 @@ MSG_TYPE_LEN = max([len(msg_type) for msg_type in mt.msg_type_hex])
 BOARD_ID_LEN = max([len(board_id) for board_id in mt.board_id_hex])
 
 
+def fmt_data(parsed_data):
+    return "".join(f" {k}: {v}" for k, v in parsed_data["data"].items())
+
+
 def fmt_line(parsed_data):
     msg_type = parsed_data['msg_type']
     board_id = parsed_data['board_id']
-    data = parsed_data["data"]
-    res = f"[ {msg_type:<{MSG_TYPE_LEN}} {board_id:<{BOARD_ID_LEN}} ]"
-    for k, v in data.items():
-        res += f" {k}: {v}"
-    return res
+    return f"[ {msg_type:<{MSG_TYPE_LEN}} {board_id:<{BOARD_ID_LEN}} ]" + fmt_data(parsed_data)
+
+
+# the row of the console summary a message is shown in
+def summary_key(parsed_data):
+    return f"{parsed_data['msg_type']:<{MSG_TYPE_LEN}} {parsed_data['board_id']}"
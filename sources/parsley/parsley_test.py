@@ -1,7 +1,10 @@
+import random
 import struct
 
 import pytest
 
+from omnibus import can
+
 import parsley
 import message_types as mt
 
@@ -184,9 +187,10 @@ class TestParsley:
         assert res["direction"] == "FILLING"
 
     def test_parse(self, monkeypatch):
-        def parse_monkey(msg_data):
-            return {"monkey": msg_data}
-        monkeypatch.setitem(parsley._func_map, "LEDS_ON", parse_monkey)
+        class LayoutMonkey:
+            def parse(self, msg_data):
+                return {"monkey": msg_data}
+        monkeypatch.setitem(parsley._layouts, "LEDS_ON", LayoutMonkey())
 
         msg_sid = mt.msg_type_hex["LEDS_ON"] | mt.board_id_hex["ARMING"]
         msg_data = [1, 2, 3, 4]
@@ -205,6 +209,26 @@ class TestParsley:
         assert msg_sid == 0x555
         assert msg_data == [1, 2, 0xFF]
 
+    def test_parse_usb_bytes(self):
+        assert parsley.parse_usb_debug(b"\0 $555:01,02,FF\r") == (0x555, b"\x01\x02\xff")
+        assert parsley.parse_usb_debug(b"$555:1,2,FF") == (0x555, b"\x01\x02\xff")
+        assert parsley.parse_usb_debug(b"$555:") == (0x555, b"")
+        assert parsley.parse_usb_debug(b".") is None
+
+    @pytest.mark.parametrize("line", [b"$55G:01", b"$555:01,123", b"$555:01;02", b"$555"])
+    def test_parse_usb_bytes_unreadable(self, line):
+        with pytest.raises(ValueError):
+            parsley.parse_usb_debug(line)
+
+    def test_parse_logger_bytes(self):
+        line = b"12345678 555 3: 01 02 FF                87654321"
+        assert parsley.parse_logger(line) == (0x555, b"\x01\x02\xff")
+
+    def test_parse_bytes_same(self):
+        msg_sid = mt.msg_type_hex["SENSOR_ACC"] | mt.board_id_hex["SENSOR"]
+        msg_sid, msg_data = parsley.parse_usb_debug(b"$%X:30,39,FF,FF,0,2,1,2C" % msg_sid)
+        assert parsley.parse(msg_sid, msg_data) == parsley.parse(msg_sid, list(msg_data))
+
     def test_reset_cmd(self, timestamp):
         msg_data = timestamp() + struct.pack(">b", 3)
         res = parsley.parse_reset_cmd(msg_data)
@@ -255,3 +279,86 @@ class TestParsley:
     def test_leds_off(self):
         # LED_OFF message has no message body
         pass
+
+
+class TestLayouts:
+    def valid_data(self, msg_type, rng):
+        """
+        Return random data for a message type, with a valid value for every
+        field which is looked up in a table.
+        """
+        data = [rng.randrange(256) for _ in range(8)]
+        fields = mt.msg_fields[msg_type]
+        if msg_type == "GENERAL_BOARD_STATUS":
+            status = rng.choice(list(mt.board_stat_hex))
+            fields = fields + mt.board_stat_fields.get(status, [])
+        for field in fields:
+            if field.names is None:
+                continue
+            value = rng.choice(list(field.names))
+            if field.format == "hi4":
+                data[field.offset] = value << 4 | data[field.offset] & 0x0F
+            else:
+                data[field.offset] = value
+        if msg_type == "GENERAL_BOARD_STATUS":
+            data[3] = mt.board_stat_hex[status]
+        return data
+
+    def test_every_type(self):
+        assert set(mt.msg_fields) == set(parsley._func_map)
+
+    @pytest.mark.parametrize("msg_type", sorted(mt.msg_fields))
+    def test_same_as_funcs(self, msg_type):
+        rng = random.Random(msg_type)
+        for _ in range(200):
+            data = self.valid_data(msg_type, rng)
+            expected = parsley._func_map[msg_type](data)
+            # the same keys in the same order, with the same values
+            assert list(parsley._layouts[msg_type].parse(data).items()) == list(expected.items())
+            data = bytes(data)
+            assert parsley._layouts[msg_type].parse(data) == parsley._func_map[msg_type](data)
+
+    def test_invalid_name(self):
+        data = [0, 0, 0, 0xFF, 0, 0, 0, 0]
+        with pytest.raises(KeyError):
+            parsley._layouts["ACTUATOR_CMD"].parse(data)
+
+    def test_overlap(self):
+        with pytest.raises(ValueError):
+            parsley.Layout([mt.Field("a", 0, "u16"), mt.Field("b", 1, "u8")])
+
+    def test_parse(self):
+        msg_sid = mt.msg_type_hex["SENSOR_ACC"] | mt.board_id_hex["SENSOR"]
+        msg_data = list(struct.pack(">Hhhh", 12345, -1, 2, -3))
+        assert parsley.parse(msg_sid, msg_data) == parsley._parse_funcs(msg_sid, msg_data)
+
+
+class TestDecoder:
+    def test_decode_all(self):
+        acc = mt.msg_type_hex["SENSOR_ACC"] | mt.board_id_hex["SENSOR"]
+        gyro = mt.msg_type_hex["SENSOR_GYRO"] | mt.board_id_hex["SENSOR"]
+        acc_data = struct.pack(">Hhhh", 12345, -1, 2, -3)
+        frames = [(acc, acc_data), (gyro, struct.pack(">Hhhh", 1, 2, 3, 4)), (acc, acc_data)]
+        decoded = parsley.decoder("SENSOR_ACC").decode_all(can.pack_frames(frames))
+        assert decoded == [parsley.parse(acc, acc_data)] * 2
+
+    def test_every_type(self):
+        decoder = parsley.decoder()
+        msg_sid = mt.msg_type_hex["LEDS_ON"] | mt.board_id_hex["SENSOR"]
+        assert decoder.decode(msg_sid, b"") == parsley.parse(msg_sid, b"")
+
+    def test_memoised(self):
+        # sensors send every few milliseconds, each with a new timestamp, while
+        # boards print the same few debug strings over and over
+        acc = mt.msg_type_hex["SENSOR_ACC"] | mt.board_id_hex["SENSOR"]
+        printf = mt.msg_type_hex["DEBUG_PRINTF"] | mt.board_id_hex["SENSOR"]
+        frames = []
+        for t in range(1000):
+            frames.append((acc, struct.pack(">Hhhh", t, 0, 0, 1000)))
+            if t % 10 == 0:
+                frames.append((printf, b"heartbt" if t % 20 else b"ok"))
+        decoder = parsley.decoder()
+        decoded = decoder.decode_all(can.pack_frames(frames))
+        assert decoded == [parsley.parse(*frame) for frame in frames]
+        assert (decoder.hits, decoder.misses) == (98, 2)
+        assert len(decoder.cache) == 2  # none of the timestamped frames
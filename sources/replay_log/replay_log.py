@@ -9,9 +9,7 @@ See python3 main.py --help for options.
 
 import time
 
-import msgpack
-
-from omnibus import Sender, Message
+from omnibus import Sender, Message, wire
 
 
 def wait_for_logtime(msg_timestamp, real_start, log_start, replay_speed):
@@ -26,7 +24,7 @@ def replay(log_buffer, replay_speed):
     """
     Replays the contents of a log_buffer
     """
-    unpacker = msgpack.Unpacker(file_like=log_buffer)
+    unpacker = wire.unpacker(log_buffer)
     real_start = time.time()
     log_start = None
     sender = Sender()
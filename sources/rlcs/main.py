@@ -1,19 +1,20 @@
 import argparse
+import sys
+
 import serial
 
 from omnibus import Sender
+from omnibus.util import Console, LineReader
+from omnibus.util.line_reader import serial_reader
 
 import rlcs
 
 
-def reader(port):
+def reader(port, baud):
+    # read whatever has arrived in one go and split it into lines ourselves, as bytes
     if port == "-":
-        return input
-    s = serial.Serial(port, 115200)  # listen on the RLCS port
-
-    def _reader():
-        return s.readline().strip(b'\r\n').decode('utf-8')
-    return _reader
+        return LineReader(sys.stdin.buffer.read1)
+    return LineReader(serial_reader(serial.Serial(port, baud)))  # listen on the RLCS port
 
 
 def main():
@@ -21,19 +22,31 @@ def main():
     parser.add_argument('port', help='the serial port to read from, or - for stdin')
     parser.add_argument('--solo', action='store_true',
                         help="Don't connect to omnibus - just print to stdout.")
+    parser.add_argument('--baud', type=int, default=115200, help='baud rate of the serial port')
+    parser.add_argument('--output', default='print', choices=['print', 'background', 'summary'],
+                        help='print each message as it is sent, print them from a separate '
+                             'thread so the terminal never slows down sending (dropping lines if '
+                             'it cannot keep up), or show a summary with the latest values')
+    parser.add_argument('--refresh', type=float, default=4,
+                        help='times a second the summary is redrawn')
     args = parser.parse_args()
 
-    readline = reader(args.port)
+    console = None
+    if args.output == 'background':
+        console = Console(rlcs.fmt_line)
+    elif args.output == 'summary':
+        console = Console(rlcs.fmt_line, key=lambda parsed_data: "RLCS", refresh=args.refresh)
+
+    lines = reader(args.port, args.baud)
 
     if not args.solo:
-        sender = Sender()
+        sender = Sender(skip_unsubscribed=True)
         CHANNEL = "CAN/RLCS"
 
-    while True:
-        line = readline()
-
+    for line in lines:
+        line = line.strip()
         if not line:
-            break
+            continue
 
         parsed_data = rlcs.parse_rlcs(line)
 
@@ -43,7 +56,13 @@ def main():
         if not args.solo:  # if connect to omnibus
             sender.send(CHANNEL, parsed_data)
 
-        print(rlcs.fmt_line(parsed_data))
+        if console is None:
+            print(rlcs.fmt_line(parsed_data))
+        else:
+            console.put(parsed_data)
+
+    if console is not None:
+        console.close()
 
 
 if __name__ == '__main__':
@@ -1,17 +1,24 @@
+import binascii
+import re
+import struct
+
 from config_rlcs import MSG_INDEX
 
+# a valid line as bytes, with a four digit hex number for each value, and how to unpack their bytes
+_LINE = re.compile(rb"[Ww]([0-9A-Fa-f]{%d})[Rr]" % (4 * len(MSG_INDEX)))
+_VALUES = struct.Struct(f">{len(MSG_INDEX)}H")
+
 
 def fmt_line(parsed_data):
-    res = ""
-    for k, v in parsed_data.items():
-        res += f"   {k}: {v}"
-    return res
+    return "".join(f"   {k}: {v}" for k, v in parsed_data.items())
 
 
 def parse_rlcs(line):
     '''parses data as well as checks for data validity 
         returns none if data is invalid 
     '''
+    if isinstance(line, bytes):
+        return _parse_rlcs_bytes(line)
     if not check_data_is_valid(line):
         return None
 
@@ -23,6 +30,17 @@ def parse_rlcs(line):
     return res
 
 
+def _parse_rlcs_bytes(line):
+    '''
+    Parses a line read as bytes, converting all the hex digits at once.
+    '''
+    if (match := _LINE.fullmatch(line)) is None:
+        # print why it's invalid
+        check_data_is_valid(line.decode('utf-8', 'replace'))
+        return None
+    return dict(zip(MSG_INDEX, _VALUES.unpack(binascii.unhexlify(match[1]))))
+
+
 def check_data_is_valid(line):
     '''
     Checks whether or not line is valid RLCS data. 
@@ -37,6 +37,20 @@ class TestRLCS:
             is_valid = rlcs.check_data_is_valid(line)
             assert is_valid == answers[i]
 
+    def test_parse_rlcs_bytes(self):
+        line = self.generate_line()
+        assert rlcs.parse_rlcs(line.encode()) == rlcs.parse_rlcs(line)
+        assert rlcs.parse_rlcs(line.lower().encode()) == rlcs.parse_rlcs(line)
+
+    def test_check_rlcs_format_bytes(self):
+        lines = [b"W083e54e49c07998a12f6926bf1b0fc07dR",
+                 b"W83e54e49c07998a12f6926bf1b0fc07dR",
+                 b"W83e54e49r07998a12f6926bf1b0fc07dR",
+                 b"\xff\xfe garbage"]
+        answers = [False, True, False, False]
+        for line, answer in zip(lines, answers):
+            assert (rlcs.parse_rlcs(line) is not None) == answer
+
     def generate_line(self):
         """
             Dummy function to generate a random line of valid RLCS-format input data
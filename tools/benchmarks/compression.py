@@ -0,0 +1,73 @@
+# Report the compression ratio and CPU cost of each codec for typical payloads.
+# Times are for the whole encode and decode of a record, so include msgpack.
+
+import argparse
+import time
+
+import numpy as np
+
+from omnibus import compression, wire
+
+READ_BULK = 200
+CHANNELS = 8
+
+
+def sensor_data():
+    # a 16 bit ADC reading a noisy, slowly changing signal, then linearly calibrated like the NI
+    # source
+    signal = 2000 + np.cumsum(np.random.normal(0, 1, READ_BULK)) + np.random.normal(0, 5, READ_BULK)
+    return np.round(signal) * (10 / 2**15) * 98.1 - 54.9
+
+
+PAYLOADS = {
+    "can": {"msg_type": "SENSOR_ANALOG", "board_id": "SENSOR", "data": {"time": 1234, "value": 5}},
+    "daq random": {
+        "timestamp": 0.0,
+        "data": {f"Fake{i}": np.random.random(READ_BULK) for i in range(CHANNELS)}
+    },
+    "daq sensors": {
+        "timestamp": 0.0,
+        "data": {f"Sensor{i}": sensor_data() for i in range(CHANNELS)}
+    },
+    "daq lists": {
+        "timestamp": 0.0,
+        "data": {f"Sensor{i}": sensor_data().tolist() for i in range(CHANNELS)}
+    },
+}
+
+
+def measure(fn, count, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(count):
+            fn()
+        best = min(best, (time.perf_counter() - start) / count)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=1000, help='messages per measurement')
+    args = parser.parse_args()
+
+    packer = wire.new_packer()
+    codecs = [None] + [compression.get(name) for name in compression.names()]
+    for name, payload in PAYLOADS.items():
+        print(name)
+        uncompressed = len(wire.encode(packer, 0, payload))
+        for codec in codecs:
+            record = wire.encode(packer, 0, payload, codec=codec)
+            frames = [b"CHAN", record]
+            encode = measure(lambda: wire.encode(packer, 0, payload, codec=codec), args.count)
+            decode = measure(lambda: wire.decode(frames), args.count)
+            codec_name = codec.name if codec else "none"
+            if codec and not wire.flags(frames) & wire.FLAG_COMPRESSED:
+                codec_name += " (skipped)"
+            print(f"  {codec_name: <15} {len(record): >7} bytes  "
+                  f"{uncompressed/len(record): >5.2f}x  encode: {encode*1e6: >8.1f} us  "
+                  f"decode: {decode*1e6: >8.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# Compare the per-message cost of the legacy three frame format with the envelope format.
+# Messages are sent through an in-process ZeroMQ socket pair so framing costs are included.
+
+import argparse
+import time
+
+import msgpack
+import zmq
+
+from omnibus import wire
+
+PAYLOADS = {
+    "can": {"msg_type": "SENSOR_ANALOG", "board_id": "SENSOR", "data": {"time": 1234, "value": 5}},
+    "daq": {"timestamp": 0.0, "data": {f"Sensor{i}": [0.5] * 20 for i in range(16)}},
+}
+
+
+def legacy(send, recv):
+    def _legacy(channel, timestamp, payload):
+        send.send_multipart(
+            [channel.encode("utf-8"), msgpack.packb(timestamp), msgpack.packb(payload)])
+        channel, timestamp, payload = recv.recv_multipart()
+        return channel.decode("utf-8"), msgpack.unpackb(timestamp), msgpack.unpackb(payload)
+    return _legacy
+
+
+def envelope(send, recv):
+    packer = wire.new_packer()
+
+    def _envelope(channel, timestamp, payload):
+        send.send_multipart([channel.encode("utf-8"), wire.encode(packer, timestamp, payload)])
+        frames = recv.recv_multipart()
+        return frames[0].decode("utf-8"), wire.decode(frames)
+    return _envelope
+
+
+def measure(fn, payload, count, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(count):
+            fn("CHAN", 1234.5, payload)
+        best = min(best, (time.perf_counter() - start) / count)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=20000, help='messages per measurement')
+    args = parser.parse_args()
+
+    context = zmq.Context()
+    send = context.socket(zmq.PAIR)
+    send.bind("inproc://bench")
+    recv = context.socket(zmq.PAIR)
+    recv.connect("inproc://bench")
+
+    for name, payload in PAYLOADS.items():
+        old = measure(legacy(send, recv), payload, args.count)
+        new = measure(envelope(send, recv), payload, args.count)
+        print(f"{name: <4} legacy: {old*1e6: >6.2f} us/msg  envelope: {new*1e6: >6.2f} us/msg  "
+              f"({(1 - new/old)*100: >4.1f}% less)")
+
+
+if __name__ == "__main__":
+    main()
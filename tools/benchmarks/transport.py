@@ -0,0 +1,88 @@
+# Compare the latency and throughput of TCP and IPC connections on one machine for
+# messages the size of typical DAQ payloads.
+# Messages are packed in the omnibus wire format and echoed by a thread in the same process,
+# so the numbers include ZeroMQ's framing but not the server.
+
+import argparse
+import tempfile
+import threading
+import time
+
+import numpy as np
+import zmq
+
+from omnibus import wire
+
+# FakeNI sends 8 channels of READ_BULK float64 samples per message
+PAYLOADS = {
+    f"{samples} samples": {
+        "timestamp": 0.0,
+        "data": {f"Sensor{i}": np.random.random(samples) for i in range(8)}
+    } for samples in [1, 20, 200, 2000]
+}
+
+
+def echo(context, endpoint):
+    sock = context.socket(zmq.PAIR)
+    sock.bind(endpoint)
+    while (frames := sock.recv_multipart(copy=False))[0].bytes != b"STOP":
+        sock.send_multipart(frames, copy=False)
+    sock.close()
+
+
+def latency(sock, frames, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        sock.send_multipart(frames)
+        sock.recv_multipart()
+    return (time.perf_counter() - start) / count / 2  # one way
+
+
+def throughput(sock, frames, count):
+    # keep up to window messages in flight so the pipe stays full
+    window = 100
+    start = time.perf_counter()
+    for _ in range(window):
+        sock.send_multipart(frames)
+    for _ in range(count - window):
+        sock.recv_multipart()
+        sock.send_multipart(frames)
+    for _ in range(window):
+        sock.recv_multipart()
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=5000, help='messages per measurement')
+    args = parser.parse_args()
+
+    context = zmq.Context()
+    endpoints = {
+        "tcp": "tcp://127.0.0.1:5099",
+        "ipc": f"ipc://{tempfile.gettempdir()}/omnibus-bench",
+    }
+    packer = wire.new_packer()
+
+    for name, payload in PAYLOADS.items():
+        frames = [b"DAQ/Fake", wire.encode(packer, 0.0, payload)]
+        print(f"{name} ({len(frames[1])} bytes)")
+        for transport, endpoint in endpoints.items():
+            thread = threading.Thread(target=echo, args=(context, endpoint))
+            thread.start()
+            sock = context.socket(zmq.PAIR)
+            sock.connect(endpoint)
+
+            latency(sock, frames, 100)  # warm up
+            lat = latency(sock, frames, args.count)
+            rate = throughput(sock, frames, args.count)
+            print(f"  {transport}: {lat*1e6: >7.1f} us latency  {rate: >8.0f} msgs/sec  "
+                  f"{rate*len(frames[1])/2**20: >7.1f} MiB/sec")
+
+            sock.send(b"STOP")
+            thread.join()
+            sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,9 @@ import csv
 from pathlib import Path
 
 import matplotlib.pyplot as plt
-import msgpack
+import numpy as np
+
+from omnibus import wire
 
 # These are the series which are initially plotted in order to determine the range of full data to export
 TIME_IDENTIFICATION_SENSORS = [
@@ -17,13 +19,14 @@ TIME_IDENTIFICATION_SENSORS = [
 
 
 def avg(data):
-    return sum(data) / len(data)
+    # data may be a list or a numpy array depending on the source
+    return np.mean(data)
 
 
 # iterator to yield the data from file-link infile
 def get_data(infile):
     start = None
-    for data in msgpack.Unpacker(infile):
+    for data in wire.unpacker(infile):
         # check if this was a file from the NI source (raw data) or the global log (has msgpack channels too)
         if isinstance(data, list):
             # global log format is a 3-tuple of (channel, timestamp, data)
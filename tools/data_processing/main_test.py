@@ -0,0 +1,59 @@
+import io
+import multiprocessing as mp
+import time
+
+import numpy as np
+import pytest
+
+from omnibus import Receiver, Sender, decimate, server, wire
+
+pytest.importorskip("matplotlib")
+import main  # noqa: E402
+
+SERVER = "127.0.0.1:6675:6676"
+
+
+@pytest.fixture(scope="module")
+def log():
+    """
+    A global log of DAQ data recorded while a sink was also plotting it decimated.
+    """
+    ctx = mp.get_context('spawn')
+    p = ctx.Process(target=server.server, kwargs={"source_port": 6675, "sink_port": 6676})
+    p.start()
+    try:
+        s = Sender(server=SERVER)
+        logger = Receiver("", server=SERVER)  # as sinks/globallog does
+        plot = Receiver(decimate.channel("DAQ", 5), server=SERVER)
+        deadline = time.time() + 5
+        while not s.has_subscribers("DAQ/Fake") and time.time() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.1)  # for the server to subscribe for the virtual channel
+        for i in range(10):
+            s.send("DAQ/Fake", {"timestamp": i, "data": {"Fake": np.full(4, float(i))}})
+            time.sleep(0.02)
+        assert plot.recv(1000) is not None
+
+        f = io.BytesIO()
+        while (msg := logger.recv_message(200)) is not None:
+            f.write(wire.pack_log_entry(msg.channel, msg.timestamp, msg.raw))
+        f.seek(0)
+        yield f
+    finally:
+        p.terminate()
+        p.join()
+
+
+def test_get_data(log):
+    data = list(main.get_data(log))
+    # only the real messages, none of the decimated ones
+    assert [timestamp for _, timestamp in data] == list(range(10))
+    assert [main.avg(d["Fake"]) for d, _ in data] == list(range(10))
+
+
+def test_write_csv(log):
+    out = io.StringIO()
+    main.write_csv(log, out, 0, 9)
+    rows = out.getvalue().splitlines()
+    assert rows[0] == "Timestamp,Fake"
+    assert len(rows) == 11